@@ -0,0 +1,95 @@
+"""
+مخزن مؤقت لتتبع آخر نشاط المستخدمين (write-behind)
+
+بدلاً من UPDATE على جدول المستخدمين لكل طلب HTTP، يُسجَّل آخر وقت نشاط في جدول صغير
+(PendingActivity، صف واحد لكل مستخدم) مرة واحدة كل ACTIVITY_RECORD_INTERVAL ثانية على الأكثر،
+ثم تُكتب كل القيم المتراكمة دفعة واحدة بـ UPDATE ... CASE:
+- دورياً من مهمة Celery (accounts.tasks.flush_user_activity)
+- أو فوراً عند تجاوز عدد المستخدمين المعلّقين ACTIVITY_FLUSH_THRESHOLD
+- أو عند مرور ACTIVITY_FLUSH_INTERVAL ثانية على آخر تفريغ
+
+المخزن في قاعدة البيانات فيراه عامل Celery وكل عمليات الويب، ولا يضيع بإعادة تشغيل العمال
+ولا بإخراج مفاتيح من الذاكرة المؤقتة. الذاكرة المؤقتة تُستخدم فقط لتقليل عدد الكتابات
+(وفقدانها لا يضيع أي نشاط، بل يسبب كتابة إضافية)
+"""
+import functools
+import logging
+import operator
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, DateTimeField, Q, Value, When
+
+logger = logging.getLogger('tickets')
+
+RECORDED_KEY = 'activity_recorded_{user_id}'  # سُجل نشاط المستخدم مؤخراً
+FLUSH_LOCK_KEY = 'activity_flush_lock'
+
+BATCH_SIZE = 500
+
+
+def record_activity(user_id, when):
+    """
+    تسجيل نشاط مستخدم في المخزن المؤقت (upsert واحد)
+    """
+    from .models import PendingActivity
+
+    PendingActivity.objects.bulk_create(
+        [PendingActivity(user_id=user_id, seen_at=when)],
+        update_conflicts=True,
+        unique_fields=['user'],
+        update_fields=['seen_at'],
+    )
+
+
+def note_activity(user_id, when):
+    """
+    تسجيل النشاط مرة واحدة كل ACTIVITY_RECORD_INTERVAL ثانية لكل مستخدم - يعيد True إذا سُجل
+    """
+    interval = getattr(settings, 'ACTIVITY_RECORD_INTERVAL', 30)
+    if not cache.add(RECORDED_KEY.format(user_id=user_id), 1, interval):
+        return False
+    record_activity(user_id, when)
+    return True
+
+
+def pending_count():
+    from .models import PendingActivity
+
+    return PendingActivity.objects.count()
+
+
+def maybe_flush():
+    """
+    تفريغ المخزن إذا تجاوز الحد أو مرّت فترة التفريغ
+    """
+    threshold = getattr(settings, 'ACTIVITY_FLUSH_THRESHOLD', 200)
+    interval = getattr(settings, 'ACTIVITY_FLUSH_INTERVAL', 60)
+    if cache.add(FLUSH_LOCK_KEY, 1, interval) or pending_count() >= threshold:
+        return flush_activity()
+    return 0
+
+
+def flush_activity():
+    """
+    كتابة كل أوقات النشاط المعلّقة إلى قاعدة البيانات بـ UPDATE ... CASE لكل دفعة
+    الصف يُحذف فقط إذا لم يتغير منذ قراءته، فالنشاط المسجل أثناء التفريغ يبقى للتفريغ التالي
+    """
+    from .models import CustomUser, PendingActivity
+
+    items = list(PendingActivity.objects.order_by('pk').values_list('user_id', 'seen_at'))
+    for start in range(0, len(items), BATCH_SIZE):
+        batch = items[start:start + BATCH_SIZE]
+        CustomUser.objects.filter(pk__in=[user_id for user_id, _ in batch]).update(
+            last_activity_at=Case(
+                *[When(pk=user_id, then=Value(when)) for user_id, when in batch],
+                output_field=DateTimeField(),
+            )
+        )
+        PendingActivity.objects.filter(functools.reduce(operator.or_, [
+            Q(user_id=user_id, seen_at=when) for user_id, when in batch
+        ])).delete()
+
+    if items:
+        logger.info(f'Flushed activity for {len(items)} users')
+    return len(items)
@@ -30,9 +30,10 @@ class CustomUserAdmin(UserAdmin):
 
 @admin.register(PenaltyPoints)
 class PenaltyPointsAdmin(admin.ModelAdmin):
-    list_display = ['user', 'department', 'points', 'reason', 'created_at']
-    list_filter = ['created_at', 'department']
+    list_display = ['user', 'department', 'points', 'reason', 'ticket', 'day', 'created_at']
+    list_filter = ['created_at', 'rule', 'department']
     search_fields = ['user__username', 'department__name', 'reason']
+    raw_id_fields = ['ticket']
     date_hierarchy = 'created_at'
 
 
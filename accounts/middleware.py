@@ -1,6 +1,9 @@
 from django.utils import timezone
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
 from django.utils.deprecation import MiddlewareMixin
-from .models import LoginHistory
+from .activity import maybe_flush, note_activity
+from .models import CustomUser, LoginHistory
 
 
 def get_client_ip(request):
@@ -18,26 +21,26 @@ class LoginTrackingMiddleware(MiddlewareMixin):
     Middleware لتتبع دخول المستخدمين وآخر نشاط
     """
     
+    # مفتاح في الجلسة يعني أن دخول هذه الجلسة مسجّل في LoginHistory
+    SESSION_FLAG = '_login_tracked'
+
     def process_request(self, request):
         if request.user.is_authenticated:
-            # تحديث آخر نشاط
-            request.user.last_activity_at = timezone.now()
-            request.user.save(update_fields=['last_activity_at'])
+            now = timezone.now()
             
-            # التحقق من أول دخول
-            if not request.user.first_login_at:
-                request.user.first_login_at = timezone.now()
-                request.user.save(update_fields=['first_login_at'])
+            # تحديث آخر نشاط - يُسجَّل في المخزن المؤقت ويُكتب لاحقاً دفعة واحدة
+            if note_activity(request.user.pk, now):
+                maybe_flush()
             
-            # تسجيل الدخول الجديد إذا لم يكن هناك سجل حديث
+            # تسجيل الدخول الجديد مرة واحدة لكل جلسة
             session_key = request.session.session_key
-            if session_key:
-                # التحقق من وجود سجل دخول نشط لهذه الجلسة
+            if session_key and not request.session.get(self.SESSION_FLAG):
+                # الجلسات السابقة لهذا التغيير قد يكون لها سجل دخول بالفعل
                 recent_login = LoginHistory.objects.filter(
                     user=request.user,
                     session_key=session_key,
                     logout_at__isnull=True
-                ).first()
+                ).exists()
                 
                 if not recent_login:
                     # إنشاء سجل دخول جديد
@@ -48,9 +51,13 @@ class LoginTrackingMiddleware(MiddlewareMixin):
                         session_key=session_key
                     )
                     
-                    # تحديث معلومات الدخول في نموذج المستخدم
-                    request.user.last_login_at = timezone.now()
-                    request.user.login_count += 1
-                    request.user.save(update_fields=['last_login_at', 'login_count'])
+                    # تحديث معلومات الدخول في نموذج المستخدم (تحديث واحد يشمل أول دخول)
+                    CustomUser.objects.filter(pk=request.user.pk).update(
+                        first_login_at=Coalesce('first_login_at', Value(now)),
+                        last_login_at=now,
+                        login_count=F('login_count') + 1,
+                    )
+                
+                request.session[self.SESSION_FLAG] = True
         
         return None
@@ -0,0 +1,34 @@
+# Generated by Django 5.1 on 2026-10-16 23:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('tickets', '0005_ticket_warning_stage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='penaltypoints',
+            name='day',
+            field=models.DateField(blank=True, null=True, verbose_name='اليوم'),
+        ),
+        migrations.AddField(
+            model_name='penaltypoints',
+            name='rule',
+            field=models.CharField(blank=True, choices=[('sla_violation', 'تجاوز المهلة')], max_length=20, verbose_name='القاعدة'),
+        ),
+        migrations.AddField(
+            model_name='penaltypoints',
+            name='ticket',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='penalties', to='tickets.ticket', verbose_name='الطلب'),
+        ),
+        migrations.AddConstraint(
+            model_name='penaltypoints',
+            constraint=models.UniqueConstraint(fields=('ticket', 'rule', 'day'), name='penalty_source_unique'),
+        ),
+    ]
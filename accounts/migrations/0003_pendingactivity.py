@@ -0,0 +1,26 @@
+# Generated by Django 5.1 on 2026-10-17 00:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_penaltypoints_source'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingActivity',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='المستخدم')),
+                ('seen_at', models.DateTimeField(verbose_name='آخر نشاط')),
+            ],
+            options={
+                'verbose_name': 'نشاط بانتظار الكتابة',
+                'verbose_name_plural': 'نشاط بانتظار الكتابة',
+            },
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils import timezone
 
 
 class Department(models.Model):
@@ -61,6 +62,31 @@ class CustomUser(AbstractUser):
     
     def __str__(self):
         return f"{self.get_full_name()} ({self.get_role_display()})"
+
+    # الحقول التي نحتفظ بقيمتها عند التحميل لمعرفة ما تغيّر عند الحفظ
+    TRACKED_FIELDS = ('department_id',)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {
+            name: instance.__dict__.get(name) for name in cls.TRACKED_FIELDS
+        }
+        return instance
+
+    def has_changed(self, field_name):
+        """هل تغيّرت قيمة الحقل منذ تحميل المستخدم من قاعدة البيانات؟"""
+        loaded_values = getattr(self, '_loaded_values', None)
+        if loaded_values is None:
+            return True
+        return loaded_values.get(field_name) != self.__dict__.get(field_name)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # إشارات post_save تعمل داخل super().save() لذا تُحدَّث القيم المحمّلة بعدها
+        self._loaded_values = {
+            name: self.__dict__.get(name) for name in self.TRACKED_FIELDS
+        }
     
     @property
     def is_head(self):
@@ -91,7 +117,13 @@ class CustomUser(AbstractUser):
 class PenaltyPoints(models.Model):
     """
     سجل النقاط السلبية للموظف أو القسم
+    النقاط الناتجة عن طلب تحمل مفتاح مصدر (الطلب، القاعدة، اليوم) فريداً، فلا تُحتسب مرتين
+    مهما تكرر تشغيل المهام أو تسجيل المخالفة يدوياً
     """
+    RULE_CHOICES = [
+        ('sla_violation', 'تجاوز المهلة'),
+    ]
+
     user = models.ForeignKey(
         CustomUser, 
         on_delete=models.CASCADE, 
@@ -110,17 +142,71 @@ class PenaltyPoints(models.Model):
     )
     points = models.IntegerField(default=0, verbose_name="النقاط السلبية")
     reason = models.TextField(verbose_name="السبب")
+    # مفتاح المصدر - فارغ للنقاط اليدوية غير المرتبطة بطلب
+    ticket = models.ForeignKey(
+        'tickets.Ticket',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='penalties',
+        verbose_name="الطلب"
+    )
+    rule = models.CharField(max_length=20, choices=RULE_CHOICES, blank=True, verbose_name="القاعدة")
+    day = models.DateField(null=True, blank=True, verbose_name="اليوم")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="تاريخ الإنشاء")
     
     class Meta:
         verbose_name = "نقطة جزائية"
         verbose_name_plural = "النقاط الجزائية"
         ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['ticket', 'rule', 'day'], name='penalty_source_unique'),
+        ]
     
     def __str__(self):
         target = self.user if self.user else self.department
         return f"{target} - {self.points} نقطة"
 
+    @classmethod
+    def for_ticket(cls, ticket, points, reason, rule='sla_violation', day=None, **targets):
+        """
+        نقاط جزائية غير محفوظة لطلب - الافتراضي: على المعين له وقسمه، ليوم اليوم (بالتوقيت المحلي)
+        """
+        targets.setdefault('user_id', ticket.assigned_to_id)
+        targets.setdefault('department_id', ticket.department_id)
+        return cls(
+            ticket_id=ticket.pk,
+            rule=rule,
+            day=day or timezone.localdate(),
+            points=points,
+            reason=reason,
+            **targets,
+        )
+
+    @classmethod
+    def record(cls, penalties):
+        """
+        حفظ نقاط مرتبطة بمصادر، مرة واحدة لكل (طلب، قاعدة، يوم)
+        يعيد النقاط الجديدة فقط - استعلام قراءة واحد ثم bulk_create(ignore_conflicts=True)
+        الذي يحمي من إدراج متزامن لنفس المصدر
+        """
+        penalties = list(penalties)
+        if not penalties:
+            return []
+        existing = set(cls.objects.filter(
+            ticket_id__in={penalty.ticket_id for penalty in penalties},
+            rule__in={penalty.rule for penalty in penalties},
+            day__in={penalty.day for penalty in penalties},
+        ).values_list('ticket_id', 'rule', 'day'))
+
+        new = {}
+        for penalty in penalties:
+            key = (penalty.ticket_id, penalty.rule, penalty.day)
+            if key not in existing and key not in new:
+                new[key] = penalty
+        cls.objects.bulk_create(new.values(), ignore_conflicts=True)
+        return list(new.values())
+
 
 class LoginHistory(models.Model):
     """
@@ -157,3 +243,25 @@ class LoginHistory(models.Model):
             return self.logout_at - self.login_at
         return None
 
+
+
+class PendingActivity(models.Model):
+    """
+    آخر نشاط لمستخدم لم يُكتب بعد في last_activity_at (المخزن المؤقت في accounts.activity)
+    صف واحد لكل مستخدم يُحدَّث بـ upsert ويُحذف بعد تفريغه
+    """
+    user = models.OneToOneField(
+        CustomUser,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='+',
+        verbose_name="المستخدم"
+    )
+    seen_at = models.DateTimeField(verbose_name="آخر نشاط")
+
+    class Meta:
+        verbose_name = "نشاط بانتظار الكتابة"
+        verbose_name_plural = "نشاط بانتظار الكتابة"
+
+    def __str__(self):
+        return f"{self.user_id} - {self.seen_at}"
@@ -0,0 +1,13 @@
+"""
+مهام Celery الخاصة بالمستخدمين
+"""
+from celery import shared_task
+from .activity import flush_activity
+
+
+@shared_task
+def flush_user_activity():
+    """
+    كتابة أوقات آخر نشاط المتراكمة في المخزن المؤقت إلى قاعدة البيانات
+    """
+    return flush_activity()
@@ -1,3 +1,104 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest.mock import patch
 
-# Create your tests here.
+from django.contrib.sessions.backends.cache import SessionStore
+from django.core.cache import cache
+from django.db.models import QuerySet
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+
+from .activity import flush_activity, note_activity, pending_count, record_activity
+from .middleware import LoginTrackingMiddleware
+from .models import CustomUser, LoginHistory
+
+
+@override_settings(ACTIVITY_FLUSH_THRESHOLD=1000, ACTIVITY_FLUSH_INTERVAL=3600)
+class ActivityBufferTests(TestCase):
+    """المخزن المؤقت لآخر نشاط المستخدمين"""
+
+    def setUp(self):
+        cache.clear()
+        self.users = [
+            CustomUser.objects.create_user(f'user{i}', password='x') for i in range(3)
+        ]
+
+    def test_flush_writes_latest_timestamps_in_one_update(self):
+        earlier = timezone.now() - timedelta(minutes=5)
+        later = timezone.now()
+        record_activity(self.users[0].pk, earlier)
+        record_activity(self.users[0].pk, later)
+        record_activity(self.users[1].pk, earlier)
+        self.assertEqual(pending_count(), 2)
+
+        # قراءة المعلّق + UPDATE ... CASE + حذف الصفوف المكتوبة
+        with self.assertNumQueries(3):
+            self.assertEqual(flush_activity(), 2)
+
+        self.users[0].refresh_from_db()
+        self.users[1].refresh_from_db()
+        self.users[2].refresh_from_db()
+        self.assertEqual(self.users[0].last_activity_at.timestamp(), later.timestamp())
+        self.assertEqual(self.users[1].last_activity_at.timestamp(), earlier.timestamp())
+        self.assertIsNone(self.users[2].last_activity_at)
+        self.assertEqual(pending_count(), 0)
+
+    def test_activity_recorded_during_flush_is_kept(self):
+        earlier = timezone.now() - timedelta(minutes=5)
+        later = timezone.now()
+        user = self.users[0]
+        record_activity(user.pk, earlier)
+
+        original_update = QuerySet.update
+
+        def update_then_record(queryset, **kwargs):
+            # نشاط جديد بين قراءة المخزن وحذف الصفوف المكتوبة
+            result = original_update(queryset, **kwargs)
+            if queryset.model is CustomUser:
+                record_activity(user.pk, later)
+            return result
+
+        with patch.object(QuerySet, 'update', autospec=True, side_effect=update_then_record):
+            self.assertEqual(flush_activity(), 1)
+        user.refresh_from_db()
+        self.assertEqual(user.last_activity_at.timestamp(), earlier.timestamp())
+        self.assertEqual(pending_count(), 1)
+
+        self.assertEqual(flush_activity(), 1)
+        user.refresh_from_db()
+        self.assertEqual(user.last_activity_at.timestamp(), later.timestamp())
+        self.assertEqual(pending_count(), 0)
+
+    @override_settings(ACTIVITY_RECORD_INTERVAL=60)
+    def test_note_activity_writes_once_per_interval(self):
+        now = timezone.now()
+        self.assertTrue(note_activity(self.users[0].pk, now))
+        with self.assertNumQueries(0):
+            self.assertFalse(note_activity(self.users[0].pk, now + timedelta(seconds=5)))
+        self.assertEqual(pending_count(), 1)
+
+    def test_middleware_tracks_login_once_per_session(self):
+        # استهلاك نافذة التفريغ الزمنية حتى لا يحدث تفريغ أثناء الطلبات
+        flush_activity()
+        cache.add('activity_flush_lock', 1, 3600)
+
+        session = SessionStore()
+        session.create()
+        middleware = LoginTrackingMiddleware(lambda request: None)
+        user = self.users[0]
+
+        for _ in range(3):
+            request = RequestFactory().get('/')
+            request.user = user
+            request.session = session
+            middleware.process_request(request)
+
+        self.assertEqual(LoginHistory.objects.filter(user=user).count(), 1)
+        user.refresh_from_db()
+        self.assertEqual(user.login_count, 1)
+        self.assertIsNotNone(user.first_login_at)
+        # آخر نشاط ما زال في المخزن المؤقت
+        self.assertIsNone(user.last_activity_at)
+
+        flush_activity()
+        user.refresh_from_db()
+        self.assertIsNotNone(user.last_activity_at)
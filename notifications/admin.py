@@ -1,6 +1,9 @@
 
 from django.contrib import admin
-from .models import GlobalMail, GlobalMailAttachment, Notification
+from .models import (
+    ArchivedNotification, EmailOutbox, GlobalMail, GlobalMailAttachment, Notification, NotificationPreference,
+    NotificationState,
+)
 class GlobalMailAttachmentInline(admin.TabularInline):
     model = GlobalMailAttachment
     extra = 1
@@ -23,7 +26,7 @@ class GlobalMailAdmin(admin.ModelAdmin):
 
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
-    list_display = ('title', 'user', 'notification_type', 'is_read', 'created_at')
+    list_display = ('title', 'user', 'notification_type', 'occurrences', 'is_read', 'created_at')
     list_filter = ('is_read', 'notification_type', 'created_at')
     search_fields = ('title', 'message', 'user__username', 'user__first_name', 'user__last_name')
     readonly_fields = ('created_at',)
@@ -31,3 +34,34 @@ class NotificationAdmin(admin.ModelAdmin):
     
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('user', 'ticket')
+
+
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('subject', 'last_error')
+    readonly_fields = ('created_at', 'sent_at', 'locked_at', 'last_error')
+    date_hierarchy = 'created_at'
+
+
+@admin.register(NotificationPreference)
+class NotificationPreferenceAdmin(admin.ModelAdmin):
+    list_display = ('user', 'digest_mode', 'last_digest_at')
+    list_filter = ('digest_mode',)
+    search_fields = ('user__username', 'user__first_name', 'user__last_name')
+
+
+@admin.register(NotificationState)
+class NotificationStateAdmin(admin.ModelAdmin):
+    list_display = ('user', 'unread_count', 'updated_at')
+    search_fields = ('user__username', 'user__first_name', 'user__last_name')
+    readonly_fields = ('updated_at',)
+
+
+@admin.register(ArchivedNotification)
+class ArchivedNotificationAdmin(admin.ModelAdmin):
+    list_display = ('title', 'user', 'notification_type', 'created_at', 'archived_at')
+    list_filter = ('notification_type',)
+    search_fields = ('title', 'user__username')
+    date_hierarchy = 'created_at'
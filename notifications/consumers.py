@@ -0,0 +1,54 @@
+"""
+مستهلك WebSocket للإشعارات الفورية
+يستبدل الاستطلاع الدوري لـ /notifications/api/ ولوحة المراقبة
+"""
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from .realtime import role_group, unread_counts, user_group
+
+
+class NotificationConsumer(AsyncJsonWebsocketConsumer):
+
+    async def connect(self):
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close()
+            return
+
+        self.groups_joined = [user_group(user.id)]
+        if user.role:
+            self.groups_joined.append(role_group(user.role))
+        for group in self.groups_joined:
+            await self.channel_layer.group_add(group, self.channel_name)
+
+        await self.accept()
+        # العدد الحالي فور الاتصال حتى لا يحتاج المتصفح لطلب HTTP
+        counts = await database_sync_to_async(unread_counts)([user.id])
+        await self.send_json({'event': 'unread_count', 'count': counts[user.id]})
+
+    async def disconnect(self, code):
+        for group in getattr(self, 'groups_joined', []):
+            await self.channel_layer.group_discard(group, self.channel_name)
+
+    async def receive_json(self, content, **kwargs):
+        # الاتصال للاستقبال فقط، نرد على ping لإبقائه حياً خلف الوكلاء
+        if content.get('event') == 'ping':
+            await self.send_json({'event': 'pong'})
+
+    # ============================================
+    # معالجات أحداث المجموعات (realtime.py)
+    # ============================================
+
+    async def notification_new(self, event):
+        await self.send_json({
+            'event': 'notification',
+            'notifications': event['notifications'],
+            'count': event['count'],
+        })
+
+    async def unread_count(self, event):
+        await self.send_json({'event': 'unread_count', 'count': event['count']})
+
+    async def data_changed(self, event):
+        await self.send_json({'event': 'data_changed', 'name': event['name']})
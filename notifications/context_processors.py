@@ -1,6 +1,8 @@
+from django.utils.functional import SimpleLazyObject
 from .models import GlobalMail
 
 def global_mails(request):
+    # قيمة كسولة: لا تُقرأ الذاكرة المؤقتة إلا إذا استخدم القالب البريد العام فعلاً
     return {
-        'global_mails': GlobalMail.objects.all()[:5]
+        'global_mails': SimpleLazyObject(GlobalMail.get_latest_cached)
     }
@@ -0,0 +1,88 @@
+"""
+ملخص الإشعارات بالبريد (digest)
+
+المستخدم الذي يختار وضع الملخص في NotificationPreference لا يستلم بريداً لكل حدث،
+بل رسالة واحدة كل ساعة أو يوم تضم إشعاراته غير المقروءة منذ آخر ملخص.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.html import strip_tags
+
+from tickets.cache_utils import incr_daily_counter
+from .models import EmailOutbox, Notification, NotificationPreference
+
+logger = logging.getLogger('tickets')
+
+DIGEST_PERIODS = {
+    'hourly': timedelta(hours=1),
+    'daily': timedelta(days=1),
+}
+
+# هامش لتأخر مهمة Celery عن موعدها حتى لا يُؤجَّل الملخص دورة كاملة
+SCHEDULE_TOLERANCE = timedelta(minutes=5)
+
+
+def _is_due(preference, now):
+    period = DIGEST_PERIODS[preference.digest_mode]
+    if preference.digest_mode == 'daily' and timezone.localtime(now).hour != getattr(settings, 'NOTIFICATION_DIGEST_HOUR', 7):
+        return False
+    return preference.last_digest_at is None or preference.last_digest_at <= now - period + SCHEDULE_TOLERANCE
+
+
+def send_digests(now=None):
+    """
+    إضافة ملخصات المستخدمين المستحقين إلى صندوق البريد الصادر
+    يعيد عدد رسائل الملخص - ثلاثة استعلامات مهما كان عدد المستخدمين
+    """
+    now = now or timezone.now()
+    due = [
+        preference for preference in
+        NotificationPreference.objects.exclude(digest_mode='immediate').select_related('user')
+        if _is_due(preference, now)
+    ]
+    if not due:
+        return 0
+
+    since = {
+        preference.user_id: preference.last_digest_at or now - DIGEST_PERIODS[preference.digest_mode]
+        for preference in due
+    }
+    items = {}
+    for notification in Notification.objects.filter(
+        user_id__in=since, is_read=False, updated_at__gt=min(since.values())
+    ).select_related('ticket').order_by('-updated_at'):
+        if notification.updated_at > since[notification.user_id]:
+            items.setdefault(notification.user_id, []).append(notification)
+
+    from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@university.edu')
+    messages = []
+    for preference in due:
+        user = preference.user
+        notifications = items.get(user.pk)
+        if not notifications or not user.email:
+            continue
+        html_body = render_to_string('emails/notification_digest.html', {
+            'user': user,
+            'notifications': notifications,
+            'digest_mode': preference.get_digest_mode_display(),
+            'site_url': 'http://localhost:8000',  # يجب تغييره في الإنتاج
+        })
+        messages.append(EmailOutbox(
+            subject=f'🔔 ملخص الإشعارات - {len(notifications)} إشعار جديد',
+            body=strip_tags(html_body),
+            html_body=html_body,
+            from_email=from_email,
+            recipients=[user.email],
+        ))
+
+    EmailOutbox.objects.bulk_create(messages)
+    NotificationPreference.objects.filter(pk__in=[preference.pk for preference in due]).update(last_digest_at=now)
+
+    if messages:
+        incr_daily_counter('digest_emails_sent', len(messages))
+    logger.info(f'Notification digests queued: {len(messages)} of {len(due)} due users')
+    return len(messages)
@@ -0,0 +1,269 @@
+"""
+إرسال الإشعارات لعدد كبير من المستخدمين (fan-out)
+
+- المستلمون يُحددون باستعلام واحد بدلاً من استعلام لكل قسم
+- الإشعارات تُكتب بـ bulk_create على دفعات (NOTIFICATION_FANOUT_BATCH_SIZE)
+- عند تجاوز NOTIFICATION_FANOUT_ASYNC_THRESHOLD مستلماً يُنقل الإرسال إلى مهمة Celery
+  بعد تثبيت المعاملة، فلا يتحمل الطلب الذي أنشأ التذكرة كلفة مئات عمليات الإدراج
+- الأحداث المتكررة لنفس (المستخدم، الطلب، النوع) خلال NOTIFICATION_COALESCE_WINDOW ثانية
+  تُدمج في الإشعار غير المقروء الموجود (عدّاد + آخر منفذ) بدلاً من صف جديد
+"""
+import logging
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import realtime
+
+logger = logging.getLogger('tickets')
+
+UPPER_MANAGEMENT_ROLES = realtime.UPPER_MANAGEMENT_ROLES
+DEPARTMENT_MEMBER_ROLES = ['employee', 'head']
+
+
+def ticket_recipient_ids(ticket):
+    """
+    معرفات جميع المستخدمين المعينين للطلب - استعلام واحد
+    يشمل: المعين المباشر، المعينين المتعددين، الموظفين ورؤساء الأقسام المعنية
+    """
+    from accounts.models import CustomUser
+
+    condition = (
+        Q(multi_assigned_tickets=ticket) |
+        Q(department__multi_tickets=ticket, role__in=DEPARTMENT_MEMBER_ROLES)
+    )
+    if ticket.assigned_to_id:
+        condition |= Q(pk=ticket.assigned_to_id)
+    return set(CustomUser.objects.filter(condition).values_list('pk', flat=True))
+
+
+def role_user_ids(roles, **filters):
+    """
+    معرفات المستخدمين حسب الدور (مثل الإدارة العليا أو العمداء)
+    """
+    from accounts.models import CustomUser
+
+    return set(CustomUser.objects.filter(role__in=roles, **filters).values_list('pk', flat=True))
+
+
+class RoleDirectory:
+    """
+    مستخدمو أدوار التصعيد (رؤساء الأقسام المعنية، العمداء، رئاسة الجامعة، الإدارة العليا)
+    يُحمّلون باستعلام واحد ثم يُستخدمون لمجموعة كاملة من الطلبات
+    """
+    ROLES = ['dean', 'president', *UPPER_MANAGEMENT_ROLES]
+
+    def __init__(self, department_ids=()):
+        from accounts.models import CustomUser
+
+        self.by_role = defaultdict(set)
+        self.heads = defaultdict(set)
+        self.emails = {}
+        department_ids = {department_id for department_id in department_ids if department_id}
+        for pk, role, department_id, email in CustomUser.objects.filter(
+            Q(role__in=self.ROLES) | Q(role='head', department_id__in=department_ids)
+        ).values_list('pk', 'role', 'department_id', 'email'):
+            self.by_role[role].add(pk)
+            if role == 'head':
+                self.heads[department_id].add(pk)
+            self.emails[pk] = email
+
+    def role(self, *roles):
+        return set().union(*(self.by_role[role] for role in roles))
+
+    def escalation_targets(self, ticket):
+        """مستلمو المستوى الحالي لتصعيد الطلب"""
+        if ticket.escalation_level == 'head':
+            return set(self.heads[ticket.department_id])
+        if ticket.escalation_level in ('dean', 'president'):
+            return self.role(ticket.escalation_level)
+        return set()
+
+
+def escalation_messages(ticket, directory):
+    """
+    إشعارات تصعيد الطلب: (المستلمون، العنوان، النص) للمستوى الأعلى ثم للإدارة العليا دائماً
+    """
+    messages = []
+    targets = directory.escalation_targets(ticket)
+    if ticket.escalation_level == 'head' and ticket.department_id:
+        # إشعار لرئيس القسم
+        messages.append((
+            targets,
+            '⬆️ طلب تم تصعيده',
+            f'تم تصعيد الطلب "{ticket.title}" إليك بسبب التأخير',
+        ))
+    elif ticket.escalation_level in ['dean', 'president']:
+        # إشعار للعميد أو رئيس الجامعة
+        messages.append((
+            targets,
+            '⚠️ تصعيد عاجل',
+            f'تم تصعيد الطلب الحرج "{ticket.title}" إليك - تأخير {ticket.hours_delayed:.1f} ساعة',
+        ))
+    messages.append((
+        directory.role(*UPPER_MANAGEMENT_ROLES),
+        '📊 تصعيد طلب',
+        f'تم تصعيد الطلب "{ticket.title}" إلى مستوى: {ticket.get_escalation_level_display()}',
+    ))
+    return messages
+
+
+def fan_out(user_ids, notification_type, title, message, ticket=None, exclude=(), actor=None):
+    """
+    إنشاء نفس الإشعار لمجموعة مستخدمين
+    يعيد عدد الإشعارات المنشأة أو المدمجة (أو المجدولة في Celery)
+    """
+    user_ids = sorted({user_id for user_id in user_ids if user_id} - {user_id for user_id in exclude if user_id})
+    if not user_ids:
+        return 0
+
+    ticket_id = ticket.pk if ticket is not None else None
+    actor_id = actor.pk if actor is not None else None
+    if len(user_ids) >= getattr(settings, 'NOTIFICATION_FANOUT_ASYNC_THRESHOLD', 100):
+        from .tasks import fan_out_notifications
+
+        transaction.on_commit(lambda: fan_out_notifications.delay(
+            user_ids, notification_type, title, message, ticket_id, actor_id
+        ))
+        logger.info(f'Fan-out {notification_type}: {len(user_ids)} recipients queued to Celery')
+        return len(user_ids)
+
+    return create_notifications(user_ids, notification_type, title, message, ticket_id, actor_id)
+
+
+def _coalesce(user_ids, notification_type, title, message, ticket_id, actor_id, now):
+    """
+    دمج الحدث في الإشعارات غير المقروءة الحديثة لنفس الطلب والنوع
+    يعيد الإشعارات المدمجة (بعد التحديث) - استعلامان مهما كان عدد المستخدمين
+    """
+    from .models import Notification
+
+    window = getattr(settings, 'NOTIFICATION_COALESCE_WINDOW', 0)
+    if not window or ticket_id is None:
+        return []
+
+    recent = {}
+    for notification in Notification.objects.filter(
+        user_id__in=user_ids,
+        ticket_id=ticket_id,
+        notification_type=notification_type,
+        is_read=False,
+        updated_at__gte=now - timedelta(seconds=window),
+    ).order_by('updated_at'):
+        # الأحدث لكل مستخدم
+        recent[notification.user_id] = notification
+    if not recent:
+        return []
+
+    Notification.objects.filter(pk__in=[n.pk for n in recent.values()]).update(
+        occurrences=F('occurrences') + 1,
+        title=title,
+        message=message,
+        last_actor_id=actor_id,
+        updated_at=now,
+    )
+    for notification in recent.values():
+        notification.occurrences += 1
+        notification.title = title
+        notification.message = message
+        notification.last_actor_id = actor_id
+        notification.updated_at = now
+    return list(recent.values())
+
+
+def create_notifications(user_ids, notification_type, title, message, ticket_id=None, actor_id=None):
+    """
+    الكتابة الفعلية: دمج ما يمكن دمجه، ثم bulk_create للباقي على دفعات، ثم الدفع الفوري بعد تثبيت المعاملة
+    """
+    from tickets.cache_utils import incr_counter, incr_daily_counter
+    from .models import Notification, NotificationState
+
+    started = time.monotonic()
+    now = timezone.now()
+    coalesced = _coalesce(user_ids, notification_type, title, message, ticket_id, actor_id, now)
+    merged_users = {notification.user_id for notification in coalesced}
+    user_ids = [user_id for user_id in user_ids if user_id not in merged_users]
+
+    batch_size = getattr(settings, 'NOTIFICATION_FANOUT_BATCH_SIZE', 500)
+    created = []
+    for start in range(0, len(user_ids), batch_size):
+        created.extend(Notification.objects.bulk_create([
+            Notification(
+                user_id=user_id,
+                notification_type=notification_type,
+                title=title,
+                message=message,
+                ticket_id=ticket_id,
+                last_actor_id=actor_id,
+                updated_at=now,
+            )
+            for user_id in user_ids[start:start + batch_size]
+        ]))
+
+    # bulk_create لا يطلق post_save، لذا يُحدَّث العدّاد ويتم الدفع هنا
+    NotificationState.add([notification.user_id for notification in created], 1)
+    realtime.on_commit(realtime.push_notifications, created + coalesced)
+
+    elapsed_ms = int((time.monotonic() - started) * 1000)
+    incr_counter('notification_fanout_rows', len(created))
+    incr_counter('notification_fanout_ms', elapsed_ms)
+    if coalesced:
+        incr_daily_counter('notification_rows_saved', len(coalesced))
+    logger.info(
+        f'Fan-out {notification_type}: {len(created)} notifications, '
+        f'{len(coalesced)} coalesced in {elapsed_ms}ms'
+    )
+    return len(created) + len(coalesced)
+
+
+def create_notification_batch(entries, notification_type):
+    """
+    إشعارات مختلفة لعدة طلبات دفعة واحدة (مثل تصعيدات محرك SLA)
+    entries: قائمة (المستلمون، العنوان، النص، معرف الطلب، معرف المنفذ)
+    لا دمج هنا: كل إدخال حدث مستقل لطلب مختلف، فيُكتب الكل بـ bulk_create على دفعات
+    """
+    from tickets.cache_utils import incr_counter
+    from .models import Notification, NotificationState
+
+    started = time.monotonic()
+    now = timezone.now()
+    rows = [
+        Notification(
+            user_id=user_id,
+            notification_type=notification_type,
+            title=title,
+            message=message,
+            ticket_id=ticket_id,
+            last_actor_id=actor_id,
+            updated_at=now,
+        )
+        for user_ids, title, message, ticket_id, actor_id in entries
+        for user_id in sorted({user_id for user_id in user_ids if user_id})
+    ]
+    batch_size = getattr(settings, 'NOTIFICATION_FANOUT_BATCH_SIZE', 500)
+    created = []
+    for start in range(0, len(rows), batch_size):
+        created.extend(Notification.objects.bulk_create(rows[start:start + batch_size]))
+
+    # تحديث عدّاد غير المقروء: UPDATE واحد لكل قيمة زيادة مختلفة
+    per_user = Counter(notification.user_id for notification in created)
+    by_delta = defaultdict(list)
+    for user_id, delta in per_user.items():
+        by_delta[delta].append(user_id)
+    for delta, user_ids in by_delta.items():
+        NotificationState.add(user_ids, delta)
+    realtime.on_commit(realtime.push_notifications, created)
+
+    elapsed_ms = int((time.monotonic() - started) * 1000)
+    incr_counter('notification_fanout_rows', len(created))
+    incr_counter('notification_fanout_ms', elapsed_ms)
+    logger.info(
+        f'Batch {notification_type}: {len(created)} notifications for '
+        f'{len(entries)} events in {elapsed_ms}ms'
+    )
+    return len(created)
@@ -0,0 +1,37 @@
+"""
+أرشفة الإشعارات المقروءة القديمة وتقليم الأرشيف حسب سياسة الاحتفاظ
+(نفس ما تفعله مهمة Celery اليومية prune_notifications)
+"""
+from django.core.management.base import BaseCommand
+
+from notifications.retention import archive_notifications, prune_archive, retention_days
+
+
+class Command(BaseCommand):
+    help = 'أرشفة الإشعارات المقروءة المنتهية مدتها وتقليم الأرشيف'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='عرض الأعداد فقط دون نقل أو حذف',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='عدد الإشعارات في كل دفعة (الافتراضي NOTIFICATION_ARCHIVE_BATCH_SIZE)',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        days = retention_days()
+        results = archive_notifications(batch_size=options['batch_size'], dry_run=dry_run)
+
+        for notification_type, count in results.items():
+            self.stdout.write(f'  • {notification_type} (> {days[notification_type]} يوم): {count}')
+
+        pruned = prune_archive(batch_size=options['batch_size'], dry_run=dry_run)
+        verb = 'سيتم' if dry_run else 'تم'
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {verb} أرشفة {sum(results.values())} إشعار وحذف {pruned} من الأرشيف'
+        ))
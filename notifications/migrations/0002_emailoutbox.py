@@ -0,0 +1,38 @@
+# Generated by Django 5.1 on 2026-10-16 22:50
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=255, verbose_name='الموضوع')),
+                ('body', models.TextField(verbose_name='النص')),
+                ('html_body', models.TextField(blank=True, verbose_name='نص HTML')),
+                ('from_email', models.CharField(max_length=254, verbose_name='المرسل')),
+                ('recipients', models.JSONField(default=list, verbose_name='المستلمون')),
+                ('status', models.CharField(choices=[('pending', 'بانتظار الإرسال'), ('sending', 'قيد الإرسال'), ('sent', 'تم الإرسال'), ('dead', 'فشل نهائي')], default='pending', max_length=10, verbose_name='الحالة')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='عدد المحاولات')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='المحاولة التالية')),
+                ('locked_at', models.DateTimeField(blank=True, null=True, verbose_name='بداية الإرسال')),
+                ('last_error', models.TextField(blank=True, verbose_name='آخر خطأ')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='تاريخ الإنشاء')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='تاريخ الإرسال')),
+            ],
+            options={
+                'verbose_name': 'بريد صادر',
+                'verbose_name_plural': 'البريد الصادر',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='outbox_status_next_idx')],
+            },
+        ),
+    ]
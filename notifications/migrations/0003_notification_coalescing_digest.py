@@ -0,0 +1,52 @@
+# Generated by Django 5.1 on 2026-10-16 22:52
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def copy_created_at(apps, schema_editor):
+    Notification = apps.get_model('notifications', 'Notification')
+    Notification.objects.update(updated_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0002_emailoutbox'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='last_actor',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='آخر منفذ'),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='occurrences',
+            field=models.PositiveIntegerField(default=1, verbose_name='عدد التكرارات'),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='updated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='آخر حدث'),
+        ),
+        migrations.CreateModel(
+            name='NotificationPreference',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest_mode', models.CharField(choices=[('immediate', 'فوري (بريد لكل حدث)'), ('hourly', 'ملخص كل ساعة'), ('daily', 'ملخص يومي')], default='immediate', max_length=10, verbose_name='وضع البريد')),
+                ('last_digest_at', models.DateTimeField(blank=True, null=True, verbose_name='آخر ملخص')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='notification_preference', to=settings.AUTH_USER_MODEL, verbose_name='المستخدم')),
+            ],
+            options={
+                'verbose_name': 'تفضيلات الإشعارات',
+                'verbose_name_plural': 'تفضيلات الإشعارات',
+            },
+        ),
+        migrations.RunPython(copy_created_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1 on 2026-10-16 22:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('notifications', '0003_notification_coalescing_digest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationState',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='notification_state', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='المستخدم')),
+                ('unread_count', models.IntegerField(default=0, verbose_name='غير المقروءة')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='آخر تحديث')),
+            ],
+            options={
+                'verbose_name': 'عدّاد الإشعارات',
+                'verbose_name_plural': 'عدّادات الإشعارات',
+            },
+        ),
+    ]
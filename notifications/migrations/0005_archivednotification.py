@@ -0,0 +1,36 @@
+# Generated by Django 5.1 on 2026-10-16 22:57
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0004_notificationstate'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedNotification',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('notification_type', models.CharField(choices=[('new_ticket', 'طلب جديد'), ('ticket_assigned', 'تم التعيين'), ('ticket_acknowledged', 'تم التأكيد'), ('ticket_escalated', 'تم التصعيد'), ('deadline_approaching', 'اقتراب الموعد'), ('ticket_commented', 'تعليق جديد'), ('ticket_closed', 'تم الإغلاق'), ('ticket_violated', 'تجاوز المهلة')], max_length=20, verbose_name='نوع الإشعار')),
+                ('title', models.CharField(max_length=200, verbose_name='العنوان')),
+                ('message', models.TextField(verbose_name='الرسالة')),
+                ('ticket_id', models.BigIntegerField(blank=True, null=True, verbose_name='الطلب')),
+                ('occurrences', models.PositiveIntegerField(default=1, verbose_name='عدد التكرارات')),
+                ('created_at', models.DateTimeField(verbose_name='تاريخ الإنشاء')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='تاريخ الأرشفة')),
+                ('user', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='archived_notifications', to=settings.AUTH_USER_MODEL, verbose_name='المستخدم')),
+            ],
+            options={
+                'verbose_name': 'إشعار مؤرشف',
+                'verbose_name_plural': 'الإشعارات المؤرشفة',
+                'ordering': ['-id'],
+                'indexes': [models.Index(fields=['user', '-id'], name='archived_user_id_idx'), models.Index(fields=['created_at'], name='archived_created_idx')],
+            },
+        ),
+    ]
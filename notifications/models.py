@@ -1,7 +1,12 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Greatest
+from django.core.cache import cache
 from django.utils import timezone
 from django.conf import settings
 from datetime import timedelta
+import time
+
+from . import realtime
 
 class GlobalMail(models.Model):
     MAIL_TYPES = [
@@ -26,6 +31,41 @@ class GlobalMail(models.Model):
     def __str__(self):
         return self.title
 
+    # نسخة ذاكرة البريد العام - تُزاد عند أي تعديل فتصبح النسخة القديمة غير مستخدمة
+    CACHE_VERSION_KEY = 'global_mails_version'
+    CACHE_KEY = 'global_mails_latest_v{version}_{limit}'
+    CACHE_TIMEOUT = 3600
+
+    @classmethod
+    def get_latest_cached(cls, limit=5):
+        """
+        أحدث البريد العام مع مرفقاته من الذاكرة المؤقتة
+        """
+        version = cache.get_or_set(cls.CACHE_VERSION_KEY, cls._seed_version, None)
+        key = cls.CACHE_KEY.format(version=version, limit=limit)
+        mails = cache.get(key)
+        if mails is None:
+            # المرفقات محمّلة مسبقاً فتُحفظ مع البريد ولا يستعلم القالب عنها
+            mails = list(cls.objects.prefetch_related('attachments')[:limit])
+            cache.set(key, mails, cls.CACHE_TIMEOUT)
+        return mails
+
+    @classmethod
+    def invalidate_cache(cls):
+        """
+        إبطال ذاكرة البريد العام (بزيادة رقم النسخة)
+        """
+        try:
+            cache.incr(cls.CACHE_VERSION_KEY)
+        except ValueError:
+            cache.set(cls.CACHE_VERSION_KEY, cls._seed_version(), None)
+
+    @staticmethod
+    def _seed_version():
+        # رقم نسخة متزايد مع الزمن: إن حُذف مفتاح النسخة وحده من الذاكرة
+        # فلن يعود لرقم قديم ما زالت نسخته المحفوظة موجودة
+        return time.time_ns()
+
 class GlobalMailAttachment(models.Model):
     mail = models.ForeignKey(GlobalMail, on_delete=models.CASCADE, related_name='attachments')
     file = models.FileField(upload_to='global_mail_attachments/', verbose_name='مرفق (صورة أو PDF أو فيديو)')
@@ -72,6 +112,18 @@ class Notification(models.Model):
     is_read = models.BooleanField(default=False, verbose_name='مقروء')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='تاريخ الإنشاء')
     
+    # دمج الأحداث المتكررة (نفس المستخدم والطلب والنوع) في صف واحد
+    occurrences = models.PositiveIntegerField(default=1, verbose_name='عدد التكرارات')
+    last_actor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='آخر منفذ'
+    )
+    updated_at = models.DateTimeField(default=timezone.now, verbose_name='آخر حدث')
+    
     class Meta:
         verbose_name = 'إشعار'
         verbose_name_plural = 'الإشعارات'
@@ -105,11 +157,272 @@ class Notification(models.Model):
         notifications = cls.objects.filter(user=user, is_read=False)
         if notification_ids:
             notifications = notifications.filter(id__in=notification_ids)
-        return notifications.update(is_read=True)
+        updated = notifications.update(is_read=True)
+        if updated:
+            NotificationState.add([user.pk], -updated)
+            # تحديث العدّاد في كل التبويبات المفتوحة للمستخدم
+            realtime.on_commit(realtime.push_unread_counts, [user.pk])
+        return updated
     
     @classmethod
     def get_unread_count(cls, user):
         """
-        عدد الإشعارات غير المقروءة
+        عدد الإشعارات غير المقروءة (من NotificationState - بحث بالمفتاح الأساسي)
+        """
+        return NotificationState.get_count(user.pk)
+
+
+class ArchivedNotification(models.Model):
+    """
+    أرشيف الإشعارات المقروءة القديمة (تنقلها مهمة الاحتفاظ من جدول الإشعارات)
+    جدول مضغوط بلا مفاتيح أجنبية للطلبات، ويبقى قابلاً للتصفح من صفحة الإشعارات
+    المعرّف هو نفس معرّف الإشعار الأصلي فيُستخدم كمؤشر للتصفح (الأقدم)
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='archived_notifications',
+        db_constraint=False,
+        verbose_name='المستخدم'
+    )
+    notification_type = models.CharField(
+        max_length=20,
+        choices=Notification.NOTIFICATION_TYPES,
+        verbose_name='نوع الإشعار'
+    )
+    title = models.CharField(max_length=200, verbose_name='العنوان')
+    message = models.TextField(verbose_name='الرسالة')
+    ticket_id = models.BigIntegerField(null=True, blank=True, verbose_name='الطلب')
+    occurrences = models.PositiveIntegerField(default=1, verbose_name='عدد التكرارات')
+    created_at = models.DateTimeField(verbose_name='تاريخ الإنشاء')
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name='تاريخ الأرشفة')
+
+    ARCHIVED_FIELDS = ('id', 'user_id', 'notification_type', 'title', 'message', 'ticket_id', 'occurrences', 'created_at')
+
+    class Meta:
+        verbose_name = 'إشعار مؤرشف'
+        verbose_name_plural = 'الإشعارات المؤرشفة'
+        ordering = ['-id']
+        indexes = [
+            models.Index(fields=['user', '-id'], name='archived_user_id_idx'),
+            models.Index(fields=['created_at'], name='archived_created_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.title} ({self.created_at:%Y-%m-%d})'
+
+
+class NotificationState(models.Model):
+    """
+    عدّاد الإشعارات غير المقروءة لكل مستخدم (قيمة مخزنة بدلاً من COUNT في كل استطلاع)
+    يُحدَّث ذرياً عند الإنشاء والقراءة والحذف، وتصحح مهمة دورية أي انحراف
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='notification_state',
+        verbose_name='المستخدم'
+    )
+    unread_count = models.IntegerField(default=0, verbose_name='غير المقروءة')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='آخر تحديث')
+
+    class Meta:
+        verbose_name = 'عدّاد الإشعارات'
+        verbose_name_plural = 'عدّادات الإشعارات'
+
+    def __str__(self):
+        return f'{self.user_id}: {self.unread_count}'
+
+    @staticmethod
+    def count_unread(user_ids):
+        """العدد الفعلي من جدول الإشعارات - استعلام GROUP BY واحد"""
+        counts = dict(
+            Notification.objects.filter(user_id__in=user_ids, is_read=False)
+            .order_by().values_list('user_id').annotate(total=models.Count('id'))
+        )
+        return {user_id: counts.get(user_id, 0) for user_id in user_ids}
+
+    @classmethod
+    def get_counts(cls, user_ids):
+        """
+        أعداد غير المقروء لمجموعة مستخدمين؛ من ليس له عدّاد بعد يُحسب ويُنشأ عدّاده
+        """
+        user_ids = list(user_ids)
+        counts = dict(cls.objects.filter(pk__in=user_ids).values_list('pk', 'unread_count'))
+        missing = [user_id for user_id in user_ids if user_id not in counts]
+        if missing:
+            actual = cls.count_unread(missing)
+            cls.objects.bulk_create(
+                [cls(user_id=user_id, unread_count=count) for user_id, count in actual.items()],
+                ignore_conflicts=True,
+            )
+            counts.update(actual)
+        return {user_id: max(counts[user_id], 0) for user_id in user_ids}
+
+    @classmethod
+    def get_count(cls, user_id):
+        return cls.get_counts([user_id])[user_id]
+
+    @classmethod
+    def add(cls, user_ids, delta):
+        """
+        تعديل ذري للعدّاد (UPDATE ... SET unread_count = unread_count + delta)
+        المستخدمون بلا عدّاد يُنشأ لهم من العدد الفعلي (الذي يشمل التغيير الحالي)
+        """
+        user_ids = set(user_ids)
+        if not user_ids or not delta:
+            return
+        existing = set(cls.objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+        if existing:
+            cls.objects.filter(pk__in=existing).update(
+                unread_count=Greatest(models.F('unread_count') + delta, 0),
+                updated_at=timezone.now(),
+            )
+        if user_ids - existing:
+            cls.get_counts(user_ids - existing)
+
+    @classmethod
+    def reconcile(cls, batch_size=1000):
+        """
+        مطابقة العدّادات مع جدول الإشعارات وتصحيح أي انحراف - يعيد عدد العدّادات المصححة
+        """
+        fixed = 0
+        ids = list(cls.objects.order_by('pk').values_list('pk', flat=True))
+        for start in range(0, len(ids), batch_size):
+            chunk = ids[start:start + batch_size]
+            actual = cls.count_unread(chunk)
+            stale = [
+                cls(user_id=user_id, unread_count=actual[user_id], updated_at=timezone.now())
+                for user_id, count in cls.objects.filter(pk__in=chunk).values_list('pk', 'unread_count')
+                if count != actual[user_id]
+            ]
+            cls.objects.bulk_update(stale, ['unread_count', 'updated_at'])
+            fixed += len(stale)
+
+        # مستخدمون لديهم إشعارات غير مقروءة ولا عدّاد لهم
+        missing = (
+            Notification.objects.filter(is_read=False).exclude(user_id__in=cls.objects.values('pk'))
+            .order_by().values_list('user_id', flat=True).distinct()
+        )
+        missing = list(missing)
+        if missing:
+            cls.get_counts(missing)
+            fixed += len(missing)
+        return fixed
+
+
+class EmailOutbox(models.Model):
+    """
+    صندوق البريد الصادر
+    الرسائل تُحفظ هنا بعد تثبيت المعاملة، ويرسلها عامل Celery على دفعات عبر اتصال SMTP واحد
+    فلا يتأخر إنشاء الطلب أو التعليق بسبب بطء خادم البريد
+    """
+    STATUS_CHOICES = [
+        ('pending', 'بانتظار الإرسال'),
+        ('sending', 'قيد الإرسال'),
+        ('sent', 'تم الإرسال'),
+        ('dead', 'فشل نهائي'),
+    ]
+
+    subject = models.CharField(max_length=255, verbose_name='الموضوع')
+    body = models.TextField(verbose_name='النص')
+    html_body = models.TextField(blank=True, verbose_name='نص HTML')
+    from_email = models.CharField(max_length=254, verbose_name='المرسل')
+    recipients = models.JSONField(default=list, verbose_name='المستلمون')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending', verbose_name='الحالة')
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='عدد المحاولات')
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name='المحاولة التالية')
+    locked_at = models.DateTimeField(null=True, blank=True, verbose_name='بداية الإرسال')
+    last_error = models.TextField(blank=True, verbose_name='آخر خطأ')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='تاريخ الإنشاء')
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name='تاريخ الإرسال')
+
+    class Meta:
+        verbose_name = 'بريد صادر'
+        verbose_name_plural = 'البريد الصادر'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_status_next_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.subject} ({self.get_status_display()})'
+
+    @classmethod
+    def build(cls, subject, body, recipients, html_body='', from_email=None, separately=False):
+        """
+        تجهيز رسائل الصندوق دون حفظها (للإضافة المجمّعة عبر enqueue_many)
+        separately=True: رسالة مستقلة لكل مستلم (لا يرى المستلمون بعضهم)
         """
-        return cls.objects.filter(user=user, is_read=False).count()
+        recipients = list(dict.fromkeys(email for email in recipients if email))
+        if not recipients:
+            return []
+        from_email = from_email or getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@university.edu')
+        groups = [[email] for email in recipients] if separately else [recipients]
+        return [
+            cls(subject=subject[:255], body=body, html_body=html_body,
+                from_email=from_email, recipients=group)
+            for group in groups
+        ]
+
+    @classmethod
+    def enqueue_many(cls, messages):
+        """
+        حفظ رسائل مجهزة مسبقاً بـ bulk_create واحد بعد تثبيت المعاملة الحالية
+        """
+        messages = list(messages)
+        if messages:
+            transaction.on_commit(lambda: cls.objects.bulk_create(messages))
+
+    @classmethod
+    def enqueue(cls, subject, body, recipients, html_body='', from_email=None, separately=False):
+        """
+        إضافة رسالة إلى الصندوق بعد تثبيت المعاملة الحالية
+        separately=True: رسالة مستقلة لكل مستلم (لا يرى المستلمون بعضهم)
+        """
+        cls.enqueue_many(cls.build(subject, body, recipients, html_body, from_email, separately))
+
+
+class NotificationPreference(models.Model):
+    """
+    تفضيلات الإشعارات للمستخدم
+    وضع الملخص: بريد واحد كل ساعة أو يوم بالإشعارات غير المقروءة بدلاً من بريد لكل حدث
+    """
+    DIGEST_CHOICES = [
+        ('immediate', 'فوري (بريد لكل حدث)'),
+        ('hourly', 'ملخص كل ساعة'),
+        ('daily', 'ملخص يومي'),
+    ]
+
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='notification_preference',
+        verbose_name='المستخدم'
+    )
+    digest_mode = models.CharField(
+        max_length=10,
+        choices=DIGEST_CHOICES,
+        default='immediate',
+        verbose_name='وضع البريد'
+    )
+    last_digest_at = models.DateTimeField(null=True, blank=True, verbose_name='آخر ملخص')
+
+    class Meta:
+        verbose_name = 'تفضيلات الإشعارات'
+        verbose_name_plural = 'تفضيلات الإشعارات'
+
+    def __str__(self):
+        return f'{self.user} - {self.get_digest_mode_display()}'
+
+    @classmethod
+    def digest_user_ids(cls, user_ids):
+        """
+        من بين المستخدمين المعطين: من اختار وضع الملخص (لا يُرسل لهم بريد فوري)
+        """
+        return set(
+            cls.objects.filter(user_id__in=user_ids).exclude(digest_mode='immediate')
+            .values_list('user_id', flat=True)
+        )
@@ -0,0 +1,102 @@
+"""
+إرسال رسائل صندوق البريد الصادر (EmailOutbox)
+
+- كل دفعة تُرسل عبر اتصال SMTP واحد (get_connection) بدلاً من اتصال لكل رسالة
+- الرسالة الفاشلة يُعاد جدولتها بتأخير متضاعف (EMAIL_OUTBOX_RETRY_BACKOFF × 2^المحاولات)
+- بعد EMAIL_OUTBOX_MAX_ATTEMPTS محاولة تُنقل إلى الحالة "dead" لمراجعتها يدوياً
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.utils import timezone
+
+from .models import EmailOutbox
+
+logger = logging.getLogger('tickets')
+
+# رسائل "قيد الإرسال" منذ أكثر من هذه المدة تعود للانتظار (توقف العامل أثناء الإرسال)
+STALE_LOCK = timedelta(minutes=10)
+
+
+def _claim(now, batch_size):
+    """
+    حجز دفعة من الرسائل المستحقة حتى لا يرسلها عاملان معاً
+    """
+    EmailOutbox.objects.filter(status='sending', locked_at__lt=now - STALE_LOCK).update(status='pending')
+
+    ids = list(
+        EmailOutbox.objects.filter(status='pending', next_attempt_at__lte=now)
+        .order_by('next_attempt_at', 'id').values_list('id', flat=True)[:batch_size]
+    )
+    if not ids:
+        return []
+    EmailOutbox.objects.filter(id__in=ids, status='pending').update(status='sending', locked_at=now)
+    return list(EmailOutbox.objects.filter(id__in=ids, status='sending', locked_at=now).order_by('id'))
+
+
+def _message(item, connection):
+    message = EmailMultiAlternatives(
+        subject=item.subject,
+        body=item.body,
+        from_email=item.from_email,
+        to=item.recipients,
+        connection=connection,
+    )
+    if item.html_body:
+        message.attach_alternative(item.html_body, 'text/html')
+    return message
+
+
+def drain_outbox(batch_size=None):
+    """
+    إرسال دفعة من الرسائل المستحقة - يعيد (المرسلة، المعاد جدولتها، الفاشلة نهائياً)
+    """
+    batch_size = batch_size or getattr(settings, 'EMAIL_OUTBOX_BATCH_SIZE', 100)
+    max_attempts = getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 5)
+    backoff = getattr(settings, 'EMAIL_OUTBOX_RETRY_BACKOFF', 60)
+
+    now = timezone.now()
+    items = _claim(now, batch_size)
+    if not items:
+        return 0, 0, 0
+
+    sent, retried, dead = [], [], []
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+        for item in items:
+            try:
+                _message(item, connection).send()
+                sent.append(item.id)
+            except Exception as e:
+                item.attempts += 1
+                item.last_error = str(e)[:1000]
+                item.locked_at = None
+                if item.attempts >= max_attempts:
+                    item.status = 'dead'
+                    dead.append(item)
+                    logger.error(f'Outbox email {item.id} failed permanently: {e}')
+                else:
+                    item.status = 'pending'
+                    item.next_attempt_at = now + timedelta(seconds=backoff * 2 ** (item.attempts - 1))
+                    retried.append(item)
+    except Exception as e:
+        # تعذّر فتح الاتصال: تعاد الدفعة كاملة للانتظار دون احتساب محاولة
+        logger.error(f'Outbox connection failed: {e}')
+        EmailOutbox.objects.filter(id__in=[item.id for item in items if item.id not in sent]).update(
+            status='pending', locked_at=None, next_attempt_at=now + timedelta(seconds=backoff)
+        )
+    finally:
+        connection.close()
+
+    if sent:
+        EmailOutbox.objects.filter(id__in=sent).update(status='sent', sent_at=timezone.now(), locked_at=None)
+    if retried or dead:
+        EmailOutbox.objects.bulk_update(
+            retried + dead, ['status', 'attempts', 'last_error', 'locked_at', 'next_attempt_at']
+        )
+
+    logger.info(f'Outbox drained - sent: {len(sent)}, retried: {len(retried)}, dead: {len(dead)}')
+    return len(sent), len(retried), len(dead)
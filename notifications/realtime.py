@@ -0,0 +1,110 @@
+"""
+دفع الأحداث الفورية إلى المتصفحات عبر Channels (WebSocket)
+
+كل مستخدم متصل ينضم إلى مجموعتين:
+- user_<id>: الإشعارات الجديدة وعدد غير المقروء
+- role_<role>: أحداث عامة حسب الدور (مثل تحديث لوحة المراقبة للإدارة العليا)
+
+الإرسال يتم بعد تثبيت المعاملة (on_commit)، وأي فشل في طبقة القنوات يُسجَّل فقط
+ولا يؤثر على الطلب الأصلي - المتصفح يعود للاستطلاع الدوري عند انقطاع الاتصال.
+"""
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+logger = logging.getLogger('tickets')
+
+UPPER_MANAGEMENT_ROLES = ['admin', 'president', 'admin_assistant', 'academic_assistant']
+
+
+def user_group(user_id):
+    return f'user_{user_id}'
+
+
+def role_group(role):
+    return f'role_{role}'
+
+
+def serialize_notification(notification):
+    """
+    تمثيل الإشعار كما يعيده notifications_api
+    """
+    from .views import get_notification_color, get_notification_icon
+
+    return {
+        'id': notification.id,
+        'title': notification.title,
+        'message': notification.message,
+        'type': notification.notification_type,
+        'ticket_id': notification.ticket_id,
+        'created_at': notification.updated_at.strftime('%Y-%m-%d %H:%M'),
+        'occurrences': notification.occurrences,
+        'icon': get_notification_icon(notification.notification_type),
+        'color': get_notification_color(notification.notification_type),
+    }
+
+
+def _send(groups, event):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        for group in groups:
+            async_to_sync(channel_layer.group_send)(group, event)
+    except Exception as e:
+        logger.warning(f'Realtime push failed: {e}')
+
+
+def unread_counts(user_ids):
+    """
+    عدد الإشعارات غير المقروءة لمجموعة مستخدمين (من NotificationState)
+    """
+    from .models import NotificationState
+
+    return NotificationState.get_counts(user_ids)
+
+
+def push_notifications(notifications):
+    """
+    دفع إشعارات جديدة لأصحابها مع عدد غير المقروء المحدَّث
+    """
+    by_user = {}
+    for notification in notifications:
+        by_user.setdefault(notification.user_id, []).append(serialize_notification(notification))
+    if not by_user:
+        return
+
+    counts = unread_counts(list(by_user))
+    for user_id, items in by_user.items():
+        _send([user_group(user_id)], {
+            'type': 'notification.new',
+            'notifications': items,
+            'count': counts[user_id],
+        })
+
+
+def push_unread_counts(user_ids):
+    """
+    دفع عدد غير المقروء فقط (بعد تحديد الإشعارات كمقروءة مثلاً)
+    """
+    user_ids = [user_id for user_id in set(user_ids) if user_id]
+    if not user_ids:
+        return
+    for user_id, count in unread_counts(user_ids).items():
+        _send([user_group(user_id)], {'type': 'unread.count', 'count': count})
+
+
+def push_to_roles(roles, name):
+    """
+    إرسال تلميح "تغيّرت البيانات" لأدوار معينة - المتصفح يجلب الأرقام مرة واحدة عند الحاجة
+    """
+    _send([role_group(role) for role in roles], {'type': 'data.changed', 'name': name})
+
+
+def on_commit(func, *args):
+    """
+    تنفيذ الدفع بعد تثبيت المعاملة حتى لا يرى المتصفح بيانات لم تُحفظ بعد
+    """
+    transaction.on_commit(lambda: func(*args))
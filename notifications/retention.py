@@ -0,0 +1,114 @@
+"""
+سياسة الاحتفاظ بالإشعارات
+
+- الإشعارات المقروءة الأقدم من مدة نوعها (NOTIFICATION_RETENTION_DAYS) تُنقل إلى ArchivedNotification
+- النقل يتم على دفعات صغيرة، كل دفعة في معاملة قصيرة مستقلة، فلا تُحجز أقفال كتابة طويلة
+- الأرشيف نفسه يُقلَّم حسب الشهر بعد NOTIFICATION_ARCHIVE_RETENTION_DAYS يوماً
+- الإشعارات غير المقروءة لا تُنقل أبداً (فلا يتأثر عدّاد غير المقروء)
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from tickets.locks import heartbeat
+from .models import ArchivedNotification, Notification
+
+logger = logging.getLogger('tickets')
+
+DEFAULT_RETENTION_DAYS = {
+    'default': 90,
+}
+
+
+def retention_days():
+    """
+    مدة الاحتفاظ لكل نوع إشعار: {type: days}
+    """
+    policy = {**DEFAULT_RETENTION_DAYS, **getattr(settings, 'NOTIFICATION_RETENTION_DAYS', {})}
+    return {
+        notification_type: policy.get(notification_type, policy['default'])
+        for notification_type, _ in Notification.NOTIFICATION_TYPES
+    }
+
+
+def _archive_batch(queryset, batch_size):
+    rows = list(queryset.order_by('id').values(*ArchivedNotification.ARCHIVED_FIELDS)[:batch_size])
+    if not rows:
+        return 0
+    with transaction.atomic():
+        ArchivedNotification.objects.bulk_create(
+            [ArchivedNotification(**row) for row in rows], ignore_conflicts=True
+        )
+        Notification.objects.filter(id__in=[row['id'] for row in rows], is_read=True).delete()
+    return len(rows)
+
+
+def archive_notifications(now=None, batch_size=None, dry_run=False):
+    """
+    نقل الإشعارات المقروءة المنتهية مدتها إلى الأرشيف - يعيد {type: count}
+    """
+    now = now or timezone.now()
+    batch_size = batch_size or getattr(settings, 'NOTIFICATION_ARCHIVE_BATCH_SIZE', 500)
+    pause = getattr(settings, 'NOTIFICATION_ARCHIVE_BATCH_PAUSE', 0)
+    results = {}
+
+    for notification_type, days in retention_days().items():
+        expired = Notification.objects.filter(
+            notification_type=notification_type,
+            is_read=True,
+            created_at__lt=now - timedelta(days=days),
+        )
+        if dry_run:
+            results[notification_type] = expired.count()
+            continue
+
+        total = 0
+        while True:
+            heartbeat()
+            moved = _archive_batch(expired, batch_size)
+            total += moved
+            if moved < batch_size:
+                break
+            if pause:
+                # إفساح المجال لعمليات الكتابة الأخرى بين الدفعات
+                time.sleep(pause)
+        results[notification_type] = total
+
+    if not dry_run:
+        logger.info(f'Notifications archived: {sum(results.values())} {results}')
+    return results
+
+
+def prune_archive(now=None, batch_size=None, dry_run=False):
+    """
+    حذف الأرشيف الأقدم من NOTIFICATION_ARCHIVE_RETENTION_DAYS على شرائح شهرية - يعيد عدد المحذوف
+    """
+    now = now or timezone.now()
+    batch_size = batch_size or getattr(settings, 'NOTIFICATION_ARCHIVE_BATCH_SIZE', 500)
+    cutoff = now - timedelta(days=getattr(settings, 'NOTIFICATION_ARCHIVE_RETENTION_DAYS', 730))
+
+    expired = ArchivedNotification.objects.filter(created_at__lt=cutoff)
+    if dry_run:
+        return expired.count()
+
+    oldest = expired.order_by('created_at').values_list('created_at', flat=True).first()
+    deleted = 0
+    while oldest is not None and oldest < cutoff:
+        # شريحة شهر واحد في كل مرة (نطاق على فهرس created_at)
+        month_end = min((oldest.replace(day=1) + timedelta(days=32)).replace(day=1), cutoff)
+        month = ArchivedNotification.objects.filter(created_at__gte=oldest, created_at__lt=month_end)
+        while True:
+            heartbeat()
+            ids = list(month.values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            deleted += ArchivedNotification.objects.filter(id__in=ids).delete()[0]
+        oldest = month_end
+
+    if deleted:
+        logger.info(f'Archived notifications pruned: {deleted}')
+    return deleted
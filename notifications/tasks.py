@@ -0,0 +1,67 @@
+"""
+مهام Celery الخاصة بالإشعارات
+"""
+from celery import shared_task
+
+from tickets.locks import single_flight
+
+from .fanout import create_notifications
+
+
+@shared_task
+def fan_out_notifications(user_ids, notification_type, title, message, ticket_id=None, actor_id=None):
+    """
+    إنشاء إشعارات الإرسال الجماعي الكبير خارج الطلب
+    """
+    return create_notifications(user_ids, notification_type, title, message, ticket_id, actor_id)
+
+
+@shared_task
+def send_outbox_emails():
+    """
+    إرسال البريد المستحق من صندوق البريد الصادر حتى يفرغ
+    """
+    from .outbox import drain_outbox
+
+    total = 0
+    while True:
+        sent, retried, dead = drain_outbox()
+        total += sent
+        if not (sent or retried or dead):
+            break
+    return f'تم إرسال {total} رسالة'
+
+
+@shared_task
+@single_flight()
+def send_notification_digests():
+    """
+    إرسال ملخصات الإشعارات (كل ساعة / يومياً) للمستخدمين الذين اختاروا وضع الملخص
+    """
+    from .digest import send_digests
+
+    return f'تم إرسال {send_digests()} ملخص'
+
+
+@shared_task
+@single_flight()
+def reconcile_unread_counts():
+    """
+    تصحيح أي انحراف في عدّادات الإشعارات غير المقروءة
+    """
+    from .models import NotificationState
+
+    return f'تم تصحيح {NotificationState.reconcile()} عدّاد'
+
+
+@shared_task
+@single_flight()
+def prune_notifications():
+    """
+    أرشفة الإشعارات المقروءة القديمة وتقليم الأرشيف حسب سياسة الاحتفاظ
+    """
+    from .retention import archive_notifications, prune_archive
+
+    archived = sum(archive_notifications().values())
+    pruned = prune_archive()
+    return f'تمت أرشفة {archived} إشعار وحذف {pruned} من الأرشيف'
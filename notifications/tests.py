@@ -0,0 +1,407 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+import json
+
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import CustomUser, Department
+from tickets.cache_utils import get_counters, get_daily_counters
+from tickets.models import Ticket, TicketAction
+from .consumers import NotificationConsumer
+from .context_processors import global_mails
+from .fanout import fan_out
+from .digest import send_digests
+from .models import (
+    ArchivedNotification, EmailOutbox, GlobalMail, GlobalMailAttachment, Notification,
+    NotificationPreference, NotificationState,
+)
+from .retention import archive_notifications, prune_archive
+from .outbox import drain_outbox
+
+
+class GlobalMailCacheTests(TestCase):
+    """ذاكرة البريد العام المرقّمة بنسخة والقيمة الكسولة في context processor"""
+
+    def setUp(self):
+        cache.clear()
+        self.mail = GlobalMail.objects.create(title='إعلان', message='-')
+        GlobalMailAttachment.objects.create(mail=self.mail, file='global_mail_attachments/a.pdf')
+
+    def _titles(self):
+        return [mail.title for mail in GlobalMail.get_latest_cached()]
+
+    def test_cache_hit_costs_no_queries(self):
+        GlobalMail.get_latest_cached()
+        with self.assertNumQueries(0):
+            mails = GlobalMail.get_latest_cached()
+            self.assertEqual([a.file.name for a in mails[0].attachments.all()], ['global_mail_attachments/a.pdf'])
+
+    def test_mail_and_attachment_changes_invalidate(self):
+        self.assertEqual(self._titles(), ['إعلان'])
+
+        self.mail.title = 'إعلان معدّل'
+        self.mail.save()
+        self.assertEqual(self._titles(), ['إعلان معدّل'])
+
+        attachment = GlobalMailAttachment.objects.create(mail=self.mail, file='global_mail_attachments/b.pdf')
+        self.assertEqual(len(GlobalMail.get_latest_cached()[0].attachments.all()), 2)
+        attachment.delete()
+        self.assertEqual(len(GlobalMail.get_latest_cached()[0].attachments.all()), 1)
+
+        self.mail.delete()
+        self.assertEqual(self._titles(), [])
+
+    def test_lost_version_key_does_not_revive_old_entries(self):
+        # حذف مفتاح النسخة وحده (كما يحدث عند الإخراج من LocMemCache) مع بقاء القائمة المحفوظة
+        cache.delete(GlobalMail.CACHE_VERSION_KEY)
+        GlobalMail.invalidate_cache()
+        self.assertEqual(self._titles(), ['إعلان'])
+        cache.delete(GlobalMail.CACHE_VERSION_KEY)
+        GlobalMail.objects.create(title='جديد', message='-')
+        self.assertEqual(self._titles(), ['جديد', 'إعلان'])
+
+    def test_context_processor_is_lazy(self):
+        request = RequestFactory().get('/')
+        with self.assertNumQueries(0):
+            context = global_mails(request)
+        with self.assertNumQueries(2):
+            self.assertEqual(len(context['global_mails']), 1)
+
+
+class RealtimeNotificationTests(TestCase):
+    """الدفع الفوري عبر WebSocket على طبقة القنوات في الذاكرة (بدون Redis)"""
+
+    def setUp(self):
+        self.department = Department.objects.create(name='قسم الاختبار')
+        self.creator = CustomUser.objects.create_user('creator', password='x', role='head')
+        self.employee = CustomUser.objects.create_user(
+            'employee', password='x', role='employee', department=self.department
+        )
+        self.president = CustomUser.objects.create_user('president', password='x', role='president')
+
+    async def _open(self, user):
+        communicator = ApplicationCommunicator(NotificationConsumer.as_asgi(), {
+            'type': 'websocket', 'path': '/ws/notifications/', 'headers': [], 'user': user,
+        })
+        await communicator.send_input({'type': 'websocket.connect'})
+        return communicator, (await communicator.receive_output())['type']
+
+    async def _connect(self, user):
+        communicator, response = await self._open(user)
+        self.assertEqual(response, 'websocket.accept')
+        return communicator
+
+    async def _receive(self, communicator):
+        message = await communicator.receive_output(timeout=2)
+        return json.loads(message['text'])
+
+    def _commit(self, func):
+        with self.captureOnCommitCallbacks(execute=True):
+            return func()
+
+    async def test_new_ticket_pushes_notification_and_count(self):
+        communicator = await self._connect(self.employee)
+        self.assertEqual(await self._receive(communicator), {'event': 'unread_count', 'count': 0})
+
+        await sync_to_async(self._commit)(lambda: Ticket.objects.create(
+            title='طلب', description='-', created_by=self.creator,
+            department=self.department, assigned_to=self.employee,
+        ))
+        message = await self._receive(communicator)
+        self.assertEqual(message['event'], 'notification')
+        self.assertEqual(message['count'], 1)
+        self.assertEqual(message['notifications'][0]['type'], 'new_ticket')
+
+        await sync_to_async(self._commit)(lambda: Notification.mark_as_read(self.employee))
+        self.assertEqual(await self._receive(communicator), {'event': 'unread_count', 'count': 0})
+        await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+
+    async def test_upper_management_receives_monitoring_hint(self):
+        communicator = await self._connect(self.president)
+        await self._receive(communicator)
+
+        await sync_to_async(self._commit)(lambda: Ticket.objects.create(
+            title='طلب', description='-', created_by=self.creator, department=self.department,
+        ))
+        self.assertEqual(
+            await self._receive(communicator), {'event': 'data_changed', 'name': 'monitoring'}
+        )
+        await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+
+    async def test_anonymous_rejected(self):
+        from django.contrib.auth.models import AnonymousUser
+
+        _, response = await self._open(AnonymousUser())
+        self.assertEqual(response, 'websocket.close')
+
+
+class NotificationFanOutTests(TestCase):
+    """إرسال الإشعارات الجماعي بـ bulk_create"""
+
+    def setUp(self):
+        cache.clear()
+        self.department = Department.objects.create(name='قسم الاختبار')
+        self.creator = CustomUser.objects.create_user('creator', password='x', role='president')
+        self.members = [
+            CustomUser.objects.create_user(
+                f'member{i}', role='employee', department=self.department
+            )
+            for i in range(30)
+        ]
+        self.ticket = Ticket.objects.create(
+            title='طلب', description='-', created_by=self.creator, department=self.department,
+        )
+        self.ticket.departments.add(self.department)
+        Notification.objects.all().delete()
+
+    def test_comment_fan_out_in_constant_queries(self):
+        with override_settings(NOTIFICATION_FANOUT_BATCH_SIZE=10):
+            with CaptureQueriesContext(connection) as queries:
+                TicketAction.objects.create(
+                    ticket=self.ticket, user=self.members[0], action_type='commented', notes='-'
+                )
+        inserts = [q for q in queries if q['sql'].startswith('INSERT INTO "notifications_notification"')]
+        # 30 مستلماً (29 عضواً + المنشئ) على ثلاث دفعات
+        self.assertEqual(len(inserts), 3)
+        self.assertEqual(Notification.objects.count(), 30)
+        self.assertFalse(Notification.objects.filter(user=self.members[0]).exists())
+        self.assertEqual(get_counters('notification_fanout_rows')['notification_fanout_rows'], 30)
+
+    @override_settings(NOTIFICATION_FANOUT_ASYNC_THRESHOLD=10)
+    def test_large_fan_out_deferred_to_celery(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            queued = fan_out([m.pk for m in self.members], 'ticket_escalated', 'تصعيد', '-', self.ticket)
+        self.assertEqual(queued, 30)
+        self.assertEqual(Notification.objects.count(), 0)
+        self.assertEqual(len(callbacks), 1)
+
+
+class FailingEmailBackend(BaseEmailBackend):
+    """خادم بريد لا يقبل أي رسالة"""
+
+    def send_messages(self, email_messages):
+        raise ConnectionError('SMTP unavailable')
+
+
+class EmailOutboxTests(TestCase):
+    """صندوق البريد الصادر بدلاً من send_mail داخل الإشارات"""
+
+    def setUp(self):
+        self.department = Department.objects.create(name='قسم الاختبار')
+        self.creator = CustomUser.objects.create_user(
+            'creator', password='x', role='head', email='creator@uni.edu'
+        )
+        self.employee = CustomUser.objects.create_user(
+            'employee', password='x', role='employee', email='employee@uni.edu'
+        )
+
+    def _create_ticket(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Ticket.objects.create(
+                title='طلب', description='-', created_by=self.creator,
+                department=self.department, assigned_to=self.employee,
+            )
+
+    def test_ticket_email_queued_then_sent_in_batch(self):
+        self._create_ticket()
+        self._create_ticket()
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(EmailOutbox.objects.filter(status='pending').count(), 2)
+
+        self.assertEqual(drain_outbox(), (2, 0, 0))
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(set(mail.outbox[0].to), {'creator@uni.edu', 'employee@uni.edu'})
+        self.assertEqual(mail.outbox[0].alternatives[0][1], 'text/html')
+        self.assertEqual(EmailOutbox.objects.filter(status='sent').count(), 2)
+        self.assertEqual(drain_outbox(), (0, 0, 0))
+
+    @override_settings(
+        EMAIL_BACKEND='notifications.tests.FailingEmailBackend',
+        EMAIL_OUTBOX_MAX_ATTEMPTS=2, EMAIL_OUTBOX_RETRY_BACKOFF=60,
+    )
+    def test_failures_back_off_then_dead_letter(self):
+        self._create_ticket()
+        self.assertEqual(drain_outbox(), (0, 1, 0))
+        item = EmailOutbox.objects.get()
+        self.assertEqual((item.status, item.attempts), ('pending', 1))
+        self.assertGreater(item.next_attempt_at, timezone.now())
+        # ليست مستحقة بعد
+        self.assertEqual(drain_outbox(), (0, 0, 0))
+
+        EmailOutbox.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(drain_outbox(), (0, 0, 1))
+        item.refresh_from_db()
+        self.assertEqual(item.status, 'dead')
+        self.assertIn('SMTP unavailable', item.last_error)
+
+
+class NotificationCoalescingTests(TestCase):
+    """دمج الأحداث المتكررة وملخص البريد"""
+
+    def setUp(self):
+        cache.clear()
+        self.department = Department.objects.create(name='قسم الاختبار')
+        self.creator = CustomUser.objects.create_user(
+            'creator', password='x', role='head', email='creator@uni.edu'
+        )
+        self.employee = CustomUser.objects.create_user(
+            'employee', password='x', role='employee', email='employee@uni.edu'
+        )
+        self.colleague = CustomUser.objects.create_user('colleague', password='x', role='employee')
+        self.ticket = Ticket.objects.create(
+            title='طلب', description='-', created_by=self.creator,
+            department=self.department, assigned_to=self.employee,
+        )
+        Notification.objects.all().delete()
+
+    def _comment(self, user):
+        TicketAction.objects.create(ticket=self.ticket, user=user, action_type='commented', notes='-')
+
+    def test_repeated_comments_merge_into_one_row(self):
+        self._comment(self.creator)
+        self._comment(self.colleague)
+
+        notification = Notification.objects.get(user=self.employee)
+        self.assertEqual(notification.occurrences, 2)
+        self.assertEqual(notification.last_actor, self.colleague)
+        self.assertEqual(get_daily_counters('notification_rows_saved')['notification_rows_saved'], 1)
+
+        # بعد القراءة يبدأ صف جديد
+        Notification.mark_as_read(self.employee)
+        self._comment(self.colleague)
+        self.assertEqual(Notification.objects.filter(user=self.employee).count(), 2)
+
+    @override_settings(NOTIFICATION_COALESCE_WINDOW=0)
+    def test_coalescing_can_be_disabled(self):
+        self._comment(self.creator)
+        self._comment(self.colleague)
+        self.assertEqual(Notification.objects.filter(user=self.employee).count(), 2)
+
+    def test_digest_replaces_per_event_emails(self):
+        NotificationPreference.objects.create(user=self.employee, digest_mode='hourly')
+        with self.captureOnCommitCallbacks(execute=True):
+            self._comment(self.creator)
+            TicketAction.objects.create(ticket=self.ticket, user=self.creator, action_type='resolved')
+        # البريد الفوري للمنشئ فقط
+        self.assertTrue(all(item.recipients == ['creator@uni.edu'] for item in EmailOutbox.objects.all()))
+
+        self.assertEqual(send_digests(), 1)
+        digest = EmailOutbox.objects.get(recipients=['employee@uni.edu'])
+        self.assertIn('ملخص', digest.subject)
+        # لا ملخص جديد قبل مرور ساعة
+        self.assertEqual(send_digests(), 0)
+        self.assertEqual(
+            get_daily_counters('digest_emails_suppressed', 'digest_emails_sent'),
+            {'digest_emails_suppressed': 2, 'digest_emails_sent': 1},
+        )
+
+
+class UnreadCounterTests(TestCase):
+    """عدّاد الإشعارات غير المقروءة المخزن في NotificationState"""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('user', password='x', role='employee')
+        self.other = CustomUser.objects.create_user('other', password='x', role='employee')
+
+    def _notify(self, user):
+        return Notification.create_notification(user, 'new_ticket', 'عنوان', '-')
+
+    def test_counter_follows_create_fan_out_read_and_delete(self):
+        first = self._notify(self.user)
+        self._notify(self.user)
+        fan_out([self.user.pk, self.other.pk], 'ticket_escalated', 'تصعيد', '-')
+        self.assertEqual(Notification.get_unread_count(self.user), 3)
+        self.assertEqual(Notification.get_unread_count(self.other), 1)
+
+        Notification.mark_as_read(self.user, [first.pk])
+        self.assertEqual(Notification.get_unread_count(self.user), 2)
+        Notification.objects.filter(user=self.user, is_read=False).first().delete()
+        self.assertEqual(Notification.get_unread_count(self.user), 1)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(Notification.get_unread_count(self.user), 1)
+
+    def test_badge_endpoint_is_single_lookup(self):
+        self._notify(self.user)
+        self.client.force_login(self.user)
+        self.client.get(reverse('notifications_api'), {'count_only': 1})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('notifications_api'), {'count_only': 1})
+        self.assertEqual(response.json(), {'count': 1})
+        self.assertFalse(any('FROM "notifications_notification"' in q['sql'] for q in queries))
+        self.assertEqual(sum('FROM "notifications_notificationstate"' in q['sql'] for q in queries), 1)
+
+    def test_reconcile_fixes_drift(self):
+        self._notify(self.user)
+        self._notify(self.other)
+        # تعديل مباشر يتجاوز العدّاد
+        Notification.objects.filter(user=self.user).update(is_read=True)
+        NotificationState.objects.filter(pk=self.other.pk).delete()
+
+        self.assertEqual(NotificationState.reconcile(), 2)
+        self.assertEqual(Notification.get_unread_count(self.user), 0)
+        self.assertEqual(NotificationState.objects.get(pk=self.other.pk).unread_count, 1)
+        self.assertEqual(NotificationState.reconcile(), 0)
+
+
+@override_settings(
+    NOTIFICATION_RETENTION_DAYS={'default': 90, 'ticket_commented': 30},
+    NOTIFICATION_ARCHIVE_BATCH_SIZE=2, NOTIFICATION_ARCHIVE_BATCH_PAUSE=0,
+)
+
+
+class NotificationRetentionTests(TestCase):
+    """أرشفة الإشعارات المقروءة القديمة وتصفح الأرشيف"""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('user', password='x', role='employee')
+        now = timezone.now()
+        for days_ago, notification_type, is_read in [
+            (40, 'ticket_commented', True), (41, 'ticket_commented', True), (42, 'ticket_commented', True),
+            (40, 'ticket_commented', False), (40, 'ticket_escalated', True), (100, 'ticket_escalated', True),
+        ]:
+            notification = Notification.create_notification(self.user, notification_type, 'عنوان', '-')
+            Notification.objects.filter(pk=notification.pk).update(
+                is_read=is_read, created_at=now - timedelta(days=days_ago)
+            )
+        NotificationState.reconcile()
+
+    def test_archives_expired_read_rows_per_type(self):
+        self.assertEqual(
+            archive_notifications(dry_run=True),
+            {**dict.fromkeys(dict(Notification.NOTIFICATION_TYPES), 0), 'ticket_commented': 3, 'ticket_escalated': 1},
+        )
+        results = archive_notifications()
+        self.assertEqual((results['ticket_commented'], results['ticket_escalated']), (3, 1))
+        self.assertEqual(Notification.objects.count(), 2)
+        self.assertEqual(ArchivedNotification.objects.filter(user=self.user).count(), 4)
+        # غير المقروء لا يُنقل
+        self.assertEqual(Notification.get_unread_count(self.user), 1)
+
+        with override_settings(NOTIFICATION_ARCHIVE_RETENTION_DAYS=60):
+            self.assertEqual(prune_archive(), 1)
+
+    def test_archive_browsable_with_cursor(self):
+        archive_notifications()
+        self.client.force_login(self.user)
+        self.assertTrue(self.client.get(reverse('notifications_list')).context['has_archive'])
+
+        with patch('notifications.views.ARCHIVE_PAGE_SIZE', 2):
+            response = self.client.get(reverse('notifications_list'), {'older': ''})
+            first_page = response.context['archived_notifications']
+            self.assertEqual(len(first_page), 2)
+            response = self.client.get(reverse('notifications_list'), {'older': response.context['next_cursor']})
+            second_page = response.context['archived_notifications']
+        self.assertEqual(len(second_page), 2)
+        self.assertIsNone(response.context['next_cursor'])
+        self.assertGreater(first_page[-1].id, second_page[0].id)
@@ -7,5 +7,6 @@ urlpatterns = [
     path('mark-read/', views.mark_as_read, name='mark_notifications_read'),
     path('create/', views.create_notification, name='create_notification'),
     path('mark-all-read/', views.mark_all_as_read, name='mark_all_notifications_read'),
+    path('digest/', views.update_digest_preference, name='update_digest_preference'),
     path('edit/<int:pk>/', views.edit_notification, name='edit_notification'),
 ]
@@ -2,25 +2,50 @@ from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
 from django.views.decorators.http import require_POST
-from .models import Notification
+from .models import ArchivedNotification, Notification, NotificationPreference
 from .forms import NotificationForm
+from .realtime import serialize_notification
 import logging
 
 logger = logging.getLogger('tickets')
 
+ARCHIVE_PAGE_SIZE = 50
+
 # ---------------------------------------------------------------------------
 # List notifications (page view)
 # ---------------------------------------------------------------------------
 @login_required
 def notifications_list(request):
-    """قائمة الإشعارات للمستخدم الحالي."""
-    notifications = Notification.objects.filter(user=request.user).select_related('ticket')[:50]
+    """قائمة الإشعارات للمستخدم الحالي، و?older=<id> لتصفح الأرشيف (الأقدم) بمؤشر."""
+    if 'older' in request.GET:
+        return archived_notifications_list(request)
+
+    notifications = Notification.objects.filter(user=request.user).select_related('ticket', 'last_actor')[:50]
+    preference = NotificationPreference.objects.filter(user=request.user).first()
     context = {
         'notifications': notifications,
+        'has_archive': ArchivedNotification.objects.filter(user=request.user).exists(),
         'unread_count': Notification.get_unread_count(request.user),
+        'digest_mode': preference.digest_mode if preference else 'immediate',
+        'digest_choices': NotificationPreference.DIGEST_CHOICES,
     }
     return render(request, 'notifications/list.html', context)
 
+def archived_notifications_list(request):
+    """الإشعارات المؤرشفة - تصفح بالمؤشر (معرّف آخر إشعار معروض) بدلاً من OFFSET."""
+    page_size = ARCHIVE_PAGE_SIZE
+    archived = ArchivedNotification.objects.filter(user=request.user)
+    cursor = request.GET.get('older')
+    if cursor and cursor.isdigit():
+        archived = archived.filter(id__lt=int(cursor))
+    items = list(archived.order_by('-id')[:page_size + 1])
+    next_cursor = items[page_size - 1].id if len(items) > page_size else None
+    context = {
+        'archived_notifications': items[:page_size],
+        'next_cursor': next_cursor,
+    }
+    return render(request, 'notifications/archive.html', context)
+
 # ---------------------------------------------------------------------------
 # Create a new notification (staff)
 # ---------------------------------------------------------------------------
@@ -39,7 +64,10 @@ def create_notification(request):
     return render(request, 'notifications/create.html', {'form': form})
 @login_required
 def notifications_api(request):
-    """API للحصول على الإشعارات (AJAX)."""
+    """API للحصول على الإشعارات (AJAX). ?count_only=1 يعيد العدد فقط (بحث بالمفتاح الأساسي)."""
+    if request.GET.get('count_only'):
+        return JsonResponse({'count': Notification.get_unread_count(request.user)})
+
     notifications = Notification.objects.filter(
         user=request.user,
         is_read=False,
@@ -47,19 +75,7 @@ def notifications_api(request):
 
     data = {
         'count': Notification.get_unread_count(request.user),
-        'notifications': [
-            {
-                'id': n.id,
-                'title': n.title,
-                'message': n.message,
-                'type': n.notification_type,
-                'ticket_id': n.ticket.id if n.ticket else None,
-                'created_at': n.created_at.strftime('%Y-%m-%d %H:%M'),
-                'icon': get_notification_icon(n.notification_type),
-                'color': get_notification_color(n.notification_type),
-            }
-            for n in notifications
-        ],
+        'notifications': [serialize_notification(n) for n in notifications],
     }
     return JsonResponse(data)
 
@@ -89,6 +105,21 @@ def mark_all_as_read(request):
     logger.info(f'User {request.user.id} marked all notifications as read')
     return JsonResponse({'success': True})
 
+# ---------------------------------------------------------------------------
+# Email digest preference (POST)
+# ---------------------------------------------------------------------------
+@login_required
+@require_POST
+def update_digest_preference(request):
+    """تغيير وضع البريد: فوري أو ملخص كل ساعة أو ملخص يومي."""
+    digest_mode = request.POST.get('digest_mode')
+    if digest_mode in dict(NotificationPreference.DIGEST_CHOICES):
+        NotificationPreference.objects.update_or_create(
+            user=request.user, defaults={'digest_mode': digest_mode}
+        )
+        logger.info(f'User {request.user.id} set email digest mode to {digest_mode}')
+    return redirect('notifications_list')
+
 # ---------------------------------------------------------------------------
 # Helper: icon & color per notification type
 # ---------------------------------------------------------------------------
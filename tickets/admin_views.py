@@ -6,10 +6,10 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.utils import timezone
-from django.db.models import Q, Count, Avg, Sum
+from django.db.models import Q, Count, Avg
 from django.http import JsonResponse
 from django.core.paginator import Paginator
-from .models import Ticket, TicketAction, TicketAcknowledgment
+from .models import Ticket, TicketAction, TicketAcknowledgment, TicketAudience
 from accounts.models import CustomUser, Department, PenaltyPoints
 from .forms import CloseTicketForm, AddPenaltyForm
 import logging
@@ -37,11 +37,7 @@ def completed_tickets(request):
     
     # فلترة حسب القسم إذا لم يكن من الإدارة العليا
     if not request.user.is_upper_management:
-        if request.user.department:
-            tickets = tickets.filter(
-                Q(department=request.user.department) | 
-                Q(departments=request.user.department)
-            ).distinct()
+        tickets = tickets.visible_to(request.user, include=TicketAudience.DEPARTMENT_ONLY_REASONS)
     
     # البحث
     search_query = request.GET.get('search', '')
@@ -242,50 +238,40 @@ def get_notifications_enhanced(request):
     """
     user = request.user
     
-    # الطلبات التي تحتاج إقرار
-    ack_filter = Q(assigned_to=user) | Q(assigned_to_users=user)
-    if user.department:
-        ack_filter |= Q(departments=user.department)
+    # الطلبات المعينة للمستخدم (مباشرة، ضمن مجموعة، أو عبر القسم) من جدول الجمهور
+    assigned = Ticket.objects.visible_to(user, include=TicketAudience.ASSIGNMENT_REASONS)
     
-    pending_ack = Ticket.objects.filter(
-        ack_filter,
+    # الطلبات التي تحتاج إقرار
+    pending_ack = assigned.filter(
         status='pending_ack'
     ).exclude(
         acknowledgments__user=user
-    ).distinct().count()
+    ).count()
     
     # الطلبات الجديدة المعينة
-    user_tickets_filter = Q(assigned_to=user) | Q(assigned_to_users=user)
-    if user.department:
-        user_tickets_filter |= Q(departments=user.department)
-    
-    new_tickets = Ticket.objects.filter(
-        user_tickets_filter,
+    new_tickets = assigned.filter(
         status='new'
-    ).distinct().count()
+    ).count()
     
     # الطلبات المتأخرة
-    overdue_tickets = Ticket.objects.filter(
-        user_tickets_filter,
+    overdue_tickets = assigned.filter(
         status__in=['new', 'pending_ack', 'in_progress'],
         sla_deadline__lt=timezone.now()
-    ).distinct().count()
+    ).count()
     
     # الطلبات الحرجة
-    critical_tickets = Ticket.objects.filter(
-        user_tickets_filter,
+    critical_tickets = assigned.filter(
         priority='critical',
         status__in=['new', 'pending_ack', 'in_progress']
-    ).distinct().count()
+    ).count()
     
     # الطلبات التي تحتاج متابعة (قريبة من المهلة)
     from datetime import timedelta
-    near_deadline = Ticket.objects.filter(
-        user_tickets_filter,
+    near_deadline = assigned.filter(
         status__in=['new', 'pending_ack', 'in_progress'],
         sla_deadline__lte=timezone.now() + timedelta(hours=2),
         sla_deadline__gt=timezone.now()
-    ).distinct().count()
+    ).count()
     
     return JsonResponse({
         'pending_acknowledgment': pending_ack,
@@ -344,11 +330,9 @@ def violations_report(request):
     
     # فلترة حسب القسم
     if not request.user.is_upper_management:
-        if request.user.department:
-            violated_tickets = violated_tickets.filter(
-                Q(department=request.user.department) | 
-                Q(departments=request.user.department)
-            ).distinct()
+        violated_tickets = violated_tickets.visible_to(
+            request.user, include=TicketAudience.DEPARTMENT_ONLY_REASONS
+        )
     
     department_filter = request.GET.get('department')
     if department_filter:
@@ -561,14 +545,16 @@ def mark_as_violation(request, pk):
         ticket.status = 'violated'
         ticket.save()
         
-        # تسجيل نقاط جزائية على المعين له (إذا وجد)
+        # تسجيل نقاط جزائية على المعين له (إذا وجد) - مرة واحدة لكل طلب ويوم
+        # إذا كانت المهمة الدورية قد سجلت نقاط تجاوز المهلة اليوم فلا تُضاف مرة ثانية
+        penalties = []
         if ticket.assigned_to:
-            current_points = ticket.assigned_to.penalties.aggregate(total=Sum('points'))['total'] or 0
-            PenaltyPoints.objects.create(
-                user=ticket.assigned_to,
+            penalties = PenaltyPoints.record([PenaltyPoints.for_ticket(
+                ticket,
                 points=10,  # 10 نقاط للمخالفة اليدوية
-                reason=f"مخالفة يدوية للتذكرة #{ticket.id}: {reason}"
-            )
+                reason=f"مخالفة يدوية للتذكرة #{ticket.id}: {reason}",
+                department_id=None,
+            )])
         
         # تسجيل الإجراء
         TicketAction.objects.create(
@@ -578,7 +564,10 @@ def mark_as_violation(request, pk):
             notes=f'تم تحويلها لمخالفة يدوياً. السبب: {reason}'
         )
         
-        messages.success(request, 'تم تسجيل المخالفة بنجاح وإضافة نقاط جزائية')
+        if penalties:
+            messages.success(request, 'تم تسجيل المخالفة بنجاح وإضافة نقاط جزائية')
+        else:
+            messages.success(request, 'تم تسجيل المخالفة بنجاح (النقاط الجزائية لهذا الطلب مسجلة اليوم مسبقاً)')
         logger.info(f'Ticket #{ticket.id} marked as violation by {request.user.username}')
         
     return redirect('ticket_detail', pk=pk)
@@ -0,0 +1,122 @@
+"""
+أدوات التخزين المؤقت لنظام الطلبات
+Cache helpers for the ticket system
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+PENDING_ACK_KEY = 'pending_ack_{user_id}'
+COUNTER_KEY = 'cache_counter_{name}'
+DASHBOARD_EPOCH_KEY = 'dashboard_epoch'
+DAILY_COUNTER_KEY = 'cache_counter_{name}_{day}'
+DAILY_COUNTER_TIMEOUT = 8 * 24 * 3600
+
+
+def incr_counter(name, delta=1):
+    """
+    زيادة عدّاد في الذاكرة المؤقتة (لا تنتهي صلاحيته)
+    """
+    key = COUNTER_KEY.format(name=name)
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        # العدّاد غير موجود بعد
+        if cache.add(key, delta, None):
+            return delta
+        return cache.incr(key, delta)
+
+
+def get_counters(*names):
+    """
+    قراءة مجموعة عدّادات دفعة واحدة: {name: value}
+    """
+    keys = {COUNTER_KEY.format(name=name): name for name in names}
+    values = cache.get_many(keys)
+    return {name: values.get(key, 0) for key, name in keys.items()}
+
+
+def incr_daily_counter(name, delta=1):
+    """
+    عدّاد يومي (حسب التاريخ المحلي) يُحتفظ به أسبوعاً
+    """
+    key = DAILY_COUNTER_KEY.format(name=name, day=timezone.localdate().isoformat())
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        if cache.add(key, delta, DAILY_COUNTER_TIMEOUT):
+            return delta
+        return cache.incr(key, delta)
+
+
+def get_daily_counters(*names, day=None):
+    """
+    قراءة العدّادات اليومية ليوم معين (الافتراضي: اليوم)
+    """
+    day = (day or timezone.localdate()).isoformat()
+    keys = {DAILY_COUNTER_KEY.format(name=name, day=day): name for name in names}
+    values = cache.get_many(keys)
+    return {name: values.get(key, 0) for key, name in keys.items()}
+
+
+# ============================================
+# علم "لديه طلبات بانتظار الإقرار" لكل مستخدم
+# ============================================
+
+def has_pending_acknowledgments(user):
+    """
+    هل لدى المستخدم طلبات معينة له بانتظار إقراره؟
+    القيمة محفوظة في الذاكرة المؤقتة، وعند غيابها تُحسب من قاعدة البيانات
+    """
+    key = PENDING_ACK_KEY.format(user_id=user.pk)
+    flag = cache.get(key)
+    if flag is not None:
+        incr_counter('pending_ack_hit')
+        return flag
+
+    incr_counter('pending_ack_miss')
+    from .models import Ticket, TicketAudience
+
+    flag = Ticket.objects.visible_to(
+        user, include=TicketAudience.ASSIGNMENT_REASONS
+    ).filter(
+        status='pending_ack'
+    ).exclude(
+        acknowledgments__user=user
+    ).exists()
+    cache.set(key, flag, getattr(settings, 'PENDING_ACK_CACHE_TIMEOUT', 600))
+    return flag
+
+
+def invalidate_pending_acknowledgments(user_ids):
+    """
+    حذف العلم لمجموعة مستخدمين ليُعاد حسابه في الطلب التالي
+    """
+    keys = [PENDING_ACK_KEY.format(user_id=user_id) for user_id in set(user_ids) if user_id]
+    if keys:
+        cache.delete_many(keys)
+
+
+# ============================================
+# حقبة بيانات لوحة التحكم
+# ============================================
+
+def get_dashboard_epoch():
+    """
+    رقم الحقبة الحالية لبيانات لوحة التحكم (جزء من مفتاح الذاكرة المؤقتة)
+    """
+    # الحقبة تبدأ من الزمن الحالي: إن حُذف مفتاحها وحده من الذاكرة فلن تعود لحقبة قديمة
+    # ما زالت إحصائياتها محفوظة (كما في GlobalMail._seed_version)
+    return cache.get_or_set(DASHBOARD_EPOCH_KEY, time.time_ns, None)
+
+
+def bump_dashboard_epoch():
+    """
+    بدء حقبة جديدة فتصبح كل إحصائيات لوحة التحكم المحفوظة قديمة وتنتهي صلاحيتها تلقائياً
+    """
+    try:
+        cache.incr(DASHBOARD_EPOCH_KEY)
+    except ValueError:
+        cache.set(DASHBOARD_EPOCH_KEY, time.time_ns(), None)
@@ -0,0 +1,184 @@
+"""
+التقرير اليومي للإدارة العليا
+
+- يُحسب مرة واحدة يومياً ويُحفظ في DailyReportSnapshot (بيانات منظمة + HTML + نص)
+- الإحصائيات العامة في استعلام تجميع واحد، وأرقام يوم أمس كاملاً من الجدول المجمّع TicketDailyStat
+  (التقرير يُرسل صباحاً، فاليوم الجاري لم يكتمل بعد)
+- ترتيب الموظفين من استعلام واحد مقيد بأدوار الموظفين بدلاً من تجميع كل المستخدمين مرتين
+- البريد يُرسل عبر صندوق البريد الصادر (دفعة واحدة على اتصال SMTP واحد)،
+  وصفحة التقرير في الواجهة تعرض اللقطة المحفوظة دون إعادة الحساب
+- اللقطات تبقى لكل الأيام فيُقارن كل تقرير بالذي قبله
+"""
+import logging
+from datetime import timedelta
+
+from django.db.models import Count, Q
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from accounts.models import CustomUser, Department
+from notifications.models import EmailOutbox
+from .metrics import employee_performance, rollup_totals
+from .models import DailyReportSnapshot, Ticket, TicketDailyStat
+from .sla import OPEN_STATUSES
+
+logger = logging.getLogger('celery')
+
+REPORT_ROLES = ['president', 'dean', 'admin', 'admin_assistant', 'academic_assistant']
+STAFF_ROLES = ['employee', 'head']
+
+TREND_LABELS = {
+    'total': '📌 إجمالي الطلبات',
+    'new_yesterday': '🆕 طلبات جديدة أمس',
+    'resolved_yesterday': '✅ طلبات محلولة أمس',
+    'violated': '⚠️ طلبات مخالفة (تجاوزت المهلة)',
+    'pending': '⏳ طلبات معلقة',
+}
+
+TOP_COUNT = 5
+BEST_MIN_ASSIGNED = 5
+
+
+def _employee(user, **counts):
+    return {
+        'name': user.get_full_name() or user.username,
+        'department': user.department.name if user.department else 'بدون قسم',
+        **counts,
+    }
+
+
+def compute_report(now=None):
+    """
+    حساب بيانات التقرير (قابلة للحفظ JSON)
+    """
+    now = now or timezone.now()
+
+    totals = Ticket.objects.aggregate(
+        total=Count('pk'),
+        violated=Count('pk', filter=Q(status='violated')),
+        pending=Count('pk', filter=Q(status__in=OPEN_STATUSES)),
+    )
+
+    # أرقام يوم أمس (يوم محلي كامل) من الجدول المجمّع
+    TicketDailyStat.refresh(now)
+    yesterday = timezone.localdate(now) - timedelta(days=1)
+    recent = rollup_totals(yesterday, yesterday)
+    totals['new_yesterday'] = recent['total']
+    totals['resolved_yesterday'] = recent['resolved']
+
+    departments = Department.objects.annotate(
+        violated_count=Count('tickets', filter=Q(tickets__status='violated')),
+        pending_count=Count('tickets', filter=Q(tickets__status__in=OPEN_STATUSES)),
+    ).order_by('-violated_count', 'pk')[:TOP_COUNT]
+
+    # الأقل استجابة والمتميزون من استعلام واحد على الموظفين فقط
+    employees = list(
+        employee_performance(None, (
+            ('violated_count', 'violated_count'),
+            ('resolved_count', 'resolved_count'),
+            ('total_assigned', 'created_count'),
+        )).filter(role__in=STAFF_ROLES)
+        .filter(Q(violated_count__gt=0) | Q(total_assigned__gte=BEST_MIN_ASSIGNED))
+        .order_by('pk')
+    )
+    worst = sorted(
+        (user for user in employees if user.violated_count > 0), key=lambda user: -user.violated_count
+    )[:TOP_COUNT]
+    best = sorted(
+        (user for user in employees if user.total_assigned >= BEST_MIN_ASSIGNED),
+        key=lambda user: -user.resolved_count,
+    )[:TOP_COUNT]
+
+    return {
+        'day': timezone.localdate(now).isoformat(),
+        'totals': totals,
+        'departments': [
+            {'name': dept.name, 'violated': dept.violated_count, 'pending': dept.pending_count}
+            for dept in departments
+        ],
+        'worst_employees': [_employee(user, violated=user.violated_count) for user in worst],
+        'best_employees': [_employee(user, resolved=user.resolved_count) for user in best],
+    }
+
+
+def report_text(data, trend):
+    """نص التقرير للبريد"""
+    lines = [
+        '📊 تقرير أداء نظام الطلبات اليومي',
+        f"التاريخ: {data['day']}",
+        '',
+        '=== الإحصائيات العامة ===',
+    ]
+    for key, value, delta in trend:
+        change = f' ({delta:+d} عن التقرير السابق)' if delta else ''
+        lines.append(f'{TREND_LABELS[key]}: {value}{change}')
+
+    lines += ['', '=== الأقسام الأكثر تأخيراً ===']
+    lines += [
+        f"🔴 {dept['name']}: {dept['violated']} طلب مخالف, {dept['pending']} طلب معلق"
+        for dept in data['departments']
+    ]
+    lines += ['', '=== الموظفون الأقل استجابة ===']
+    lines += [
+        f"⚠️ {emp['name']} ({emp['department']}): {emp['violated']} طلب مخالف"
+        for emp in data['worst_employees']
+    ]
+    lines += ['', '=== الموظفون المتميزون ===']
+    lines += [
+        f"⭐ {emp['name']} ({emp['department']}): {emp['resolved']} طلب محلول"
+        for emp in data['best_employees']
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+def labelled_trend(trend):
+    """الاتجاه مع عناوين العرض للقوالب"""
+    return [
+        {'key': key, 'label': TREND_LABELS[key], 'value': value, 'delta': delta}
+        for key, value, delta in trend
+    ]
+
+
+def build_snapshot(now=None):
+    """
+    حساب تقرير اليوم وحفظه (يستبدل لقطة اليوم نفسه إن وُجدت) - يعيد اللقطة
+    """
+    now = now or timezone.now()
+    day = timezone.localdate(now)
+    data = compute_report(now)
+
+    snapshot = DailyReportSnapshot(day=day, generated_at=now, data=data)
+    previous = snapshot.previous()
+    trend = snapshot.trend(previous)
+    snapshot.text = report_text(data, trend)
+    snapshot.html = render_to_string('emails/daily_report.html', {
+        'data': data,
+        'trend': labelled_trend(trend),
+        'previous_day': previous.day if previous else None,
+    })
+
+    snapshot, _ = DailyReportSnapshot.objects.update_or_create(day=day, defaults={
+        'generated_at': now, 'data': data, 'html': snapshot.html, 'text': snapshot.text,
+    })
+    return snapshot
+
+
+def deliver_snapshot(snapshot):
+    """
+    إرسال اللقطة للإدارة العليا (رسالة مستقلة لكل مستلم بنسختي النص و HTML) - يعيد عدد المستلمين
+    """
+    recipients = list(
+        CustomUser.objects.filter(role__in=REPORT_ROLES, is_active=True)
+        .exclude(email='').values_list('email', flat=True)
+    )
+    EmailOutbox.enqueue(
+        subject=f'📊 تقرير أداء نظام الطلبات - {snapshot.day:%Y-%m-%d}',
+        body=snapshot.text,
+        html_body=snapshot.html,
+        recipients=recipients,
+        separately=True,
+    )
+    DailyReportSnapshot.objects.filter(pk=snapshot.pk).update(recipients_count=len(recipients))
+    snapshot.recipients_count = len(recipients)
+    logger.info(f'Daily report {snapshot.day} queued for {len(recipients)} recipients')
+    return len(recipients)
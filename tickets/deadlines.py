@@ -0,0 +1,217 @@
+"""
+جدولة مواعيد SLA بدقة الثواني بدلاً من الفحص الدوري
+
+- عند تعيين sla_deadline أو تغييره (أو إعادة فتح الطلب) تُجدول مهمة Celery بموعد ETA
+  يساوي المهلة نفسها، فيُكتشف التجاوز خلال ثوانٍ من حدوثه
+- المهام ذات ETA البعيد تبقى في ذاكرة العامل ويعيد Redis تسليمها بعد visibility_timeout،
+  لذا لا تُجدول إلا المواعيد الواقعة خلال SLA_TIMER_HORIZON ثانية؛ والأبعد يسلّحها
+  فحص الاسترداد الدوري عندما تقترب (استعلام نطاق على فهرس (status, sla_deadline))
+- لا حاجة لإلغاء المؤقت: المهمة تتحقق عند التنفيذ أن الطلب ما زال مفتوحاً وأن مهلته لم تتغير،
+  وإلا فهي مؤقت قديم (حُل الطلب أو أُغلق أو أُرجع أو تغيرت المهلة) فتنتهي دون عمل
+- فحص الاسترداد (check_sla_violations) يبقى لالتقاط أي مؤقت فُقد (عامل متوقف، وسيط غير متاح)
+
+تحذيرات اقتراب المهلة تعتمد على حالة محفوظة في الطلب (warning_stage = عدد العتبات المرسلة)،
+فكل تشغيل يختار فقط الطلبات التي عبرت عتبتها التالية منذ التشغيل السابق، ويُرسل كل تحذير مرة واحدة
+مهما كان توقيت التشغيل.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .cache_utils import incr_counter
+from .models import MetricCounter, Ticket
+from notifications.models import EmailOutbox
+from .sla import OPEN_STATUSES, process_sla_violations
+
+logger = logging.getLogger('celery')
+
+TIMER_KEY = 'sla_timer_{ticket_id}_{deadline}'
+
+# دقائق قبل المهلة لكل أولوية (الافتراضي إذا لم يُحدد SLA_WARNING_THRESHOLDS)
+DEFAULT_WARNING_THRESHOLDS = {'default': [120, 30]}
+
+
+def timer_horizon():
+    return getattr(settings, 'SLA_TIMER_HORIZON', 1800)
+
+
+def schedule_deadline(ticket_id, deadline, now=None):
+    """
+    جدولة مؤقت مهلة الطلب إن كانت خلال الأفق - يعيد True إذا جُدولت مهمة جديدة
+    المؤقت نفسه لا يُجدول مرتين (مفتاح في الذاكرة المؤقتة لكل طلب ومهلة)
+    """
+    from .tasks import fire_sla_deadline
+
+    now = now or timezone.now()
+    horizon = timer_horizon()
+    if deadline is None or (deadline - now).total_seconds() > horizon:
+        return False
+
+    key = TIMER_KEY.format(ticket_id=ticket_id, deadline=int(deadline.timestamp()))
+    if not cache.add(key, 1, horizon * 2):
+        return False
+    try:
+        fire_sla_deadline.apply_async((ticket_id, deadline.isoformat()), eta=max(deadline, now))
+    except Exception as e:
+        # الوسيط غير متاح: فحص الاسترداد سيلتقط الطلب
+        cache.delete(key)
+        logger.error(f'Could not schedule SLA timer for ticket #{ticket_id}: {e}')
+        return False
+    incr_counter('sla_timer_scheduled')
+    return True
+
+
+def arm_upcoming_deadlines(now=None):
+    """
+    جدولة مؤقتات الطلبات المفتوحة التي تقع مهلتها خلال الأفق - يعيد عدد المؤقتات الجديدة
+    """
+    now = now or timezone.now()
+    upcoming = Ticket.objects.filter(
+        status__in=OPEN_STATUSES,
+        sla_deadline__gte=now,
+        sla_deadline__lte=now + timedelta(seconds=timer_horizon()),
+    ).values_list('pk', 'sla_deadline')
+    return sum(schedule_deadline(ticket_id, deadline, now) for ticket_id, deadline in upcoming)
+
+
+def fire_deadline(ticket_id, deadline, now=None):
+    """
+    تنفيذ مؤقت مهلة طلب واحد - يعيد عدد الطلبات المخالفة (0 أو 1)
+    """
+    now = now or timezone.now()
+    deadline = parse_datetime(deadline) if isinstance(deadline, str) else deadline
+    current = Ticket.objects.filter(pk=ticket_id).values_list('status', 'sla_deadline').first()
+    if current is None or current[0] not in OPEN_STATUSES or current[1] != deadline:
+        incr_counter('sla_timer_superseded')
+        return 0
+
+    # قد يبدأ العامل قبل المهلة بأجزاء من الثانية (فرق الساعات) فلا نترك الطلب للفحص الدوري
+    violated = process_sla_violations(
+        now=max(now, deadline + timedelta(microseconds=1)), ticket_ids=[ticket_id]
+    )['violated']
+    if violated:
+        latency_ms = max(int((now - deadline).total_seconds() * 1000), 0)
+        MetricCounter.incr('sla_timer_fired')
+        MetricCounter.incr('sla_timer_latency_ms', latency_ms)
+        logger.info(f'SLA timer for ticket #{ticket_id} fired {latency_ms}ms after the deadline')
+    return violated
+
+
+# ============================================
+# تحذيرات اقتراب المهلة
+# ============================================
+
+def warning_thresholds():
+    """
+    عتبات التحذير لكل أولوية بالدقائق، مرتبة من الأبعد إلى الأقرب من المهلة
+    """
+    configured = getattr(settings, 'SLA_WARNING_THRESHOLDS', DEFAULT_WARNING_THRESHOLDS)
+    default = configured.get('default', DEFAULT_WARNING_THRESHOLDS['default'])
+    return {
+        priority: sorted(configured.get(priority, default), reverse=True)
+        for priority, _ in Ticket.PRIORITY_CHOICES
+    }
+
+
+def warning_email(ticket, urgency, hours_left):
+    """
+    رسالة تحذير المهلة للمعين المباشر وجميع المعينين (غير محفوظة)
+    """
+    if urgency == 'urgent':
+        subject = f'🚨 تحذير عاجل: الطلب #{ticket.id} على وشك تجاوز المهلة'
+        message = f'''
+تحذير عاجل!
+
+الطلب التالي على وشك تجاوز المهلة خلال {hours_left * 60:.0f} دقيقة:
+
+العنوان: {ticket.title}
+الأولوية: {ticket.get_priority_display()}
+الموعد النهائي: {timezone.localtime(ticket.sla_deadline).strftime('%Y-%m-%d %H:%M')}
+
+يرجى اتخاذ الإجراء فوراً!
+        '''
+    else:
+        subject = f'⏰ تذكير: الطلب #{ticket.id} يقترب من المهلة'
+        message = f'''
+تذكير بالمهلة
+
+الطلب التالي يقترب من الموعد النهائي خلال {hours_left:.1f} ساعة:
+
+العنوان: {ticket.title}
+الأولوية: {ticket.get_priority_display()}
+الموعد النهائي: {timezone.localtime(ticket.sla_deadline).strftime('%Y-%m-%d %H:%M')}
+
+يرجى العمل على حل الطلب في أقرب وقت.
+        '''
+
+    recipients = [ticket.assigned_to.email] if ticket.assigned_to else []
+    recipients += [user.email for user in ticket.assigned_to_users.all()]
+    return EmailOutbox.build(subject=subject, body=message, recipients=recipients)
+
+
+def send_due_warnings(now=None):
+    """
+    إرسال تحذيرات العتبات التي عبرتها الطلبات المفتوحة منذ التشغيل السابق - يعيد عدد الطلبات
+    الاختيار نطاق واحد على الفهرس الجزئي ticket_open_sla_idx، ثم UPDATE لكل انتقال مرحلة
+    إذا عبر الطلب أكثر من عتبة بين تشغيلين (توقف المجدول مثلاً) يُرسل تحذير الأقرب فقط
+    """
+    now = now or timezone.now()
+    thresholds = warning_thresholds()
+    leads = [lead for priority_leads in thresholds.values() for lead in priority_leads]
+    if not leads:
+        return 0
+
+    # الطلب مستحق إذا عبرت المهلة عتبته التالية (العتبة رقم warning_stage لأولويته)
+    due = Q()
+    for priority, priority_leads in thresholds.items():
+        for stage, lead in enumerate(priority_leads):
+            due |= Q(priority=priority, warning_stage=stage, sla_deadline__lte=now + timedelta(minutes=lead))
+
+    warned = {}
+    with transaction.atomic():
+        tickets = Ticket.objects.select_for_update(
+            skip_locked=connection.features.has_select_for_update_skip_locked
+        ).filter(
+            due,
+            status__in=OPEN_STATUSES,
+            sla_deadline__gt=now,
+            sla_deadline__lte=now + timedelta(minutes=max(leads)),
+        ).order_by('sla_deadline').only('pk', 'priority', 'sla_deadline', 'warning_stage')
+
+        transitions = {}
+        for ticket in tickets:
+            minutes_left = (ticket.sla_deadline - now).total_seconds() / 60
+            stage = sum(1 for lead in thresholds[ticket.priority] if minutes_left <= lead)
+            transitions.setdefault((ticket.warning_stage, stage), []).append(ticket.pk)
+            warned[ticket.pk] = stage == len(thresholds[ticket.priority])
+
+        for (previous, stage), ticket_ids in transitions.items():
+            updated = Ticket.objects.filter(pk__in=ticket_ids, warning_stage=previous).update(
+                warning_stage=stage, last_warning_at=now,
+            )
+            if updated != len(ticket_ids):
+                # بدون أقفال صفوف قد يسبقنا تشغيل آخر: last_warning_at=now يميّز ما حدّثه هذا التشغيل
+                mine = set(Ticket.objects.filter(
+                    pk__in=ticket_ids, last_warning_at=now
+                ).values_list('pk', flat=True))
+                for ticket_id in set(ticket_ids) - mine:
+                    warned.pop(ticket_id)
+
+    if not warned:
+        return 0
+
+    messages = []
+    for ticket in Ticket.objects.filter(pk__in=warned).select_related('assigned_to').prefetch_related('assigned_to_users'):
+        hours_left = (ticket.sla_deadline - now).total_seconds() / 3600
+        # العتبة الأخيرة لأولوية الطلب تحذير عاجل، وما قبلها تذكير
+        messages.extend(warning_email(ticket, 'urgent' if warned[ticket.pk] else 'warning', hours_left))
+    EmailOutbox.enqueue_many(messages)
+    incr_counter('sla_warnings_sent', len(warned))
+    logger.info(f'Deadline warnings sent for {len(warned)} tickets ({len(messages)} emails)')
+    return len(warned)
@@ -0,0 +1,181 @@
+"""
+تنفيذ منفرد (single-flight) للمهام الدورية بعقد مؤقت (lease) في قاعدة البيانات
+
+مع أكثر من عامل Celery أو أكثر من نسخة beat قد تعمل نفس المهمة مرتين في الوقت نفسه،
+أو يتداخل تشغيل بطيء مع النبضة التالية، فتُعالج نفس الطلبات مرتين.
+
+- الحصول على العقد: UPDATE شرطي واحد (العقد حر أو منتهي الصلاحية) - ذري في أي محرك
+- التجديد: المهام الطويلة تستدعي heartbeat() بين الدفعات فيُمدَّد العقد ttl ثانية أخرى
+- الانتهاء: عامل توقف فجأة يفقد العقد بعد ttl ثانية فيستلمه غيره؛ وإذا عاد للعمل بعدها
+  يرفع heartbeat() استثناء LeaseLost فيتوقف بدل أن يكمل بالتوازي مع الحامل الجديد
+- التشغيل المتداخل يُتخطى ويُسجل سببه في TaskLease؛ ومع coalesce=True يُطلب من الحامل
+  إعادة التشغيل مرة واحدة بعد انتهائه بدلاً من ضياع النبضة
+
+العقد في قاعدة البيانات وليس في الذاكرة المؤقتة: ذاكرة LocMem منفصلة لكل عملية فلا تصلح قفلاً بين العمال.
+"""
+import functools
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .cache_utils import incr_counter
+from .models import TaskLease
+
+logger = logging.getLogger('celery')
+
+_local = threading.local()
+
+
+class LeaseLost(Exception):
+    """انتهى العقد دون تجديد واستلمه عامل آخر"""
+
+
+def _lease_ttl(ttl):
+    return ttl or getattr(settings, 'TASK_LEASE_TTL', 300)
+
+
+def acquire(name, ttl=None, now=None):
+    """
+    محاولة الحصول على عقد المهمة - يعيد معرف الحامل أو None إذا كان العقد محجوزاً
+    """
+    now = now or timezone.now()
+    owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+    lease = {
+        'owner': owner,
+        'acquired_at': now,
+        'heartbeat_at': now,
+        'expires_at': now + timedelta(seconds=_lease_ttl(ttl)),
+        'rerun_requested': False,
+    }
+    if TaskLease.objects.filter(name=name).filter(
+        Q(owner='') | Q(expires_at__lt=now)
+    ).update(**lease):
+        return owner
+    try:
+        # أول تشغيل للمهمة: لا يوجد صف بعد
+        with transaction.atomic():
+            TaskLease.objects.create(name=name, **lease)
+        return owner
+    except IntegrityError:
+        return None
+
+
+def renew(name, owner, ttl=None):
+    """تمديد العقد - يعيد False إذا لم يعد هذا العامل حامله"""
+    now = timezone.now()
+    return bool(TaskLease.objects.filter(name=name, owner=owner).update(
+        heartbeat_at=now, expires_at=now + timedelta(seconds=_lease_ttl(ttl)),
+    ))
+
+
+def finish(name, owner, started, ttl=None):
+    """
+    تحرير العقد بعد انتهاء التشغيل
+    يعيد True إذا طلب تشغيل متداخل إعادة التشغيل (coalesce) فيبقى العقد مع هذا العامل
+    """
+    now = timezone.now()
+    released = TaskLease.objects.filter(name=name, owner=owner, rerun_requested=False).update(
+        owner='',
+        expires_at=None,
+        last_finished_at=now,
+        last_duration_ms=int((time.monotonic() - started) * 1000),
+    )
+    if released:
+        return False
+    # إما طُلب تشغيل مؤجل أو فُقد العقد
+    return bool(TaskLease.objects.filter(name=name, owner=owner).update(
+        rerun_requested=False, heartbeat_at=now,
+        expires_at=now + timedelta(seconds=_lease_ttl(ttl)),
+    ))
+
+
+def release(name, owner):
+    """تحرير العقد بعد فشل التشغيل (دون طلب إعادة)"""
+    TaskLease.objects.filter(name=name, owner=owner).update(owner='', expires_at=None, rerun_requested=False)
+
+
+def record_skip(name, coalesce=False, now=None):
+    """
+    تسجيل تخطي تشغيل متداخل وسببه - يعيد السبب
+    """
+    now = now or timezone.now()
+    holder = TaskLease.objects.filter(name=name).values('owner', 'acquired_at', 'expires_at').first()
+    if holder and holder['owner']:
+        reason = (
+            f"يعمل لدى {holder['owner']} منذ {timezone.localtime(holder['acquired_at']):%H:%M:%S} "
+            f"حتى {timezone.localtime(holder['expires_at']):%H:%M:%S}"
+        )
+    else:
+        reason = 'تم الحجز من عامل آخر في اللحظة نفسها'
+    if coalesce:
+        reason += ' - سيُعاد التشغيل بعد انتهائه'
+    update = {'skip_count': F('skip_count') + 1, 'last_skip_reason': reason[:255], 'last_skipped_at': now}
+    if coalesce:
+        update['rerun_requested'] = True
+    TaskLease.objects.filter(name=name).update(**update)
+    incr_counter('task_lease_skipped')
+    return reason
+
+
+def heartbeat():
+    """
+    تجديد عقد المهمة الجارية في هذه العملية (إن وُجدت) - يُستدعى بين دفعات المعالجة الطويلة
+    التجديد الفعلي مرة كل ثلث ttl على الأكثر، ويرفع LeaseLost إذا استلم عامل آخر العقد
+    """
+    lease = getattr(_local, 'lease', None)
+    if lease is None:
+        return
+    if time.monotonic() - lease['renewed'] < lease['ttl'] / 3:
+        return
+    if not renew(lease['name'], lease['owner'], lease['ttl']):
+        raise LeaseLost(lease['name'])
+    lease['renewed'] = time.monotonic()
+
+
+def single_flight(name=None, ttl=None, coalesce=False):
+    """
+    مزخرف لمهمة دورية: تشغيل واحد فقط في كل لحظة عبر كل العمال
+    التشغيل المتداخل يعيد نص "تم التخطي" مع السبب بدلاً من التنفيذ
+    """
+    def decorator(func):
+        lease_name = name or f'{func.__module__}.{func.__name__}'
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            lease_ttl = _lease_ttl(ttl)
+            owner = acquire(lease_name, lease_ttl)
+            if owner is None:
+                reason = record_skip(lease_name, coalesce)
+                logger.warning(f'Skipped {lease_name}: {reason}')
+                return f'تم التخطي: {reason}'
+
+            previous = getattr(_local, 'lease', None)
+            _local.lease = {'name': lease_name, 'owner': owner, 'ttl': lease_ttl, 'renewed': time.monotonic()}
+            started = time.monotonic()
+            try:
+                while True:
+                    result = func(*args, **kwargs)
+                    if not finish(lease_name, owner, started, lease_ttl):
+                        return result
+                    logger.info(f'Re-running {lease_name} for a coalesced invocation')
+                    started = time.monotonic()
+            except LeaseLost:
+                logger.error(f'{lease_name} lost its lease to another worker - stopped')
+                return 'تم الإيقاف: انتقل العقد إلى عامل آخر'
+            except Exception:
+                release(lease_name, owner)
+                raise
+            finally:
+                _local.lease = previous
+
+        return wrapper
+    return decorator
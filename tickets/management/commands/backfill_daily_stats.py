@@ -0,0 +1,62 @@
+"""
+تعبئة جدول الإحصائيات اليومية (TicketDailyStat) بالبيانات التاريخية
+يُستخدم بعد الترحيل لأول مرة، أو لإصلاح أي انحراف عن جدول الطلبات
+"""
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+
+from accounts.models import PenaltyPoints
+from tickets.models import RollupWatermark, Ticket, TicketDailyStat
+
+
+class Command(BaseCommand):
+    help = 'إعادة حساب الإحصائيات اليومية المجمّعة لفترة تاريخية'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            help='عدد الأيام الأخيرة المطلوب إعادة حسابها (الافتراضي: منذ أول طلب)',
+        )
+        parser.add_argument(
+            '--from-date',
+            help='إعادة الحساب ابتداءً من تاريخ محدد (YYYY-MM-DD)',
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        today = timezone.localdate(now)
+
+        if options['from_date']:
+            try:
+                first_day = date.fromisoformat(options['from_date'])
+            except ValueError:
+                raise CommandError('صيغة التاريخ غير صحيحة، استخدم YYYY-MM-DD')
+        elif options['days']:
+            first_day = today - timedelta(days=options['days'] - 1)
+        else:
+            earliest = [
+                value for value in (
+                    Ticket.objects.aggregate(first=Min('created_at'))['first'],
+                    PenaltyPoints.objects.aggregate(first=Min('created_at'))['first'],
+                ) if value
+            ]
+            first_day = timezone.localdate(min(earliest)) if earliest else today
+
+        dates = [first_day + timedelta(days=offset) for offset in range((today - first_day).days + 1)]
+        self.stdout.write(f'🔄 إعادة حساب {len(dates)} يوم ابتداءً من {first_day}...')
+
+        total_rows = 0
+        for start in range(0, len(dates), 30):
+            chunk = dates[start:start + 30]
+            total_rows += TicketDailyStat.rebuild_dates(chunk)
+            self.stdout.write(f'  • {chunk[-1]}')
+
+        # التحديث التزايدي يبدأ من لحظة بدء التعبئة
+        RollupWatermark.objects.update_or_create(
+            name=TicketDailyStat.WATERMARK_NAME, defaults={'value': now}
+        )
+        self.stdout.write(self.style.SUCCESS(f'✅ تم إنشاء {total_rows} صف في الجدول المجمّع'))
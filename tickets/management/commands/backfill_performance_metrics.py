@@ -0,0 +1,57 @@
+"""
+تعبئة السلسلة الزمنية لمقاييس الأداء (PerformanceMetricPoint) بالبيانات التاريخية
+يُستخدم بعد الترحيل لأول مرة بدلاً من ترك المهمة الدورية تلحق بالتاريخ على دفعات
+"""
+from datetime import date, datetime, time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+
+from tickets.models import PerformanceMetricPoint, Ticket
+
+
+class Command(BaseCommand):
+    help = 'إعادة حساب السلسلة الزمنية لمقاييس الأداء لفترة تاريخية'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            help='عدد الأيام الأخيرة المطلوب إعادة حسابها (الافتراضي: منذ أول طلب)',
+        )
+        parser.add_argument(
+            '--from-date',
+            help='إعادة الحساب ابتداءً من تاريخ محدد (YYYY-MM-DD)',
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        today = timezone.localdate(now)
+
+        if options['from_date']:
+            try:
+                first_day = date.fromisoformat(options['from_date'])
+            except ValueError:
+                raise CommandError('صيغة التاريخ غير صحيحة، استخدم YYYY-MM-DD')
+        elif options['days']:
+            first_day = today - timedelta(days=options['days'] - 1)
+        else:
+            earliest = Ticket.objects.aggregate(first=Min('created_at'))['first']
+            first_day = timezone.localdate(earliest) if earliest else today
+
+        since = timezone.make_aware(datetime.combine(first_day, time.min))
+        self.stdout.write(f'🔄 إعادة حساب مقاييس الأداء ابتداءً من {first_day}...')
+
+        # دفعات بحجم حد المهمة الدورية، كل دفعة تكمل من العلامة المائية التي تركتها سابقتها
+        batch = PerformanceMetricPoint.fill(now, since=since)
+        total_buckets, total_points = batch
+        while batch[0] >= PerformanceMetricPoint.max_buckets_per_run():
+            batch = PerformanceMetricPoint.fill(now)
+            total_buckets += batch[0]
+            total_points += batch[1]
+            self.stdout.write(f'  • {total_buckets} فترة')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ تم حساب {total_buckets} فترة ({total_points} نقطة) في السلسلة الزمنية'
+        ))
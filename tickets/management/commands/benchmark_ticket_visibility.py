@@ -0,0 +1,163 @@
+"""
+مقارنة أداء فلترة الطلبات حسب الدور: الشكل القديم (OR + JOIN + DISTINCT)
+مقابل Ticket.objects.visible_to (id IN UNION من جدول الجمهور)
+
+تُنشأ بيانات تجريبية كبيرة داخل معاملة يتم التراجع عنها في النهاية،
+فلا تتأثر قاعدة البيانات الفعلية.
+"""
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from accounts.models import CustomUser, Department
+from tickets.models import Ticket, TicketAudience
+
+
+class _Rollback(Exception):
+    """للتراجع عن البيانات التجريبية بعد انتهاء القياس"""
+
+
+class Command(BaseCommand):
+    help = 'مقارنة خطط التنفيذ والتوقيت بين فلترة الرؤية القديمة و visible_to على بيانات تجريبية'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=500, help='عدد المستخدمين التجريبيين')
+        parser.add_argument('--tickets', type=int, default=50000, help='عدد الطلبات التجريبية')
+        parser.add_argument('--departments', type=int, default=20, help='عدد الأقسام التجريبية')
+        parser.add_argument('--repeat', type=int, default=5, help='عدد مرات تكرار كل استعلام')
+        parser.add_argument('--seed', type=int, default=42, help='بذرة التوليد العشوائي')
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        try:
+            with transaction.atomic():
+                samples = self._generate(options)
+                self._compare(samples, options['repeat'])
+                raise _Rollback
+        except _Rollback:
+            self.stdout.write('🧹 تم التراجع عن البيانات التجريبية')
+
+    def _generate(self, options):
+        started = time.perf_counter()
+        now = timezone.now()
+        tag = f'bench{int(now.timestamp())}'
+
+        departments = Department.objects.bulk_create([
+            Department(name=f'{tag}-قسم-{i}')
+            for i in range(options['departments'])
+        ])
+
+        roles = ['employee'] * 8 + ['head', 'dean']
+        CustomUser.objects.bulk_create([
+            CustomUser(
+                username=f'{tag}-user-{i}',
+                role=random.choice(roles),
+                department=random.choice(departments),
+            )
+            for i in range(options['users'])
+        ])
+        users = list(CustomUser.objects.filter(username__startswith=f'{tag}-'))
+
+        statuses = [s for s, _ in Ticket.STATUS_CHOICES]
+        priorities = [p for p, _ in Ticket.PRIORITY_CHOICES]
+        Ticket.objects.bulk_create([
+            Ticket(
+                title=f'{tag} طلب {i}',
+                description='-',
+                priority=random.choice(priorities),
+                status=random.choice(statuses),
+                created_by=random.choice(users),
+                assigned_to=random.choice(users) if random.random() < 0.7 else None,
+                department=random.choice(departments),
+                sla_deadline=now + timedelta(hours=random.randint(-72, 72)),
+            )
+            for i in range(options['tickets'])
+        ], batch_size=1000)
+        ticket_ids = list(
+            Ticket.objects.filter(title__startswith=f'{tag} ').values_list('id', flat=True)
+        )
+
+        Ticket.assigned_to_users.through.objects.bulk_create([
+            Ticket.assigned_to_users.through(ticket_id=ticket_id, customuser_id=user.id)
+            for ticket_id in ticket_ids if random.random() < 0.3
+            for user in random.sample(users, 2)
+        ], batch_size=1000, ignore_conflicts=True)
+        Ticket.departments.through.objects.bulk_create([
+            Ticket.departments.through(ticket_id=ticket_id, department_id=department.id)
+            for ticket_id in ticket_ids if random.random() < 0.3
+            for department in random.sample(departments, 2)
+        ], batch_size=1000, ignore_conflicts=True)
+
+        for start in range(0, len(ticket_ids), 1000):
+            TicketAudience.rebuild_for_tickets(ticket_ids[start:start + 1000])
+
+        self.stdout.write(
+            f'📦 {len(users)} مستخدم، {len(ticket_ids)} طلب، '
+            f'{TicketAudience.objects.count()} صف جمهور '
+            f'({time.perf_counter() - started:.1f} ث)'
+        )
+
+        samples = []
+        for role in ('employee', 'head', 'dean'):
+            candidates = [u for u in users if u.role == role]
+            if candidates:
+                samples.append(random.choice(candidates))
+        return samples
+
+    @staticmethod
+    def _legacy_queryset(user):
+        """الشكل القديم للفلترة كما كان منسوخاً في العروض"""
+        if user.role == 'employee':
+            legacy = Q(assigned_to=user) | Q(assigned_to_users=user) | Q(created_by=user)
+            if user.department:
+                legacy |= Q(departments=user.department)
+        else:
+            legacy = (
+                Q(department=user.department) | Q(departments=user.department) |
+                Q(assigned_to=user) | Q(assigned_to_users=user)
+            )
+        return Ticket.objects.filter(legacy).distinct()
+
+    def _time(self, queryset, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            count = queryset.count()
+            list(queryset.values_list('id', flat=True)[:50])
+            timings.append((time.perf_counter() - started) * 1000)
+        return count, statistics.median(timings)
+
+    def _compare(self, samples, repeat):
+        for user in samples:
+            legacy = self._legacy_queryset(user)
+            current = Ticket.objects.visible_to(user)
+
+            legacy_count, legacy_ms = self._time(legacy, repeat)
+            current_count, current_ms = self._time(current, repeat)
+
+            self.stdout.write(self.style.MIGRATE_HEADING(f'\n👤 {user.username} ({user.role})'))
+            if legacy_count != current_count:
+                self.stdout.write(self.style.WARNING(
+                    f'  ⚠️ اختلاف في النتائج: القديم {legacy_count} / الجديد {current_count}'
+                ))
+            self.stdout.write(f'  القديم : {legacy_count} طلب — الوسيط {legacy_ms:.2f} ms')
+            self.stdout.write(f'  الجديد : {current_count} طلب — الوسيط {current_ms:.2f} ms')
+            if current_ms:
+                self.stdout.write(f'  التسريع: x{legacy_ms / current_ms:.1f}')
+
+            self.stdout.write('  خطة التنفيذ (القديم):')
+            self.stdout.write(self._indent(legacy.explain()))
+            self.stdout.write('  خطة التنفيذ (الجديد):')
+            self.stdout.write(self._indent(current.explain()))
+
+        self.stdout.write(f'\nقاعدة البيانات: {connection.vendor}')
+
+    @staticmethod
+    def _indent(plan):
+        return '\n'.join(f'    {line}' for line in plan.splitlines())
@@ -0,0 +1,73 @@
+"""
+عمق كل طابور Celery (TASK_QUEUES) وعمر أقدم رسالة فيه
+العمر يُقرأ من رأس published_at الذي يضيفه uni_core.celery عند النشر (متاح مع وسيط Redis)
+"""
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from kombu.exceptions import OperationalError
+
+from uni_core.celery import app, queue_config
+
+
+def oldest_message_age(channel, queue, now):
+    """
+    عمر أقدم رسالة بالثواني عبر كل درجات الأولوية (Redis فقط، وإلا None)
+    Redis يضيف الرسائل من اليسار ويسحبها من اليمين، فالأقدم آخر عنصر في كل قائمة
+    """
+    if not hasattr(channel, 'conn_or_acquire'):
+        return None
+    published = []
+    with channel.conn_or_acquire() as client:
+        for priority in channel.priority_steps:
+            raw = client.lindex(channel._q_for_pri(queue, priority), -1)
+            if raw:
+                headers = json.loads(raw).get('headers') or {}
+                if headers.get('published_at'):
+                    published.append(headers['published_at'])
+    return round(now - min(published), 1) if published else None
+
+
+class Command(BaseCommand):
+    help = 'عرض عدد الرسائل المنتظرة وعمر أقدمها لكل طابور Celery'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='إخراج النتيجة بصيغة JSON (للمراقبة الآلية)',
+        )
+
+    def handle(self, *args, **options):
+        now = time.time()
+        result = {}
+        connection = app.connection_for_read()
+        try:
+            with connection:
+                connection.ensure_connection(max_retries=1)
+                channel = connection.default_channel
+                for name in queue_config():
+                    try:
+                        depth = channel.queue_declare(queue=name, passive=True).message_count
+                    except connection.channel_errors:
+                        # الطابور لم يُنشأ بعد (لم تُنشر إليه أي مهمة)
+                        channel = connection.channel()
+                        depth = 0
+                    result[name] = {
+                        'depth': depth,
+                        'oldest_age_seconds': oldest_message_age(channel, name, now) if depth else None,
+                    }
+        except (OperationalError, *connection.connection_errors) as e:
+            raise CommandError(f'تعذّر الاتصال بوسيط Celery: {e}')
+
+        if options['json']:
+            self.stdout.write(json.dumps(result))
+            return
+
+        for name, stats in result.items():
+            age = stats['oldest_age_seconds']
+            self.stdout.write(
+                f"  • {name}: {stats['depth']} رسالة"
+                + (f'، أقدمها منذ {age:.0f} ثانية' if age is not None else '')
+            )
@@ -0,0 +1,48 @@
+"""
+إعادة تعيين الطلبات المتأخرة حسب عبء العمل (نفس مسار المهمة الدورية auto_reassign_tickets)
+--dry-run يعرض التنقلات المقترحة وتوزيع العبء قبل وبعد دون أي تعديل
+"""
+from django.core.management.base import BaseCommand
+
+from accounts.models import Department
+from tickets.reassignment import apply_reassignments, plan_reassignments
+
+
+class Command(BaseCommand):
+    help = 'إعادة تعيين الطلبات المتأخرة للموظفين الأقل عبئاً في أقسامها'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='عرض الخطة فقط دون حفظ أي تغيير',
+        )
+
+    def handle(self, *args, **options):
+        plan = plan_reassignments()
+        if not plan.moves:
+            self.stdout.write('لا توجد طلبات تحتاج إعادة تعيين')
+            return
+
+        self.stdout.write(f'📋 {len(plan.moves)} طلب لإعادة التعيين:')
+        for ticket, old_assignee, new_assignee, new_load in plan.moves:
+            self.stdout.write(
+                f'  • #{ticket.pk} {ticket.title}: {old_assignee} → {new_assignee} (عبؤه يصبح {new_load})'
+            )
+
+        names = dict(Department.objects.values_list('pk', 'name'))
+        before, after = plan.spread(plan.load_before), plan.spread(plan.load_after)
+        self.stdout.write('\n📊 توزيع العبء لكل قسم (الأدنى / الأعلى / الانحراف المعياري):')
+        for department_id, spread in before.items():
+            self.stdout.write(
+                f'  • {names.get(department_id, "بلا قسم")}: '
+                f'{spread[0]}/{spread[1]}/{spread[2]} → '
+                f'{after[department_id][0]}/{after[department_id][1]}/{after[department_id][2]}'
+            )
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('\nمعاينة فقط - لم يُحفظ أي تغيير'))
+            return
+
+        count = apply_reassignments(plan)
+        self.stdout.write(self.style.SUCCESS(f'\n✅ تم إعادة تعيين {count} طلب'))
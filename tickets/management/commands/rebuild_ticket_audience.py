@@ -0,0 +1,47 @@
+"""
+إعادة بناء جدول جمهور الطلبات (TicketAudience) من البيانات الحالية
+يُستخدم بعد الترحيل لأول مرة، أو لإصلاح أي انحراف عن الجداول الأصلية
+"""
+from django.core.management.base import BaseCommand
+from tickets.models import Ticket, TicketAudience
+
+
+class Command(BaseCommand):
+    help = 'إعادة بناء جدول جمهور الطلبات (الرؤية حسب المستخدم) للبيانات الموجودة'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='عدد الطلبات في كل دفعة (الافتراضي 500)',
+        )
+        parser.add_argument(
+            '--ticket',
+            type=int,
+            action='append',
+            dest='ticket_ids',
+            help='إعادة بناء طلب محدد فقط (يمكن تكراره)',
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        ticket_ids = options['ticket_ids']
+
+        if ticket_ids:
+            queryset = Ticket.objects.filter(id__in=ticket_ids)
+        else:
+            queryset = Ticket.objects.all()
+            # حذف الصفوف اليتيمة لطلبات لم تعد موجودة (احتياطاً)
+            TicketAudience.objects.exclude(ticket_id__in=Ticket.objects.values('id')).delete()
+
+        ids = list(queryset.order_by('id').values_list('id', flat=True))
+        self.stdout.write(f'🔄 إعادة بناء جمهور {len(ids)} طلب...')
+
+        total_rows = 0
+        for start in range(0, len(ids), chunk_size):
+            chunk = ids[start:start + chunk_size]
+            total_rows += TicketAudience.rebuild_for_tickets(chunk)
+            self.stdout.write(f'  • {min(start + chunk_size, len(ids))}/{len(ids)}')
+
+        self.stdout.write(self.style.SUCCESS(f'✅ تم إنشاء {total_rows} صف في جدول الجمهور'))
@@ -0,0 +1,212 @@
+"""
+حسابات إحصائية مجمّعة للوحات التحكم والتقارير
+كل دالة تنفذ عدداً ثابتاً من الاستعلامات بغض النظر عن حجم البيانات أو طول الفترة
+"""
+from datetime import datetime, time, timedelta
+
+from django.db.models import (
+    Avg, Count, DurationField, ExpressionWrapper, F, FilteredRelation, Q, Sum,
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Ticket, TicketDailyStat
+
+
+def local_day_bounds(day):
+    """
+    بداية ونهاية اليوم بالتوقيت المحلي (Asia/Baghdad) كقيم aware
+    نستخدم نطاقات بدلاً من __date حتى تستفيد الاستعلامات من فهارس التواريخ
+    """
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(day, time.min), tz)
+    end = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min), tz)
+    return start, end
+
+
+def ticket_trend(days=7, now=None):
+    """
+    عدد الطلبات المنشأة والمحلولة والمنتهكة لكل يوم من آخر `days` يوماً - استعلام واحد
+    """
+    today = timezone.localdate(now)
+    day_list = [today - timedelta(days=offset) for offset in range(days - 1, -1, -1)]
+    bounds = [local_day_bounds(day) for day in day_list]
+    range_start, range_end = bounds[0][0], bounds[-1][1]
+
+    aggregates = {}
+    for index, (start, end) in enumerate(bounds):
+        created = Q(created_at__gte=start, created_at__lt=end)
+        aggregates[f'created_{index}'] = Count('id', filter=created)
+        aggregates[f'violated_{index}'] = Count('id', filter=created & Q(status='violated'))
+        aggregates[f'resolved_{index}'] = Count(
+            'id', filter=Q(resolved_at__gte=start, resolved_at__lt=end)
+        )
+
+    totals = Ticket.objects.filter(
+        Q(created_at__gte=range_start, created_at__lt=range_end) |
+        Q(resolved_at__gte=range_start, resolved_at__lt=range_end)
+    ).aggregate(**aggregates)
+
+    return [
+        {
+            'date': day.strftime('%Y-%m-%d'),
+            'created': totals[f'created_{index}'],
+            'resolved': totals[f'resolved_{index}'],
+            'violated': totals[f'violated_{index}'],
+        }
+        for index, day in enumerate(day_list)
+    ]
+
+
+def priority_breakdown(queryset=None):
+    """
+    توزيع الطلبات حسب الأولوية - استعلام GROUP BY واحد
+    """
+    queryset = Ticket.objects.all() if queryset is None else queryset
+    counts = dict(
+        queryset.order_by().values_list('priority').annotate(total=Count('id'))
+    )
+    return {priority: counts.get(priority, 0) for priority, _ in Ticket.PRIORITY_CHOICES}
+
+
+RESOLUTION_TIME = ExpressionWrapper(F('resolved_at') - F('created_at'), output_field=DurationField())
+
+
+def duration_seconds(value):
+    """
+    تحويل مدة من قاعدة البيانات إلى ثوانٍ
+    PostgreSQL يعيد timedelta، بينما قد يعيد SQLite عدد الميكروثواني كرقم
+    """
+    if value is None:
+        return 0
+    if isinstance(value, timedelta):
+        return int(value.total_seconds())
+    return int(float(value) / 1_000_000)
+
+
+def _to_hours(value):
+    """تحويل مدة من قاعدة البيانات إلى ساعات"""
+    if value is None:
+        return 0
+    if isinstance(value, timedelta):
+        return value.total_seconds() / 3600
+    return float(value) / 1_000_000 / 3600
+
+
+def _percentile(queryset, count, fraction):
+    """
+    قيمة النسبة المئوية بالترتيب داخل قاعدة البيانات (ORDER BY + OFFSET)
+    يُقرأ صف أو صفان فقط، فالذاكرة ثابتة مهما كان عدد الطلبات
+    """
+    position = (count - 1) * fraction
+    lower = int(position)
+    values = [
+        _to_hours(value) for value in
+        queryset.order_by('resolution_time').values_list('resolution_time', flat=True)[lower:lower + 2]
+    ]
+    if len(values) == 1 or position == lower:
+        return values[0]
+    # استيفاء خطي بين القيمتين المتجاورتين
+    return values[0] + (values[1] - values[0]) * (position - lower)
+
+
+def resolution_time_stats(queryset=None):
+    """
+    متوسط ووسيط و p90 لوقت الحل بالساعات - ثلاثة استعلامات كحد أقصى بغض النظر عن حجم البيانات
+    """
+    queryset = Ticket.objects.all() if queryset is None else queryset
+    resolved = queryset.filter(
+        status__in=['resolved', 'closed'],
+        resolved_at__isnull=False,
+    ).annotate(resolution_time=RESOLUTION_TIME)
+
+    totals = resolved.aggregate(count=Count('id'), avg=Avg('resolution_time'))
+    count = totals['count']
+    if not count:
+        return {'count': 0, 'avg': 0, 'median': 0, 'p90': 0}
+
+    return {
+        'count': count,
+        'avg': round(_to_hours(totals['avg']), 1),
+        'median': round(_percentile(resolved, count, 0.5), 1),
+        'p90': round(_percentile(resolved, count, 0.9), 1),
+    }
+
+
+# ============================================
+# القراءة من الجدول المجمّع TicketDailyStat
+# ============================================
+
+def rollup_start_day(period_days, now=None):
+    """أول يوم (بالتوقيت المحلي) في نافذة التقرير"""
+    now = now or timezone.now()
+    return timezone.localdate(now - timedelta(days=period_days))
+
+
+def _rollup_sums(prefix, *fields):
+    return {
+        name: Coalesce(Sum(f'{prefix}{field}'), 0)
+        for name, field in fields
+    }
+
+
+def _rollup_window(start_day):
+    """
+    علاقة daily_stats مقيدة بالنافذة داخل شرط JOIN نفسه
+    فيُقرأ من الجدول المجمّع صفوف النافذة فقط وليس كامل التاريخ
+    """
+    if start_day is None:
+        # كامل التاريخ
+        return FilteredRelation('daily_stats', condition=Q(daily_stats__date__isnull=False))
+    return FilteredRelation('daily_stats', condition=Q(daily_stats__date__gte=start_day))
+
+
+def rollup_totals(start_day, end_day=None):
+    """
+    مجاميع عامة للنافذة (start_day=None يعني كامل التاريخ، و end_day ضمنها إن حُدد):
+    المنشأة، المحلولة، المخالفة، المؤكدة، وأزمنة الاستجابة والحل
+    """
+    stats = TicketDailyStat.objects.all()
+    if start_day:
+        stats = stats.filter(date__gte=start_day)
+    if end_day:
+        stats = stats.filter(date__lte=end_day)
+    return stats.aggregate(**_rollup_sums(
+        '',
+        ('total', 'created_count'),
+        ('resolved', 'resolved_count'),
+        ('resolved_on_time', 'resolved_on_time_count'),
+        ('violated', 'violated_count'),
+        ('acknowledged', 'acknowledged_count'),
+        ('response_seconds', 'response_seconds'),
+        ('resolution_seconds', 'resolution_seconds'),
+    ))
+
+
+PERFORMANCE_FIELDS = (
+    ('total', 'created_count'),
+    ('resolved', 'resolved_count'),
+    ('violated', 'violated_count'),
+    ('penalty_points', 'penalty_points'),
+)
+
+PENALTY_FIELDS = (
+    ('total_points', 'penalty_points'),
+    ('penalty_count', 'penalty_count'),
+)
+
+
+def department_performance(start_day, fields=PERFORMANCE_FIELDS):
+    """الأقسام مع مجاميع النافذة من الجدول المجمّع"""
+    from accounts.models import Department
+    return Department.objects.annotate(window=_rollup_window(start_day)).annotate(
+        **_rollup_sums('window__', *fields)
+    )
+
+
+def employee_performance(start_day, fields=PERFORMANCE_FIELDS):
+    """المستخدمون مع مجاميع النافذة من الجدول المجمّع (كمعينين أو أصحاب جزاءات)"""
+    from accounts.models import CustomUser
+    return CustomUser.objects.select_related('department').annotate(
+        window=_rollup_window(start_day)
+    ).annotate(**_rollup_sums('window__', *fields))
@@ -1,8 +1,7 @@
 from django.shortcuts import redirect
 from django.urls import reverse
 from django.utils import timezone
-from django.db.models import Q
-from tickets.models import Ticket
+from tickets.cache_utils import has_pending_acknowledgments
 
 
 class ForceAcknowledgmentMiddleware:
@@ -33,16 +32,8 @@ class ForceAcknowledgmentMiddleware:
             return self.get_response(request)
         
         # التحقق من وجود طلبات غير مؤكدة (يشمل التعيين المباشر والمتعدد والقسم)
-        ack_filter = Q(assigned_to=request.user) | Q(assigned_to_users=request.user)
-        if getattr(request.user, 'department', None):
-            ack_filter |= Q(departments=request.user.department)
-        
-        unacknowledged_tickets = Ticket.objects.filter(
-            ack_filter,
-            status='pending_ack'
-        ).exclude(
-            acknowledgments__user=request.user
-        ).distinct().exists()
+        # العلم محفوظ في الذاكرة المؤقتة فلا يكلّف أي استعلام في الحالة المعتادة
+        unacknowledged_tickets = has_pending_acknowledgments(request.user)
         
         if unacknowledged_tickets:
             # إعادة التوجيه الإجباري لصفحة التأكيد
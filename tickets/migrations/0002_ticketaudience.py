@@ -0,0 +1,30 @@
+# Generated by Django 5.1 on 2026-10-16 22:25
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TicketAudience',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reason', models.CharField(choices=[('creator', 'منشئ الطلب'), ('assignee', 'المعين المباشر'), ('co_assignee', 'ضمن المعينين'), ('department', 'عضو في أحد الأقسام المعنية'), ('home_department', 'عضو في القسم الأساسي للطلب')], max_length=20, verbose_name='سبب الرؤية')),
+                ('ticket', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='audience', to='tickets.ticket', verbose_name='الطلب')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ticket_audience', to=settings.AUTH_USER_MODEL, verbose_name='المستخدم')),
+            ],
+            options={
+                'verbose_name': 'جمهور طلب',
+                'verbose_name_plural': 'جمهور الطلبات',
+                'unique_together': {('user', 'reason', 'ticket')},
+            },
+        ),
+    ]
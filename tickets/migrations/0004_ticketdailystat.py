@@ -0,0 +1,54 @@
+# Generated by Django 5.1 on 2026-10-16 22:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('tickets', '0003_ticket_resolved_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='الجدول')),
+                ('value', models.DateTimeField(verbose_name='آخر تحديث')),
+            ],
+            options={
+                'verbose_name': 'علامة مائية',
+                'verbose_name_plural': 'العلامات المائية',
+            },
+        ),
+        migrations.CreateModel(
+            name='TicketDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='اليوم')),
+                ('priority', models.CharField(blank=True, max_length=20, verbose_name='الأولوية')),
+                ('created_count', models.PositiveIntegerField(default=0, verbose_name='المنشأة')),
+                ('acknowledged_count', models.PositiveIntegerField(default=0, verbose_name='المؤكدة')),
+                ('resolved_count', models.PositiveIntegerField(default=0, verbose_name='المحلولة')),
+                ('resolved_on_time_count', models.PositiveIntegerField(default=0, verbose_name='المحلولة ضمن المهلة')),
+                ('violated_count', models.PositiveIntegerField(default=0, verbose_name='المخالفة')),
+                ('response_seconds', models.BigIntegerField(default=0, verbose_name='مجموع زمن الاستجابة (ثانية)')),
+                ('resolution_seconds', models.BigIntegerField(default=0, verbose_name='مجموع زمن الحل (ثانية)')),
+                ('penalty_points', models.IntegerField(default=0, verbose_name='النقاط الجزائية')),
+                ('penalty_count', models.PositiveIntegerField(default=0, verbose_name='عدد الجزاءات')),
+                ('assignee', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to=settings.AUTH_USER_MODEL, verbose_name='المعين')),
+                ('department', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='accounts.department', verbose_name='القسم')),
+            ],
+            options={
+                'verbose_name': 'إحصائية يومية',
+                'verbose_name_plural': 'الإحصائيات اليومية',
+                'indexes': [models.Index(fields=['date', 'assignee'], name='dailystat_date_assignee_idx')],
+                'unique_together': {('date', 'department', 'assignee', 'priority')},
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1 on 2026-10-16 23:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('tickets', '0004_ticketdailystat'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticket',
+            name='last_warning_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='آخر تحذير بالمهلة'),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='warning_stage',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='تحذيرات المهلة المرسلة'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(condition=models.Q(('status__in', ['new', 'pending_ack', 'in_progress'])), fields=['sla_deadline'], name='ticket_open_sla_idx'),
+        ),
+    ]
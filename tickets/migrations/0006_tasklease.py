@@ -0,0 +1,34 @@
+# Generated by Django 5.1 on 2026-10-16 23:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0005_ticket_warning_stage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskLease',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='المهمة')),
+                ('owner', models.CharField(blank=True, max_length=100, verbose_name='العامل الحامل للعقد')),
+                ('acquired_at', models.DateTimeField(blank=True, null=True, verbose_name='بداية التنفيذ')),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True, verbose_name='آخر تجديد')),
+                ('expires_at', models.DateTimeField(blank=True, null=True, verbose_name='انتهاء العقد')),
+                ('rerun_requested', models.BooleanField(default=False, verbose_name='تشغيل مؤجل مطلوب')),
+                ('last_finished_at', models.DateTimeField(blank=True, null=True, verbose_name='آخر انتهاء')),
+                ('last_duration_ms', models.PositiveIntegerField(blank=True, null=True, verbose_name='مدة آخر تنفيذ (ms)')),
+                ('skip_count', models.PositiveIntegerField(default=0, verbose_name='عدد مرات التخطي')),
+                ('last_skip_reason', models.CharField(blank=True, max_length=255, verbose_name='سبب آخر تخطٍ')),
+                ('last_skipped_at', models.DateTimeField(blank=True, null=True, verbose_name='آخر تخطٍ')),
+            ],
+            options={
+                'verbose_name': 'عقد مهمة دورية',
+                'verbose_name_plural': 'عقود المهام الدورية',
+            },
+        ),
+    ]
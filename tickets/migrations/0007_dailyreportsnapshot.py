@@ -0,0 +1,30 @@
+# Generated by Django 5.1 on 2026-10-16 23:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0006_tasklease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyReportSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True, verbose_name='اليوم')),
+                ('generated_at', models.DateTimeField(verbose_name='وقت الإنشاء')),
+                ('data', models.JSONField(default=dict, verbose_name='البيانات')),
+                ('html', models.TextField(blank=True, verbose_name='نص HTML')),
+                ('text', models.TextField(blank=True, verbose_name='النص')),
+                ('recipients_count', models.PositiveIntegerField(default=0, verbose_name='عدد المستلمين')),
+            ],
+            options={
+                'verbose_name': 'لقطة تقرير يومي',
+                'verbose_name_plural': 'لقطات التقارير اليومية',
+                'ordering': ['-day'],
+            },
+        ),
+    ]
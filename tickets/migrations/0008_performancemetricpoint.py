@@ -0,0 +1,30 @@
+# Generated by Django 5.1 on 2026-10-16 23:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0007_dailyreportsnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PerformanceMetricPoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(choices=[('response_hours', 'متوسط وقت الاستجابة (ساعة)'), ('resolution_hours', 'متوسط وقت الحل (ساعة)'), ('compliance_rate', 'نسبة الالتزام بالمهلة (%)')], max_length=30, verbose_name='المقياس')),
+                ('scope', models.CharField(default='all', max_length=50, verbose_name='النطاق')),
+                ('bucket_start', models.DateTimeField(verbose_name='بداية الفترة')),
+                ('value', models.FloatField(verbose_name='القيمة')),
+                ('sample_count', models.PositiveIntegerField(default=0, verbose_name='عدد العينات')),
+            ],
+            options={
+                'verbose_name': 'نقطة مقياس أداء',
+                'verbose_name_plural': 'نقاط مقاييس الأداء',
+                'ordering': ['metric', 'scope', 'bucket_start'],
+                'constraints': [models.UniqueConstraint(fields=('metric', 'scope', 'bucket_start'), name='metric_point_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.1 on 2026-10-16 23:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0008_performancemetricpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupDirtyDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, verbose_name='الجدول')),
+                ('date', models.DateField(verbose_name='اليوم')),
+            ],
+            options={
+                'verbose_name': 'يوم بحاجة لإعادة الحساب',
+                'verbose_name_plural': 'أيام بحاجة لإعادة الحساب',
+                'unique_together': {('name', 'date')},
+            },
+        ),
+    ]
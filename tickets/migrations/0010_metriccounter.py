@@ -0,0 +1,25 @@
+# Generated by Django 5.1 on 2026-10-17 00:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0009_rollupdirtyday'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetricCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='العدّاد')),
+                ('value', models.BigIntegerField(default=0, verbose_name='القيمة')),
+            ],
+            options={
+                'verbose_name': 'عدّاد مراقبة',
+                'verbose_name_plural': 'عدّادات المراقبة',
+            },
+        ),
+    ]
@@ -1,9 +1,39 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.conf import settings
 from django.utils import timezone
 from datetime import timedelta
 
 
+class TicketQuerySet(models.QuerySet):
+    """
+    استعلامات الطلبات - تشمل فلترة الرؤية حسب المستخدم
+    """
+
+    def visible_to(self, user, include=None):
+        """
+        الطلبات التي يراها المستخدم
+
+        include: أسباب الرؤية المطلوبة (من TicketAudience.REASON_CHOICES)،
+        وافتراضياً الأسباب الخاصة بدور المستخدم (الإدارة العليا ترى كل شيء،
+        والدور غير المعرّف في LISTING_REASONS لا يرى شيئاً).
+
+        يُترجم إلى id IN (subquery UNION subquery ...) حيث كل فرع هو
+        (user_id, reason) على الفهرس الفريد لجدول الجمهور، فلا حاجة لـ OR أو DISTINCT.
+        """
+        if include is None:
+            if user.is_upper_management:
+                return self
+            include = TicketAudience.LISTING_REASONS.get(user.role, ())
+
+        branches = [
+            TicketAudience.objects.filter(user=user, reason=reason).values('ticket_id')
+            for reason in include
+        ]
+        if not branches:
+            return self.none()
+        return self.filter(id__in=branches[0].union(*branches[1:]))
+
+
 class Ticket(models.Model):
     """
     نموذج الطلب/التذكرة - محسّن للأداء
@@ -93,6 +123,9 @@ class Ticket(models.Model):
         blank=True, 
         verbose_name="التاريخ المستهدف (اختياري)"
     )
+    # عدد عتبات التحذير التي أُرسلت قبل المهلة (SLA_WARNING_THRESHOLDS) - يعود للصفر إذا تغيّرت المهلة
+    warning_stage = models.PositiveSmallIntegerField(default=0, verbose_name="تحذيرات المهلة المرسلة")
+    last_warning_at = models.DateTimeField(null=True, blank=True, verbose_name="آخر تحذير بالمهلة")
     
     # المرفقات (جديد)
     attachment = models.FileField(
@@ -120,6 +153,9 @@ class Ticket(models.Model):
             models.Index(fields=['status'], name='ticket_status_idx'),
             models.Index(fields=['priority'], name='ticket_priority_idx'),
             models.Index(fields=['created_at'], name='ticket_created_idx'),
+            models.Index(fields=['resolved_at'], name='ticket_resolved_idx'),
+            # التحديث التزايدي لـ TicketDailyStat يبحث عن الطلبات المعدلة منذ العلامة المائية
+            models.Index(fields=['updated_at'], name='ticket_updated_idx'),
             models.Index(fields=['sla_deadline'], name='ticket_sla_idx'),
             models.Index(fields=['status', 'priority'], name='ticket_status_priority_idx'),
             models.Index(fields=['status', 'sla_deadline'], name='ticket_status_sla_idx'),
@@ -128,18 +164,51 @@ class Ticket(models.Model):
             models.Index(fields=['created_at', 'department'], name='ticket_created_dept_idx'),
             models.Index(fields=['priority', 'escalation_level'], name='ticket_priority_esc_idx'),
             models.Index(fields=['created_by', 'created_at'], name='ticket_creator_time_idx'),
+            # فهرس جزئي للطلبات المفتوحة فقط: فحص التحذيرات والمخالفات نطاق واحد على المهلة
+            models.Index(
+                fields=['sla_deadline'],
+                name='ticket_open_sla_idx',
+                condition=models.Q(status__in=['new', 'pending_ack', 'in_progress']),
+            ),
         ]
     
+    objects = TicketQuerySet.as_manager()
+
+    # الحقول التي نحتفظ بقيمتها عند التحميل لمعرفة ما تغيّر عند الحفظ
+    TRACKED_FIELDS = ('created_by_id', 'assigned_to_id', 'department_id', 'status', 'sla_deadline')
+
     def __str__(self):
         return f"{self.title} - {self.get_status_display()}"
-    
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {
+            name: instance.__dict__.get(name) for name in cls.TRACKED_FIELDS
+        }
+        return instance
+
+    def has_changed(self, field_name):
+        """هل تغيّرت قيمة الحقل منذ تحميل الطلب من قاعدة البيانات؟"""
+        loaded_values = getattr(self, '_loaded_values', None)
+        if loaded_values is None:
+            return True
+        return loaded_values.get(field_name) != self.__dict__.get(field_name)
+
     def save(self, *args, **kwargs):
         # حساب SLA deadline تلقائياً إذا لم يتم تعيينه
         if not self.pk and not self.sla_deadline:
             hours = settings.SLA_DEADLINES.get(self.priority, 24)
             self.sla_deadline = timezone.now() + timedelta(hours=hours)
+        elif self.pk and self.warning_stage and self.has_changed('sla_deadline'):
+            # مهلة جديدة: تحذيراتها لم تُرسل بعد
+            self.warning_stage = 0
         super().save(*args, **kwargs)
-    
+        # إشارات post_save تعمل داخل super().save() لذا تُحدَّث القيم المحمّلة بعدها
+        self._loaded_values = {
+            name: self.__dict__.get(name) for name in self.TRACKED_FIELDS
+        }
+
     @property
     def is_overdue(self):
         """هل تجاوز الطلب المهلة؟"""
@@ -244,3 +313,661 @@ class TicketAcknowledgment(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.ticket.title}"
 
+
+
+class TicketAudience(models.Model):
+    """
+    جمهور الطلب - جدول مُجمَّع (denormalized) يحتوي صفاً لكل (مستخدم، طلب، سبب)
+    يُحدَّث تلقائياً من الإشارات، ويحوّل فلترة الطلبات حسب الدور إلى join واحد مفهرس بدون DISTINCT
+    """
+    REASON_CHOICES = [
+        ('creator', 'منشئ الطلب'),
+        ('assignee', 'المعين المباشر'),
+        ('co_assignee', 'ضمن المعينين'),
+        ('department', 'عضو في أحد الأقسام المعنية'),
+        ('home_department', 'عضو في القسم الأساسي للطلب'),
+    ]
+
+    # الأسباب المشتقة من قسم المستخدم (تتغير عند نقل المستخدم لقسم آخر)
+    DEPARTMENT_REASONS = ('department', 'home_department')
+
+    # الأسباب التي تمنح رؤية الطلب في القوائم حسب الدور (الإدارة العليا ترى كل شيء)
+    LISTING_REASONS = {
+        'employee': ('assignee', 'co_assignee', 'creator', 'department'),
+        'head': ('home_department', 'department', 'assignee', 'co_assignee'),
+        'dean': ('home_department', 'department', 'assignee', 'co_assignee'),
+    }
+
+    # الأسباب التي تجعل المستخدم مسؤولاً عن الطلب (الإشعارات والإقرارات)
+    ASSIGNMENT_REASONS = ('assignee', 'co_assignee', 'department')
+
+    # أسباب الرؤية عبر القسم فقط (تقارير الرؤساء والعمداء)
+    DEPARTMENT_ONLY_REASONS = ('home_department', 'department')
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='ticket_audience',
+        verbose_name="المستخدم"
+    )
+    ticket = models.ForeignKey(
+        Ticket,
+        on_delete=models.CASCADE,
+        related_name='audience',
+        verbose_name="الطلب"
+    )
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES, verbose_name="سبب الرؤية")
+
+    class Meta:
+        verbose_name = "جمهور طلب"
+        verbose_name_plural = "جمهور الطلبات"
+        unique_together = ['user', 'reason', 'ticket']  # يخدم أيضاً البحث بـ (user, reason)
+
+    def __str__(self):
+        return f"{self.user_id} - {self.ticket_id} ({self.reason})"
+
+    @classmethod
+    def rebuild_for_tickets(cls, ticket_ids, reasons=None):
+        """
+        إعادة بناء صفوف الجمهور لمجموعة طلبات (لكل الأسباب أو لأسباب محددة)
+        """
+        from accounts.models import CustomUser
+
+        ticket_ids = list(ticket_ids)
+        if not ticket_ids:
+            return 0
+        reasons = set(reasons or dict(cls.REASON_CHOICES))
+
+        rows = set()
+        tickets = Ticket.objects.filter(id__in=ticket_ids).order_by().values_list(
+            'id', 'created_by_id', 'assigned_to_id', 'department_id'
+        )
+        dept_tickets = []  # (ticket_id, department_id, reason)
+
+        for ticket_id, creator_id, assignee_id, department_id in tickets:
+            if 'creator' in reasons:
+                rows.add((creator_id, ticket_id, 'creator'))
+            if 'assignee' in reasons and assignee_id:
+                rows.add((assignee_id, ticket_id, 'assignee'))
+            if 'home_department' in reasons and department_id:
+                dept_tickets.append((ticket_id, department_id, 'home_department'))
+
+        if 'co_assignee' in reasons:
+            through = Ticket.assigned_to_users.through
+            for ticket_id, user_id in through.objects.filter(
+                ticket_id__in=ticket_ids
+            ).values_list('ticket_id', 'customuser_id'):
+                rows.add((user_id, ticket_id, 'co_assignee'))
+
+        if 'department' in reasons:
+            through = Ticket.departments.through
+            for ticket_id, department_id in through.objects.filter(
+                ticket_id__in=ticket_ids
+            ).values_list('ticket_id', 'department_id'):
+                dept_tickets.append((ticket_id, department_id, 'department'))
+
+        if dept_tickets:
+            members = {}
+            for user_id, department_id in CustomUser.objects.filter(
+                department_id__in={d for _, d, _ in dept_tickets}
+            ).values_list('id', 'department_id'):
+                members.setdefault(department_id, []).append(user_id)
+            for ticket_id, department_id, reason in dept_tickets:
+                for user_id in members.get(department_id, []):
+                    rows.add((user_id, ticket_id, reason))
+
+        with transaction.atomic():
+            stale = cls.objects.filter(ticket_id__in=ticket_ids, reason__in=reasons)
+            affected_users = set()
+            if reasons & set(cls.ASSIGNMENT_REASONS):
+                # المستخدمون الذين تغيّرت مسؤوليتهم عن الطلبات (قبل وبعد) لتحديث علم الإقرار
+                affected_users.update(
+                    stale.filter(reason__in=cls.ASSIGNMENT_REASONS).values_list('user_id', flat=True)
+                )
+                affected_users.update(u for u, _, r in rows if r in cls.ASSIGNMENT_REASONS)
+            stale.delete()
+            cls.objects.bulk_create(
+                [cls(user_id=u, ticket_id=t, reason=r) for u, t, r in rows],
+                batch_size=1000,
+                ignore_conflicts=True,
+            )
+            cls.invalidate_pending_acks(affected_users)
+        return len(rows)
+
+    @classmethod
+    def rebuild_for_user(cls, user):
+        """
+        إعادة بناء صفوف الأقسام لمستخدم (عند إنشائه أو نقله لقسم آخر)
+        """
+        rows = []
+        if user.department_id:
+            through = Ticket.departments.through
+            rows.extend(
+                cls(user_id=user.pk, ticket_id=ticket_id, reason='department')
+                for ticket_id in through.objects.filter(
+                    department_id=user.department_id
+                ).values_list('ticket_id', flat=True)
+            )
+            rows.extend(
+                cls(user_id=user.pk, ticket_id=ticket_id, reason='home_department')
+                for ticket_id in Ticket.objects.filter(
+                    department_id=user.department_id
+                ).order_by().values_list('id', flat=True)
+            )
+
+        with transaction.atomic():
+            cls.objects.filter(user_id=user.pk, reason__in=cls.DEPARTMENT_REASONS).delete()
+            cls.objects.bulk_create(rows, batch_size=1000, ignore_conflicts=True)
+            cls.invalidate_pending_acks([user.pk])
+        return len(rows)
+
+    @classmethod
+    def users_for_tickets(cls, ticket_ids, reasons):
+        """
+        معرفات المستخدمين المرتبطين بمجموعة طلبات لأسباب محددة
+        """
+        return set(
+            cls.objects.filter(ticket_id__in=ticket_ids, reason__in=reasons)
+            .values_list('user_id', flat=True)
+        )
+
+    @staticmethod
+    def invalidate_pending_acks(user_ids):
+        """حذف علم الإقرار المعلّق بعد تثبيت المعاملة (حتى لا يُعاد حسابه من بيانات قديمة)"""
+        from .cache_utils import invalidate_pending_acknowledgments
+
+        user_ids = list(user_ids)
+        if user_ids:
+            transaction.on_commit(lambda: invalidate_pending_acknowledgments(user_ids))
+
+
+class TicketDailyStat(models.Model):
+    """
+    إحصائيات يومية مجمّعة (fact table) لكل (يوم، قسم، معين، أولوية)
+    تقرأ منها التقارير بدلاً من إعادة تجميع جدول الطلبات كاملاً، فيعتمد زمنها على عدد الأيام فقط
+
+    - أعداد الإنشاء والمخالفة تُنسب ليوم الإنشاء، والإقرار ليوم الإقرار، والحل ليوم الحل
+    - صفوف النقاط الجزائية أولويتها فارغة وتُنسب للمستخدم/القسم في سجل الجزاء
+    """
+    date = models.DateField(verbose_name="اليوم")
+    department = models.ForeignKey(
+        'accounts.Department',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='daily_stats',
+        verbose_name="القسم"
+    )
+    assignee = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='daily_stats',
+        verbose_name="المعين"
+    )
+    priority = models.CharField(max_length=20, blank=True, verbose_name="الأولوية")
+
+    created_count = models.PositiveIntegerField(default=0, verbose_name="المنشأة")
+    acknowledged_count = models.PositiveIntegerField(default=0, verbose_name="المؤكدة")
+    resolved_count = models.PositiveIntegerField(default=0, verbose_name="المحلولة")
+    resolved_on_time_count = models.PositiveIntegerField(default=0, verbose_name="المحلولة ضمن المهلة")
+    violated_count = models.PositiveIntegerField(default=0, verbose_name="المخالفة")
+    response_seconds = models.BigIntegerField(default=0, verbose_name="مجموع زمن الاستجابة (ثانية)")
+    resolution_seconds = models.BigIntegerField(default=0, verbose_name="مجموع زمن الحل (ثانية)")
+    penalty_points = models.IntegerField(default=0, verbose_name="النقاط الجزائية")
+    penalty_count = models.PositiveIntegerField(default=0, verbose_name="عدد الجزاءات")
+
+    COUNTERS = (
+        'created_count', 'acknowledged_count', 'resolved_count', 'resolved_on_time_count',
+        'violated_count', 'response_seconds', 'resolution_seconds', 'penalty_points', 'penalty_count',
+    )
+    WATERMARK_NAME = 'ticket_daily_stats'
+
+    class Meta:
+        verbose_name = "إحصائية يومية"
+        verbose_name_plural = "الإحصائيات اليومية"
+        unique_together = ['date', 'department', 'assignee', 'priority']
+        indexes = [
+            models.Index(fields=['date', 'assignee'], name='dailystat_date_assignee_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} - {self.department_id}/{self.assignee_id}/{self.priority}"
+
+    @classmethod
+    def rebuild_dates(cls, dates):
+        """
+        إعادة حساب صفوف مجموعة أيام من الجداول الأصلية (أربعة استعلامات تجميع لكل يوم)
+        """
+        from django.db.models import Count, DurationField, ExpressionWrapper, F, Q, Sum
+        from accounts.models import PenaltyPoints
+        from .metrics import duration_seconds, local_day_bounds
+
+        dimensions = ('department_id', 'assigned_to_id', 'priority')
+        closed = ['resolved', 'closed']
+        total = 0
+
+        for day in sorted(set(dates)):
+            start, end = local_day_bounds(day)
+            rows = {}
+
+            def row(key):
+                return rows.setdefault(key, dict.fromkeys(cls.COUNTERS, 0))
+
+            created = Ticket.objects.filter(created_at__gte=start, created_at__lt=end)
+            for item in created.order_by().values(*dimensions).annotate(
+                created=Count('id'),
+                violated=Count('id', filter=Q(status='violated')),
+            ):
+                stat = row((item['department_id'], item['assigned_to_id'], item['priority']))
+                stat['created_count'] = item['created']
+                stat['violated_count'] = item['violated']
+
+            acknowledged = Ticket.objects.filter(acknowledged_at__gte=start, acknowledged_at__lt=end)
+            for item in acknowledged.order_by().values(*dimensions).annotate(
+                acknowledged=Count('id'),
+                response=Sum(ExpressionWrapper(
+                    F('acknowledged_at') - F('created_at'), output_field=DurationField()
+                )),
+            ):
+                stat = row((item['department_id'], item['assigned_to_id'], item['priority']))
+                stat['acknowledged_count'] = item['acknowledged']
+                stat['response_seconds'] = duration_seconds(item['response'])
+
+            resolved = Ticket.objects.filter(
+                resolved_at__gte=start, resolved_at__lt=end, status__in=closed
+            )
+            for item in resolved.order_by().values(*dimensions).annotate(
+                resolved=Count('id'),
+                on_time=Count('id', filter=Q(resolved_at__lte=F('sla_deadline'))),
+                resolution=Sum(ExpressionWrapper(
+                    F('resolved_at') - F('created_at'), output_field=DurationField()
+                )),
+            ):
+                stat = row((item['department_id'], item['assigned_to_id'], item['priority']))
+                stat['resolved_count'] = item['resolved']
+                stat['resolved_on_time_count'] = item['on_time']
+                stat['resolution_seconds'] = duration_seconds(item['resolution'])
+
+            penalties = PenaltyPoints.objects.filter(created_at__gte=start, created_at__lt=end)
+            for item in penalties.order_by().values('department_id', 'user_id').annotate(
+                points=Sum('points'),
+                count=Count('id'),
+            ):
+                stat = row((item['department_id'], item['user_id'], ''))
+                stat['penalty_points'] = item['points'] or 0
+                stat['penalty_count'] = item['count']
+
+            with transaction.atomic():
+                cls.objects.filter(date=day).delete()
+                cls.objects.bulk_create([
+                    cls(date=day, department_id=department_id, assignee_id=assignee_id,
+                        priority=priority, **counters)
+                    for (department_id, assignee_id, priority), counters in rows.items()
+                ], batch_size=1000)
+            total += len(rows)
+        return total
+
+    @classmethod
+    def mark_dirty(cls, dates):
+        """
+        تسجيل أيام يجب إعادة حسابها في التحديث التالي (حذف طلب أو جزاء لا يترك updated_at)
+        """
+        RollupDirtyDay.objects.bulk_create(
+            [RollupDirtyDay(name=cls.WATERMARK_NAME, date=day) for day in set(dates)],
+            ignore_conflicts=True,
+        )
+
+    @classmethod
+    def refresh(cls, now=None):
+        """
+        تحديث تزايدي: إعادة حساب الأيام التي تأثرت بتغييرات منذ آخر علامة مائية فقط
+        إضافة إلى الأيام المعلّمة عند الحذف، وآخر DAILY_STATS_REFRESH_DAYS يوماً دائماً
+        (تلتقط تعديلات UPDATE التي لا تغيّر updated_at)
+        """
+        from accounts.models import PenaltyPoints
+
+        now = now or timezone.now()
+        watermark, created = RollupWatermark.objects.get_or_create(
+            name=cls.WATERMARK_NAME, defaults={'value': now}
+        )
+        since = watermark.value
+
+        # تُحذف العلامات قبل إعادة الحساب: أي حذف أثناءه يعلّم يومه من جديد للتشغيل التالي
+        dirty = RollupDirtyDay.objects.filter(name=cls.WATERMARK_NAME)
+        dates = set(dirty.values_list('date', flat=True))
+        dirty.filter(date__in=dates).delete()
+        if not created:
+            for values in Ticket.objects.filter(updated_at__gte=since).order_by().values_list(
+                'created_at', 'acknowledged_at', 'resolved_at'
+            ):
+                dates.update(timezone.localdate(value) for value in values if value)
+            dates.update(
+                timezone.localdate(value) for value in
+                PenaltyPoints.objects.filter(created_at__gte=since).values_list('created_at', flat=True)
+            )
+        # الأيام الأخيرة تُعاد دائماً حتى تبقى التقارير حديثة
+        today = timezone.localdate(now)
+        dates.update(today - timedelta(days=offset) for offset in range(settings.DAILY_STATS_REFRESH_DAYS))
+
+        rows = cls.rebuild_dates(dates)
+        watermark.value = now
+        watermark.save(update_fields=['value'])
+        return len(dates), rows
+
+
+class RollupWatermark(models.Model):
+    """
+    العلامة المائية لآخر تحديث تزايدي لجدول مجمّع
+    """
+    name = models.CharField(max_length=50, unique=True, verbose_name="الجدول")
+    value = models.DateTimeField(verbose_name="آخر تحديث")
+
+    class Meta:
+        verbose_name = "علامة مائية"
+        verbose_name_plural = "العلامات المائية"
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
+class RollupDirtyDay(models.Model):
+    """
+    يوم يجب إعادة حسابه في جدول مجمّع عند التحديث التزايدي التالي
+    """
+    name = models.CharField(max_length=50, verbose_name="الجدول")
+    date = models.DateField(verbose_name="اليوم")
+
+    class Meta:
+        verbose_name = "يوم بحاجة لإعادة الحساب"
+        verbose_name_plural = "أيام بحاجة لإعادة الحساب"
+        unique_together = ['name', 'date']
+
+    def __str__(self):
+        return f"{self.name}: {self.date}"
+
+
+class TaskLease(models.Model):
+    """
+    عقد التنفيذ المنفرد لمهمة دورية (tickets.locks.single_flight)
+    يحمله عامل واحد حتى expires_at ويجدده أثناء التنفيذ، ويُسجل سبب تخطي أي تشغيل متداخل
+    """
+    name = models.CharField(max_length=100, unique=True, verbose_name="المهمة")
+    owner = models.CharField(max_length=100, blank=True, verbose_name="العامل الحامل للعقد")
+    acquired_at = models.DateTimeField(null=True, blank=True, verbose_name="بداية التنفيذ")
+    heartbeat_at = models.DateTimeField(null=True, blank=True, verbose_name="آخر تجديد")
+    expires_at = models.DateTimeField(null=True, blank=True, verbose_name="انتهاء العقد")
+    rerun_requested = models.BooleanField(default=False, verbose_name="تشغيل مؤجل مطلوب")
+    last_finished_at = models.DateTimeField(null=True, blank=True, verbose_name="آخر انتهاء")
+    last_duration_ms = models.PositiveIntegerField(null=True, blank=True, verbose_name="مدة آخر تنفيذ (ms)")
+    skip_count = models.PositiveIntegerField(default=0, verbose_name="عدد مرات التخطي")
+    last_skip_reason = models.CharField(max_length=255, blank=True, verbose_name="سبب آخر تخطٍ")
+    last_skipped_at = models.DateTimeField(null=True, blank=True, verbose_name="آخر تخطٍ")
+
+    class Meta:
+        verbose_name = "عقد مهمة دورية"
+        verbose_name_plural = "عقود المهام الدورية"
+
+    def __str__(self):
+        return f"{self.name}: {self.owner or '-'}"
+
+
+class MetricCounter(models.Model):
+    """
+    عدّاد مراقبة تراكمي مشترك بين عمال Celery وعمليات الويب
+    (عدّادات الذاكرة المؤقتة في tickets.cache_utils خاصة بكل عملية عند استخدام LocMem)
+    """
+    name = models.CharField(max_length=50, unique=True, verbose_name="العدّاد")
+    value = models.BigIntegerField(default=0, verbose_name="القيمة")
+
+    class Meta:
+        verbose_name = "عدّاد مراقبة"
+        verbose_name_plural = "عدّادات المراقبة"
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+    @classmethod
+    def incr(cls, name, delta=1):
+        """
+        زيادة العدّاد بـ UPDATE ذري، وإنشاؤه عند أول استخدام
+        """
+        if cls.objects.filter(name=name).update(value=models.F('value') + delta):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(name=name, value=delta)
+        except IntegrityError:
+            # أنشأه عامل آخر في اللحظة نفسها
+            cls.objects.filter(name=name).update(value=models.F('value') + delta)
+
+    @classmethod
+    def read(cls, *names):
+        """
+        قراءة مجموعة عدّادات باستعلام واحد: {name: value}
+        """
+        values = dict(cls.objects.filter(name__in=names).values_list('name', 'value'))
+        return {name: values.get(name, 0) for name in names}
+
+
+class DailyReportSnapshot(models.Model):
+    """
+    التقرير اليومي للإدارة العليا محسوباً مرة واحدة (tickets.daily_report)
+    البيانات المنظمة + نسختا HTML والنص كما أُرسلتا، وتُحفظ كل الأيام لمقارنة الاتجاه
+    """
+    TREND_FIELDS = ['total', 'new_yesterday', 'resolved_yesterday', 'violated', 'pending']
+
+    day = models.DateField(unique=True, verbose_name="اليوم")
+    generated_at = models.DateTimeField(verbose_name="وقت الإنشاء")
+    data = models.JSONField(default=dict, verbose_name="البيانات")
+    html = models.TextField(blank=True, verbose_name="نص HTML")
+    text = models.TextField(blank=True, verbose_name="النص")
+    recipients_count = models.PositiveIntegerField(default=0, verbose_name="عدد المستلمين")
+
+    class Meta:
+        ordering = ['-day']
+        verbose_name = "لقطة تقرير يومي"
+        verbose_name_plural = "لقطات التقارير اليومية"
+
+    def __str__(self):
+        return f"التقرير اليومي {self.day}"
+
+    def previous(self):
+        """لقطة آخر يوم سابق (أو None)"""
+        return DailyReportSnapshot.objects.filter(day__lt=self.day).first()
+
+    def trend(self, previous=None):
+        """
+        الإحصائيات العامة مع الفرق عن اللقطة السابقة: [(المفتاح، القيمة، الفرق أو None)]
+        """
+        totals = self.data.get('totals', {})
+        before = previous.data.get('totals', {}) if previous else {}
+        return [
+            (key, totals.get(key, 0), totals.get(key, 0) - before[key] if key in before else None)
+            for key in self.TREND_FIELDS
+        ]
+
+
+class PerformanceMetricPoint(models.Model):
+    """
+    سلسلة زمنية لمقاييس الأداء: قيمة لكل (مقياس، نطاق، فترة) بطول PERFORMANCE_METRIC_BUCKET_HOURS
+    تُملأ تزايدياً من آخر فترة (generate_performance_metrics)، فتصبح لوحة المراقبة ومنحنيات الاتجاه
+    قراءة نطاق على هذا الجدول الصغير بدلاً من تجميع كامل جدول الطلبات
+
+    القيمة متوسط الفترة، و sample_count عدد الطلبات التي حُسب منها، فيكون دمج الفترات
+    (التقليص أو الإجمالي) متوسطاً مرجحاً دقيقاً
+    """
+    METRIC_CHOICES = [
+        ('response_hours', 'متوسط وقت الاستجابة (ساعة)'),
+        ('resolution_hours', 'متوسط وقت الحل (ساعة)'),
+        ('compliance_rate', 'نسبة الالتزام بالمهلة (%)'),
+    ]
+    SCOPE_ALL = 'all'
+    WATERMARK_NAME = 'performance_metrics'
+
+    metric = models.CharField(max_length=30, choices=METRIC_CHOICES, verbose_name="المقياس")
+    scope = models.CharField(max_length=50, default=SCOPE_ALL, verbose_name="النطاق")
+    bucket_start = models.DateTimeField(verbose_name="بداية الفترة")
+    value = models.FloatField(verbose_name="القيمة")
+    sample_count = models.PositiveIntegerField(default=0, verbose_name="عدد العينات")
+
+    class Meta:
+        ordering = ['metric', 'scope', 'bucket_start']
+        verbose_name = "نقطة مقياس أداء"
+        verbose_name_plural = "نقاط مقاييس الأداء"
+        constraints = [
+            models.UniqueConstraint(fields=['metric', 'scope', 'bucket_start'], name='metric_point_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.metric}/{self.scope} @ {self.bucket_start}: {self.value:.2f}"
+
+    @staticmethod
+    def department_scope(department_id):
+        return f'department:{department_id}'
+
+    @classmethod
+    def bucket_hours(cls):
+        return getattr(settings, 'PERFORMANCE_METRIC_BUCKET_HOURS', 6)
+
+    @classmethod
+    def max_buckets_per_run(cls):
+        return getattr(settings, 'PERFORMANCE_METRIC_MAX_BUCKETS_PER_RUN', 240)
+
+    @classmethod
+    def bucket_floor(cls, value):
+        """بداية الفترة التي يقع فيها الوقت (فترات محاذاة لمنتصف الليل بالتوقيت المحلي)"""
+        local = timezone.localtime(value)
+        return local.replace(hour=local.hour - local.hour % cls.bucket_hours(), minute=0, second=0, microsecond=0)
+
+    @classmethod
+    def compute_bucket(cls, start, end):
+        """
+        نقاط فترة واحدة (غير محفوظة) لكل الأقسام والنطاق العام - استعلاما تجميع
+        الاستجابة تُنسب لوقت الإقرار والحل والالتزام لوقت الحل (كما في TicketDailyStat)
+        """
+        from django.db.models import Count, DurationField, ExpressionWrapper, F, Q, Sum
+        from .metrics import duration_seconds
+
+        # {النطاق: [العدد، مجموع الثواني، ضمن المهلة]}
+        response, resolution = {}, {}
+
+        acknowledged = Ticket.objects.filter(acknowledged_at__gte=start, acknowledged_at__lt=end)
+        for item in acknowledged.order_by().values('department_id').annotate(
+            count=Count('id'),
+            seconds=Sum(ExpressionWrapper(F('acknowledged_at') - F('created_at'), output_field=DurationField())),
+        ):
+            response[item['department_id']] = [item['count'], duration_seconds(item['seconds']), 0]
+
+        resolved = Ticket.objects.filter(resolved_at__gte=start, resolved_at__lt=end, status__in=['resolved', 'closed'])
+        for item in resolved.order_by().values('department_id').annotate(
+            count=Count('id'),
+            on_time=Count('id', filter=Q(resolved_at__lte=F('sla_deadline'))),
+            seconds=Sum(ExpressionWrapper(F('resolved_at') - F('created_at'), output_field=DurationField())),
+        ):
+            resolution[item['department_id']] = [item['count'], duration_seconds(item['seconds']), item['on_time']]
+
+        points = []
+        for groups, metrics in ((response, ('response_hours',)), (resolution, ('resolution_hours', 'compliance_rate'))):
+            if not groups:
+                continue
+            scopes = {
+                cls.department_scope(department_id): values
+                for department_id, values in groups.items() if department_id is not None
+            }
+            scopes[cls.SCOPE_ALL] = [sum(column) for column in zip(*groups.values())]
+            for scope, (count, seconds, on_time) in scopes.items():
+                for metric in metrics:
+                    value = on_time / count * 100 if metric == 'compliance_rate' else seconds / count / 3600
+                    points.append(cls(
+                        metric=metric, scope=scope, bucket_start=start, value=value, sample_count=count,
+                    ))
+        return points
+
+    @classmethod
+    def fill(cls, now=None, since=None, max_buckets=None):
+        """
+        ملء تزايدي من الفترة التي وصل إليها التشغيل السابق (تُعاد لأنها كانت جزئية) حتى الفترة الحالية
+        أول تشغيل يبدأ من أقدم طلب (أو since) - يعيد (عدد الفترات، عدد النقاط)
+
+        كل استدعاء يعالج max_buckets فترة على الأكثر (PERFORMANCE_METRIC_MAX_BUCKETS_PER_RUN)
+        والتالي يكمل من حيث توقف، فلا يتجاوز أول تشغيل على تاريخ طويل مهلة المهمة؛
+        التاريخ كاملاً يُملأ دفعة واحدة بأمر backfill_performance_metrics
+        """
+        from .locks import heartbeat
+
+        now = now or timezone.now()
+        if max_buckets is None:
+            max_buckets = cls.max_buckets_per_run()
+        if since is None:
+            watermark = RollupWatermark.objects.filter(name=cls.WATERMARK_NAME).first()
+            if watermark is not None:
+                since = watermark.value
+            else:
+                since = Ticket.objects.order_by('created_at').values_list('created_at', flat=True).first() or now
+
+        step = timedelta(hours=cls.bucket_hours())
+        start = cls.bucket_floor(since)
+        buckets = points = 0
+        while start <= now and buckets < max_buckets:
+            heartbeat()
+            end = start + step
+            bucket_points = cls.compute_bucket(start, end)
+            with transaction.atomic():
+                cls.objects.filter(bucket_start=start).delete()
+                cls.objects.bulk_create(bucket_points)
+            buckets += 1
+            points += len(bucket_points)
+            start = end
+
+        # عند بلوغ الحد تبدأ العلامة من أول فترة لم تُعالج
+        RollupWatermark.objects.update_or_create(name=cls.WATERMARK_NAME, defaults={'value': min(start, now)})
+        return buckets, points
+
+    @classmethod
+    def series(cls, metric, scope=SCOPE_ALL, start=None, end=None, max_points=None):
+        """
+        قراءة نطاق من السلسلة مع تقليص اختياري إلى max_points نقطة على الأكثر
+        كل مجموعة فترات متتالية تُدمج بمتوسط مرجح بعدد العينات - يعيد [(بداية الفترة، القيمة، العينات)]
+        """
+        points = cls.objects.filter(metric=metric, scope=scope)
+        if start:
+            points = points.filter(bucket_start__gte=start)
+        if end:
+            points = points.filter(bucket_start__lt=end)
+        rows = list(points.order_by('bucket_start').values_list('bucket_start', 'value', 'sample_count'))
+        if not max_points or len(rows) <= max_points:
+            return rows
+
+        size = -(-len(rows) // max_points)
+        merged = []
+        for index in range(0, len(rows), size):
+            group = rows[index:index + size]
+            samples = sum(count for _, _, count in group)
+            merged.append((
+                group[0][0],
+                sum(value * count for _, value, count in group) / samples if samples else 0,
+                samples,
+            ))
+        return merged
+
+    @classmethod
+    def summary(cls, scope=SCOPE_ALL, start=None):
+        """
+        قيمة كل مقياس على كامل السلسلة (أو منذ start) كمتوسط مرجح - استعلام واحد
+        المقياس بلا عينات (السلسلة لم تُملأ بعد) قيمته None وليس صفراً
+        """
+        from django.db.models import ExpressionWrapper, F, FloatField, Sum
+
+        points = cls.objects.filter(scope=scope)
+        if start:
+            points = points.filter(bucket_start__gte=start)
+        result = dict.fromkeys(metric for metric, _ in cls.METRIC_CHOICES)
+        for row in points.order_by().values('metric').annotate(
+            weighted=Sum(ExpressionWrapper(F('value') * F('sample_count'), output_field=FloatField())),
+            samples=Sum('sample_count'),
+        ):
+            if row['samples']:
+                result[row['metric']] = row['weighted'] / row['samples']
+        return result
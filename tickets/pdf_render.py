@@ -0,0 +1,364 @@
+"""
+خدمة توليد PDF للطلبات مع ذاكرة مؤقتة على القرص
+
+- الخط العربي يُسجل مرة واحدة لكل عملية، والنصوص الثابتة تُعاد صياغتها (reshape/bidi) مرة واحدة
+- الملف المولَّد يُحفظ في PDF_CACHE_DIR باسم يتضمن نسخة الطلب (المعرف، updated_at، آخر إجراء)،
+  فأي تعديل على الطلب أو إجراء جديد يغيّر الاسم ولا حاجة لإبطال صريح
+- المحتوى لا يعتمد على وقت التوليد إلا تحذير التأخير، لذا نسخة الطلب المتأخر تتضمن الساعة الحالية
+  (ملف جديد كل ساعة)، والتذييل يعرض آخر تحديث للطلب بدلاً من تاريخ الطباعة
+- الطلب الأول لنسخة جديدة (cold) يُولَّد في عامل Celery (طابور exports) بينما تعرض الواجهة
+  صفحة انتظار؛ والطلبات التالية تُرسل الملف من القرص مباشرة
+- عدّادات (MetricCounter، مشتركة بين العامل والويب): pdf_cache_hit / pdf_cache_miss / pdf_render_count / pdf_render_ms
+"""
+import functools
+import logging
+import os
+import time
+from io import BytesIO
+
+import arabic_reshaper
+from bidi.algorithm import get_display
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max
+from django.utils import timezone
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER, TA_RIGHT
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+from .models import MetricCounter, Ticket
+
+logger = logging.getLogger('tickets')
+
+FONT_FILE = os.path.join('static', 'fonts', 'NotoNaskhArabic-Regular.ttf')
+RENDER_KEY = 'pdf_render_{ticket_id}_{version}'
+# الحالات التي لا يُعد فيها الطلب متأخراً (Ticket.is_overdue)
+CLOSED_STATUSES = ('resolved', 'closed', 'returned')
+
+
+@functools.lru_cache(maxsize=None)
+def register_font(name='ArabicFont'):
+    """
+    تسجيل الخط العربي باسم معين مرة واحدة لكل عملية - يعيد True إذا نجح
+    """
+    font_path = os.path.join(settings.BASE_DIR, FONT_FILE)
+    try:
+        pdfmetrics.registerFont(TTFont(name, font_path))
+        return True
+    except Exception as e:
+        logger.warning(f'Could not load Arabic font: {e}')
+        return False
+
+
+def arabic_font():
+    return 'ArabicFont' if register_font('ArabicFont') else 'Helvetica'
+
+
+@functools.lru_cache(maxsize=4096)
+def arabic_text(text):
+    """تنسيق النص العربي للعرض الصحيح (العناوين المتكررة تُصاغ مرة واحدة)"""
+    if not text:
+        return ""
+    return get_display(arabic_reshaper.reshape(str(text)))
+
+
+def ticket_version(ticket_id, now=None):
+    """
+    نسخة الطلب (updated_at، معرف آخر إجراء، ساعة التأخير) في استعلام واحد - أو None إذا لم يوجد
+    ساعة التأخير بداية الساعة المحلية الحالية للطلب المتأخر (كما في Ticket.is_overdue) وإلا None
+    """
+    row = Ticket.objects.filter(pk=ticket_id).annotate(
+        last_action=Max('actions__id')
+    ).values_list('updated_at', 'last_action', 'status', 'sla_deadline').first()
+    if row is None:
+        return None
+    updated_at, last_action, status, sla_deadline = row
+    now = now or timezone.now()
+    overdue_hour = None
+    if sla_deadline and now > sla_deadline and status not in CLOSED_STATUSES:
+        overdue_hour = timezone.localtime(now).replace(minute=0, second=0, microsecond=0)
+    return updated_at, last_action, overdue_hour
+
+
+def cache_path(ticket_id, version):
+    updated_at, last_action, overdue_hour = version
+    suffix = f'_{overdue_hour:%Y%m%d%H}' if overdue_hour else ''
+    return os.path.join(
+        settings.PDF_CACHE_DIR,
+        f'ticket_{ticket_id}_{int(updated_at.timestamp() * 1000000)}_{last_action or 0}{suffix}.pdf',
+    )
+
+
+def build_ticket_pdf(ticket):
+    """
+    بناء مستند ReportLab للطلب - يعيد محتوى الملف
+    """
+    font_name = arabic_font()
+    actions = list(ticket.actions.select_related('user').order_by('-created_at')[:10])
+
+    # إنشاء PDF
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=50, leftMargin=50, topMargin=50, bottomMargin=30)
+    
+    elements = []
+    styles = getSampleStyleSheet()
+    
+    # أنماط مخصصة
+    title_style = ParagraphStyle(
+        'ArabicTitle',
+        parent=styles['Heading1'],
+        fontName=font_name,
+        fontSize=20,
+        textColor=colors.HexColor('#4c7eea'),
+        alignment=TA_CENTER,
+        spaceAfter=20,
+    )
+    
+    heading_style = ParagraphStyle(
+        'ArabicHeading',
+        parent=styles['Heading2'],
+        fontName=font_name,
+        fontSize=14,
+        alignment=TA_RIGHT,
+        spaceAfter=10,
+        textColor=colors.HexColor('#333333'),
+        wordWrap='RTL',  # دعم RTL
+        rightIndent=0,
+    )
+    
+    normal_style = ParagraphStyle(
+        'ArabicNormal',
+        parent=styles['Normal'],
+        fontName=font_name,
+        fontSize=11,
+        alignment=TA_RIGHT,
+        leading=16,
+        wordWrap='RTL',  # دعم RTL
+        rightIndent=0,
+        leftIndent=0,
+    )
+
+    english_style = ParagraphStyle(
+        'EnglishNormal',
+        parent=styles['Normal'],
+        fontName='Helvetica',
+        fontSize=11,
+        alignment=TA_RIGHT,
+        leading=16,
+    )
+    
+    # العنوان الرئيسي
+    elements.append(Paragraph(arabic_text("تقرير الطلب"), title_style))
+    elements.append(Paragraph(f"Ticket #{ticket.id}", english_style))
+    elements.append(Spacer(1, 15))
+    
+    # تحذير إذا متأخر - الملف يُعاد توليده كل ساعة للطلب المتأخر، فالحد الأدنى يبقى صحيحاً خلالها
+    if ticket.is_overdue:
+        warning_style = ParagraphStyle(
+            'Warning',
+            parent=normal_style,
+            textColor=colors.red,
+            fontSize=12,
+            alignment=TA_CENTER,
+        )
+        hours = int(ticket.hours_delayed)
+        warning = f"⚠ تحذير: الطلب متأخر أكثر من {hours} ساعة" if hours else "⚠ تحذير: الطلب تجاوز الموعد النهائي"
+        elements.append(Paragraph(arabic_text(warning), warning_style))
+        elements.append(Spacer(1, 10))
+    
+    # معلومات الطلب
+    elements.append(Paragraph(arabic_text("معلومات الطلب"), heading_style))
+    
+    # عكس ترتيب الأعمدة للقراءة من اليمين لليسار
+    info_data = [
+        [Paragraph(arabic_text(ticket.title), normal_style), Paragraph(arabic_text('العنوان:'), normal_style)],
+        [Paragraph(arabic_text(ticket.get_status_display()), normal_style), Paragraph(arabic_text('الحالة:'), normal_style)],
+        [Paragraph(arabic_text(ticket.get_priority_display()), normal_style), Paragraph(arabic_text('الأولوية:'), normal_style)],
+        [Paragraph(arabic_text(ticket.created_by.get_full_name()), normal_style), Paragraph(arabic_text('المنشئ:'), normal_style)],
+        [Paragraph(arabic_text(ticket.created_at.strftime('%Y-%m-%d %H:%M')), normal_style), Paragraph(arabic_text('تاريخ الإنشاء:'), normal_style)],
+        [Paragraph(arabic_text(ticket.sla_deadline.strftime('%Y-%m-%d %H:%M')), normal_style), Paragraph(arabic_text('الموعد النهائي:'), normal_style)],
+    ]
+    
+    if ticket.assigned_to:
+        info_data.append([
+            Paragraph(arabic_text(ticket.assigned_to.get_full_name()), normal_style),
+            Paragraph(arabic_text('المعين له:'), normal_style)
+        ])
+    
+    if ticket.department:
+        info_data.append([
+            Paragraph(arabic_text(ticket.department.name), normal_style),
+            Paragraph(arabic_text('القسم:'), normal_style)
+        ])
+    
+    info_table = Table(info_data, colWidths=[4.5*inch, 1.5*inch], hAlign='RIGHT')
+    info_table.setStyle(TableStyle([
+        ('BACKGROUND', (1, 0), (1, -1), colors.HexColor('#f0f0f0')),
+        ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('FONTNAME', (0, 0), (-1, -1), font_name),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('TOPPADDING', (0, 0), (-1, -1), 8),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 12),
+        ('LEFTPADDING', (0, 0), (-1, -1), 4),
+    ]))
+    elements.append(info_table)
+    elements.append(Spacer(1, 15))
+    
+    # الوصف
+    elements.append(Paragraph(arabic_text("الوصف"), heading_style))
+    desc_text = ticket.description[:300] + "..." if len(ticket.description) > 300 else ticket.description
+    elements.append(Paragraph(arabic_text(desc_text), normal_style))
+    elements.append(Spacer(1, 15))
+    
+    # التواريخ  
+    elements.append(Paragraph(arabic_text("التواريخ"), heading_style))
+    dates_data = [
+        [Paragraph(arabic_text(ticket.created_at.strftime('%Y-%m-%d %H:%M')), normal_style), Paragraph(arabic_text('تاريخ الإنشاء:'), normal_style)],
+        [Paragraph(arabic_text(ticket.sla_deadline.strftime('%Y-%m-%d %H:%M')), normal_style), Paragraph(arabic_text('الموعد النهائي:'), normal_style)],
+    ]
+
+    if ticket.resolved_at:
+        dates_data.append([
+            Paragraph(arabic_text(ticket.resolved_at.strftime('%Y-%m-%d %H:%M')), normal_style),
+            Paragraph(arabic_text('تاريخ الحل:'), normal_style)
+        ])
+
+    dates_table = Table(dates_data, colWidths=[4.5*inch, 1.5*inch], hAlign='RIGHT')
+    dates_table.setStyle(TableStyle([
+        ('BACKGROUND', (1, 0), (1, -1), colors.HexColor('#f0f0f0')),
+        ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('FONTNAME', (0, 0), (-1, -1), font_name),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+        ('TOPPADDING', (0, 0), (-1, -1), 8),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 12),
+        ('LEFTPADDING', (0, 0), (-1, -1), 4),
+    ]))
+    elements.append(dates_table)
+    elements.append(Spacer(1, 15))
+    
+    # سجل الإجراءات
+    if actions:
+        elements.append(Paragraph(arabic_text("آخر الإجراءات"), heading_style))
+        
+        # عكس ترتيب الأعمدة: التاريخ - المستخدم - النوع (من اليمين لليسار)
+        actions_data = [[
+            Paragraph(arabic_text('التاريخ'), normal_style),
+            Paragraph(arabic_text('المستخدم'), normal_style),
+            Paragraph(arabic_text('النوع'), normal_style),
+        ]]
+        for action in actions:
+            actions_data.append([
+                Paragraph(arabic_text(action.created_at.strftime('%Y-%m-%d %H:%M')), normal_style),
+                Paragraph(arabic_text(action.user.get_full_name() if action.user else 'النظام'), normal_style),
+                Paragraph(arabic_text(action.get_action_type_display()), normal_style),
+            ])
+        actions_table = Table(actions_data, colWidths=[2*inch, 2*inch, 2*inch], hAlign='RIGHT')
+        actions_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4c7eea')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, -1), font_name),
+            ('FONTSIZE', (0, 0), (-1, 0), 11),
+            ('FONTSIZE', (0, 1), (-1, -1), 9),
+            ('TOPPADDING', (0, 0), (-1, -1), 6),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+            ('RIGHTPADDING', (0, 0), (-1, -1), 8),
+            ('LEFTPADDING', (0, 0), (-1, -1), 2),
+        ]))
+        elements.append(actions_table)
+    
+    # التذييل
+    elements.append(Spacer(1, 20))
+    footer_style = ParagraphStyle(
+        'Footer',
+        parent=normal_style,
+        fontSize=9,
+        textColor=colors.grey,
+        alignment=TA_CENTER,
+    )
+    elements.append(Paragraph(arabic_text("نظام إدارة الطلبات - قسم الحاسبة الإلكترونية"), footer_style))
+    # الملف قد يُرسل من الذاكرة المؤقتة لاحقاً، فيُعرض وقت آخر تغيير في الطلب لا وقت التوليد
+    last_change = max([ticket.updated_at] + [action.created_at for action in actions[:1]])
+    elements.append(Paragraph(
+        arabic_text(f"آخر تحديث للطلب: {timezone.localtime(last_change).strftime('%Y-%m-%d %H:%M')}"),
+        footer_style,
+    ))
+    
+
+    doc.build(elements)
+    return buffer.getvalue()
+
+
+def render_ticket_pdf(ticket_id):
+    """
+    توليد ملف النسخة الحالية للطلب وحفظه (إن لم يكن محفوظاً) - يعيد المسار أو None إذا حُذف الطلب
+    الكتابة في ملف مؤقت ثم إعادة تسمية ذرية، وتُحذف ملفات النسخ الأقدم لنفس الطلب
+    """
+    version = ticket_version(ticket_id)
+    if version is None:
+        return None
+    path = cache_path(ticket_id, version)
+    if os.path.exists(path):
+        return path
+
+    started = time.monotonic()
+    ticket = Ticket.objects.select_related('created_by', 'assigned_to', 'department').get(pk=ticket_id)
+    content = build_ticket_pdf(ticket)
+
+    os.makedirs(settings.PDF_CACHE_DIR, exist_ok=True)
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as handle:
+        handle.write(content)
+    os.replace(temp_path, path)
+
+    prefix = f'ticket_{ticket_id}_'
+    for name in os.listdir(settings.PDF_CACHE_DIR):
+        if name.startswith(prefix) and name.endswith('.pdf') and name != os.path.basename(path):
+            try:
+                os.remove(os.path.join(settings.PDF_CACHE_DIR, name))
+            except FileNotFoundError:
+                pass
+
+    render_ms = int((time.monotonic() - started) * 1000)
+    MetricCounter.incr('pdf_render_count')
+    MetricCounter.incr('pdf_render_ms', render_ms)
+    logger.info(f'PDF rendered for ticket {ticket_id} in {render_ms}ms')
+    return path
+
+
+def cached_ticket_pdf(ticket_id):
+    """
+    مسار ملف النسخة الحالية إن كان جاهزاً، وإلا جدولة توليده - يعيد (المسار أو None، النسخة)
+    إذا تعذّرت الجدولة (الوسيط غير متاح) يُولَّد الملف مباشرة في الطلب نفسه
+    """
+    from .tasks import render_ticket_pdf_task
+
+    version = ticket_version(ticket_id)
+    if version is None:
+        return None, None
+    path = cache_path(ticket_id, version)
+    if os.path.exists(path):
+        MetricCounter.incr('pdf_cache_hit')
+        return path, version
+
+    MetricCounter.incr('pdf_cache_miss')
+    key = RENDER_KEY.format(ticket_id=ticket_id, version=os.path.basename(path))
+    if cache.add(key, 1, getattr(settings, 'PDF_RENDER_PENDING_TIMEOUT', 120)):
+        try:
+            render_ticket_pdf_task.delay(ticket_id)
+        except Exception as e:
+            cache.delete(key)
+            logger.error(f'Could not queue PDF render for ticket {ticket_id}: {e}')
+            return render_ticket_pdf(ticket_id), version
+    return None, version
@@ -13,43 +13,19 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.lib.enums import TA_RIGHT, TA_CENTER
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
 from io import BytesIO
-from arabic_reshaper import reshape
-from bidi.algorithm import get_display
+from .pdf_render import arabic_text, register_font  # arabic_text: تنسيق مع ذاكرة مؤقتة للنصوص المتكررة
 import logging
 
 logger = logging.getLogger('tickets')
 
 
-def arabic_text(text):
-    """
-    تحويل النص العربي لتنسيق صحيح في PDF
-    Convert Arabic text to proper PDF format
-    """
-    if not text:
-        return ""
-    reshaped_text = reshape(text)
-    bidi_text = get_display(reshaped_text)
-    return bidi_text
-
-
 def register_arabic_fonts():
     """
-    تسجيل الخطوط العربية
-    Register Arabic fonts
+    تسجيل الخطوط العربية (مرة واحدة لكل عملية)
+    Register Arabic fonts once per process
     """
-    import os
-    font_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'fonts', 'NotoNaskhArabic-Regular.ttf')
-    try:
-        pdfmetrics.registerFont(TTFont('Arabic', font_path))
-        # إذا كان لديك خط بولد أضفه هنا بنفس الطريقة
-        # pdfmetrics.registerFont(TTFont('Arabic-Bold', bold_font_path))
-        return True
-    except Exception as e:
-        logger.warning(f"Could not register Arabic font: {e}. Using default fonts.")
-        return False
+    return register_font('Arabic')
 
 
 @login_required
@@ -0,0 +1,201 @@
+"""
+إعادة التعيين التلقائي للطلبات المتأخرة حسب عبء العمل
+
+- خريطة العبء (عدد الطلبات المفتوحة لكل موظف، كمعين مباشر أو ضمن assigned_to_users)
+  تُبنى مرة واحدة لكل الأقسام المعنية باستعلامين بدلاً من استعلامي تجميع لكل طلب
+- لكل قسم كومة صغرى (heapq) بالعبء الحالي، تُحدَّث مع كل طلب يُسند خلال التشغيل نفسه
+  فلا يحصل موظف واحد على كل الطلبات لأن عدّه قُرئ قبل بدء التشغيل
+- الخطة تُطبق دفعة واحدة: bulk_update للطلبات و bulk_create لإجراءات reassigned
+- وضع المعاينة (dry_run) يحسب الخطة وتوزيع العبء قبل وبعد دون أي كتابة
+"""
+import heapq
+import logging
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from datetime import timedelta
+from statistics import pstdev
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from accounts.models import CustomUser
+from .models import Ticket, TicketAction
+from .signals import tickets_bulk_updated
+from .sla import OPEN_STATUSES
+from .utils import queue_ticket_update_emails
+
+logger = logging.getLogger('celery')
+
+CANDIDATE_ROLES = ['employee', 'head']
+
+
+@dataclass
+class ReassignmentPlan:
+    """نتيجة التخطيط: التنقلات المقترحة وعبء كل موظف قبل وبعد"""
+    moves: list = field(default_factory=list)  # (الطلب، المعين السابق، المعين الجديد، عبؤه بعد الإسناد)
+    load_before: dict = field(default_factory=dict)
+    load_after: dict = field(default_factory=dict)
+    users: dict = field(default_factory=dict)
+
+    def spread(self, load):
+        """توزيع العبء لكل قسم: (الأدنى، الأعلى، الانحراف المعياري)"""
+        by_department = defaultdict(list)
+        for user_id, user in self.users.items():
+            by_department[user.department_id].append(load.get(user_id, 0))
+        return {
+            department_id: (min(values), max(values), round(pstdev(values), 2))
+            for department_id, values in by_department.items()
+        }
+
+
+class WorkloadHeap:
+    """
+    كومة صغرى بعبء موظفي قسم واحد مع حذف كسول للقيم القديمة
+    """
+
+    def __init__(self, load, user_ids):
+        self.load = load
+        self.heap = [(load.get(user_id, 0), user_id) for user_id in user_ids]
+        heapq.heapify(self.heap)
+
+    def adjust(self, user_id, delta):
+        self.load[user_id] = self.load.get(user_id, 0) + delta
+        heapq.heappush(self.heap, (self.load[user_id], user_id))
+
+    def pop_least_loaded(self, exclude):
+        """
+        الموظف الأقل عبئاً غير المستبعد (أو None)
+        يُسحب من الكومة، فعلى المستدعي إعادته بـ adjust (ولو بفرق 0)
+        """
+        skipped = []
+        chosen = None
+        while self.heap:
+            load, user_id = heapq.heappop(self.heap)
+            if load != self.load.get(user_id, 0):
+                continue  # قيمة قديمة
+            if user_id in exclude:
+                skipped.append((load, user_id))
+                continue
+            chosen = user_id
+            break
+        for item in skipped:
+            heapq.heappush(self.heap, item)
+        return chosen
+
+
+def workload_map(user_ids):
+    """
+    عدد الطلبات المفتوحة المميزة لكل مستخدم (معين مباشر أو ضمن المعينين المتعددين) - استعلامان
+    """
+    pairs = set(
+        Ticket.objects.filter(status__in=OPEN_STATUSES, assigned_to_id__in=user_ids)
+        .values_list('assigned_to_id', 'pk')
+    )
+    pairs |= set(
+        Ticket.assigned_to_users.through.objects.filter(
+            customuser_id__in=user_ids, ticket__status__in=OPEN_STATUSES
+        ).values_list('customuser_id', 'ticket_id')
+    )
+    return dict(Counter(user_id for user_id, _ in pairs))
+
+
+def plan_reassignments(now=None):
+    """
+    حساب خطة إعادة التعيين للطلبات المفتوحة منذ أكثر من AUTO_REASSIGN_AFTER_HOURS ساعة
+    الطلب الذي أُعيد تعيينه تلقائياً خلال نفس المدة لا يُنقل مرة أخرى
+    """
+    now = now or timezone.now()
+    threshold_time = now - timedelta(hours=settings.AUTO_REASSIGN_AFTER_HOURS)
+
+    overdue = list(
+        Ticket.objects.filter(
+            status__in=OPEN_STATUSES,
+            created_at__lt=threshold_time,
+            assigned_to__isnull=False,
+        ).exclude(
+            Exists(TicketAction.objects.filter(
+                ticket=OuterRef('pk'), action_type='reassigned', created_at__gte=threshold_time
+            ))
+        ).select_related('assigned_to', 'created_by').prefetch_related('assigned_to_users')
+        .order_by('created_at')
+    )
+    plan = ReassignmentPlan()
+    if not overdue:
+        return plan
+
+    department_ids = {ticket.department_id for ticket in overdue}
+    same_department = Q(department_id__in=department_ids - {None})
+    if None in department_ids:
+        # طلبات بلا قسم: البدلاء هم الموظفون بلا قسم (كما في السلوك السابق)
+        same_department |= Q(department__isnull=True)
+    plan.users = {
+        user.pk: user
+        for user in CustomUser.objects.filter(same_department, role__in=CANDIDATE_ROLES, is_active=True)
+    }
+
+    plan.load_before = workload_map(list(plan.users))
+    load = dict(plan.load_before)
+    heaps = {}
+    by_department = defaultdict(list)
+    for user in plan.users.values():
+        by_department[user.department_id].append(user.pk)
+    for department_id, user_ids in by_department.items():
+        heaps[department_id] = WorkloadHeap(load, user_ids)
+
+    for ticket in overdue:
+        heap = heaps.get(ticket.department_id)
+        if heap is None:
+            continue
+        new_assignee = heap.pop_least_loaded(exclude={ticket.assigned_to_id})
+        if new_assignee is None:
+            continue
+        # العبء عدد طلبات مميزة (كما في workload_map): من هو ضمن assigned_to_users
+        # يبقى الطلب محسوباً عليه، فلا يزيد عبء المعين الجديد ولا ينقص عبء السابق
+        co_assignees = {user.pk for user in ticket.assigned_to_users.all()}
+        heap.adjust(new_assignee, 0 if new_assignee in co_assignees else 1)
+        previous = plan.users.get(ticket.assigned_to_id)
+        if previous is not None and previous.pk not in co_assignees:
+            # المعين السابق يتخفف بطلب في كومة قسمه
+            heaps[previous.department_id].adjust(previous.pk, -1)
+        plan.moves.append((ticket, ticket.assigned_to, plan.users[new_assignee], load[new_assignee]))
+
+    plan.load_after = load
+    return plan
+
+
+def apply_reassignments(plan, now=None):
+    """
+    تطبيق الخطة: bulk_update للطلبات + bulk_create لإجراءات reassigned ثم البريد بعد التثبيت
+    """
+    if not plan.moves:
+        return 0
+    now = now or timezone.now()
+    tickets = []
+    actions = []
+    for ticket, old_assignee, new_assignee, _ in plan.moves:
+        ticket.assigned_to = new_assignee
+        ticket.updated_at = now  # bulk_update لا يطبق auto_now
+        tickets.append(ticket)
+        actions.append(TicketAction(
+            ticket=ticket,
+            action_type='reassigned',
+            user=new_assignee,
+            notes=f'تم إعادة التعيين تلقائياً من {old_assignee} بسبب التأخير الزائد',
+        ))
+
+    batch_size = getattr(settings, 'SLA_BATCH_SIZE', 500)
+    with transaction.atomic():
+        Ticket.objects.bulk_update(tickets, ['assigned_to', 'updated_at'], batch_size=batch_size)
+        TicketAction.objects.bulk_create(actions, batch_size=batch_size)
+        # bulk_update لا يطلق post_save: الجمهور وعلم الإقرار وحقبة لوحة التحكم تُحدَّث من هذه الإشارة
+        tickets_bulk_updated.send(
+            sender=Ticket, ticket_ids=[ticket.pk for ticket in tickets], fields=['assigned_to']
+        )
+        queue_ticket_update_emails(
+            tickets, 'reassigned', actors={ticket.pk: ticket.assigned_to for ticket in tickets}
+        )
+
+    logger.info(f'Auto-reassigned {len(tickets)} tickets')
+    return len(tickets)
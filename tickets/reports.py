@@ -1,15 +1,22 @@
 """
 نظام التقارير المتقدم والمراقبة المباشرة
 """
+from django.conf import settings
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse, HttpResponse
 from django.utils import timezone
-from django.db.models import Q, Count, Avg, F, Sum
+from django.utils.dateparse import parse_date
+from django.db.models import Q, Count
 from datetime import timedelta, datetime
-from .models import Ticket, TicketAction, TicketAcknowledgment
-from accounts.models import CustomUser, PenaltyPoints, Department
+from .models import DailyReportSnapshot, MetricCounter, PerformanceMetricPoint, Ticket, TicketAction, TicketAcknowledgment
+from accounts.models import PenaltyPoints, Department
 from .decorators import can_view_reports, can_view_monitoring
+from .cache_utils import get_counters, get_daily_counters
+from .daily_report import labelled_trend
+from .metrics import (
+    PENALTY_FIELDS, department_performance, employee_performance, rollup_start_day, rollup_totals,
+)
 import json
 import csv
 
@@ -42,35 +49,12 @@ def monitoring_dashboard(request):
         resolved_at__gte=now.replace(hour=0, minute=0, second=0)
     ).count()
     
-    # نسبة الالتزام بالمهلة
-    total_resolved = Ticket.objects.filter(status__in=['resolved', 'closed']).count()
-    on_time_resolved = Ticket.objects.filter(
-        status__in=['resolved', 'closed'],
-        resolved_at__lte=F('sla_deadline')
-    ).count()
-    compliance_rate = (on_time_resolved / total_resolved * 100) if total_resolved > 0 else 0
-    
-    # متوسط وقت الاستجابة (بالساعات)
-    avg_response = Ticket.objects.filter(
-        acknowledged_at__isnull=False
-    ).annotate(
-        response_time=F('acknowledged_at') - F('created_at')
-    ).aggregate(avg=Avg('response_time'))
-    
-    avg_response_hours = 0
-    if avg_response['avg']:
-        avg_response_hours = avg_response['avg'].total_seconds() / 3600
-    
-    # متوسط وقت الحل (بالساعات)
-    avg_resolution = Ticket.objects.filter(
-        resolved_at__isnull=False
-    ).annotate(
-        resolution_time=F('resolved_at') - F('created_at')
-    ).aggregate(avg=Avg('resolution_time'))
-    
-    avg_resolution_hours = 0
-    if avg_resolution['avg']:
-        avg_resolution_hours = avg_resolution['avg'].total_seconds() / 3600
+    # نسبة الالتزام ومتوسطا الاستجابة والحل (بالساعات) من السلسلة الزمنية المحفوظة
+    # (None قبل أول ملء للسلسلة فتعرض اللوحة "—" بدلاً من أصفار)
+    metrics = {
+        metric: round(value, 1) if value is not None else None
+        for metric, value in PerformanceMetricPoint.summary().items()
+    }
     
     # الأقسام الأسوأ أداءً
     worst_departments = Department.objects.annotate(
@@ -85,9 +69,9 @@ def monitoring_dashboard(request):
         'pending_tickets': pending_tickets,
         'violated_tickets': violated_tickets,
         'resolved_today': resolved_today,
-        'compliance_rate': round(compliance_rate, 1),
-        'avg_response_hours': round(avg_response_hours, 1),
-        'avg_resolution_hours': round(avg_resolution_hours, 1),
+        'compliance_rate': metrics['compliance_rate'],
+        'avg_response_hours': metrics['response_hours'],
+        'avg_resolution_hours': metrics['resolution_hours'],
         'worst_departments': worst_departments,
     }
     
@@ -119,14 +103,104 @@ def monitoring_api(request):
         status__in=['new', 'pending_ack', 'in_progress']
     ).count()
     
+    # زمن اكتشاف المخالفة عبر مؤقتات المهل (متوسط بالثواني) وما فات المؤقتات إلى الفحص الدوري
+    # (تُزاد في عامل Celery، لذا تُقرأ من قاعدة البيانات لا من الذاكرة المؤقتة)
+    sla_timers = MetricCounter.read('sla_timer_fired', 'sla_timer_latency_ms', 'sla_sweep_caught')
+    
+    # ذاكرة ملفات PDF: نسبة الإصابة ومتوسط زمن التوليد
+    pdf = MetricCounter.read('pdf_cache_hit', 'pdf_cache_miss', 'pdf_render_count', 'pdf_render_ms')
+    pdf_requests = pdf['pdf_cache_hit'] + pdf['pdf_cache_miss']
+    
     return JsonResponse({
         'overdue_count': overdue_count,
         'critical_count': critical_count,
         'pending_count': pending_count,
+        'cache_counters': get_counters(
+            'pending_ack_hit', 'pending_ack_miss', 'notification_fanout_rows', 'notification_fanout_ms'
+        ),
+        'notification_savings_today': get_daily_counters(
+            'notification_rows_saved', 'digest_emails_suppressed', 'digest_emails_sent'
+        ),
+        'sla_detection': {
+            'timer_violations': sla_timers['sla_timer_fired'],
+            'avg_latency_seconds': round(
+                sla_timers['sla_timer_latency_ms'] / sla_timers['sla_timer_fired'] / 1000, 1
+            ) if sla_timers['sla_timer_fired'] else None,
+            'sweep_violations': sla_timers['sla_sweep_caught'],
+        },
+        'pdf_cache': {
+            'hits': pdf['pdf_cache_hit'],
+            'misses': pdf['pdf_cache_miss'],
+            'hit_rate': round(pdf['pdf_cache_hit'] / pdf_requests * 100, 1) if pdf_requests else None,
+            'renders': pdf['pdf_render_count'],
+            'avg_render_ms': (
+                pdf['pdf_render_ms'] // pdf['pdf_render_count'] if pdf['pdf_render_count'] else None
+            ),
+        },
         'timestamp': now.isoformat()
     })
 
 
+@login_required
+@can_view_monitoring
+def performance_metrics_api(request):
+    """
+    السلسلة الزمنية لمقاييس الأداء (قراءة نطاق مع تقليص إلى points نقطة على الأكثر)
+    المعاملات: metric (أو الكل)، scope (all أو department:<id>)، days (الافتراضي 30)، points
+    """
+    now = timezone.now()
+    metrics = dict(PerformanceMetricPoint.METRIC_CHOICES)
+    requested = request.GET.get('metric')
+    if requested and requested not in metrics:
+        return JsonResponse({'error': 'مقياس غير معروف'}, status=400)
+    try:
+        days = max(int(request.GET.get('days', 30)), 1)
+        max_points = min(
+            max(int(request.GET.get('points', settings.PERFORMANCE_METRIC_MAX_POINTS)), 1),
+            settings.PERFORMANCE_METRIC_MAX_POINTS,
+        )
+    except ValueError:
+        return JsonResponse({'error': 'قيمة غير صحيحة'}, status=400)
+    scope = request.GET.get('scope', PerformanceMetricPoint.SCOPE_ALL)
+
+    series = {
+        metric: [
+            {'t': timezone.localtime(bucket_start).isoformat(), 'value': round(value, 2), 'samples': samples}
+            for bucket_start, value, samples in PerformanceMetricPoint.series(
+                metric, scope, start=now - timedelta(days=days), max_points=max_points
+            )
+        ]
+        for metric in ([requested] if requested else metrics)
+    }
+    return JsonResponse({
+        'scope': scope,
+        'days': days,
+        'labels': {metric: metrics[metric] for metric in series},
+        'series': series,
+        'timestamp': now.isoformat(),
+    })
+
+
+@login_required
+@can_view_reports
+def daily_report(request):
+    """
+    التقرير اليومي المحفوظ (لقطة) مع الفرق عن التقرير السابق - دون إعادة الحساب
+    """
+    snapshots = DailyReportSnapshot.objects.all()
+    day = parse_date(request.GET.get('day') or '')
+    snapshot = (snapshots.filter(day=day) if day else snapshots).first()
+    previous = snapshot.previous() if snapshot else None
+
+    context = {
+        'snapshot': snapshot,
+        'previous': previous,
+        'trend': labelled_trend(snapshot.trend(previous)) if snapshot else [],
+        'recent_days': list(snapshots.values_list('day', flat=True)[:30]),
+    }
+    return render(request, 'tickets/daily_report.html', context)
+
+
 @login_required
 @can_view_reports
 def performance_report(request):
@@ -139,46 +213,23 @@ def performance_report(request):
     period_days = int(request.GET.get('period', 30))
     start_date = now - timedelta(days=period_days)
     
+    # الأرقام من الجدول المجمّع TicketDailyStat (زمن التقرير يعتمد على عدد الأيام فقط)
+    start_day = rollup_start_day(period_days, now)
+    
     # إحصائيات عامة
-    total_tickets = Ticket.objects.filter(created_at__gte=start_date).count()
-    resolved_tickets = Ticket.objects.filter(
-        resolved_at__gte=start_date,
-        status__in=['resolved', 'closed']
-    ).count()
-    violated_tickets = Ticket.objects.filter(
-        created_at__gte=start_date,
-        status='violated'
-    ).count()
+    totals = rollup_totals(start_day)
+    total_tickets = totals['total']
+    resolved_tickets = totals['resolved']
+    violated_tickets = totals['violated']
     
     # أداء الأقسام
-    departments_performance = Department.objects.annotate(
-        total=Count('tickets', filter=Q(tickets__created_at__gte=start_date)),
-        resolved=Count('tickets', filter=Q(
-            tickets__resolved_at__gte=start_date,
-            tickets__status__in=['resolved', 'closed']
-        )),
-        violated=Count('tickets', filter=Q(
-            tickets__created_at__gte=start_date,
-            tickets__status='violated'
-        )),
-        penalty_points=Sum('penalties__points', filter=Q(penalties__created_at__gte=start_date))
-    ).order_by('-violated')
+    departments_performance = department_performance(start_day).order_by('-violated')
     
     # أداء الموظفين
-    employees_performance = CustomUser.objects.filter(
-        role__in=['employee', 'head']
-    ).annotate(
-        total=Count('assigned_tickets', filter=Q(assigned_tickets__created_at__gte=start_date)),
-        resolved=Count('assigned_tickets', filter=Q(
-            assigned_tickets__resolved_at__gte=start_date,
-            assigned_tickets__status__in=['resolved', 'closed']
-        )),
-        violated=Count('assigned_tickets', filter=Q(
-            assigned_tickets__created_at__gte=start_date,
-            assigned_tickets__status='violated'
-        )),
-        penalty_points=Sum('penalties__points', filter=Q(penalties__created_at__gte=start_date))
-    ).filter(total__gt=0).order_by('-violated')
+    employees_performance = employee_performance(start_day).filter(
+        role__in=['employee', 'head'],
+        total__gt=0
+    ).order_by('-violated')
     
     # أفضل الموظفين
     best_employees = employees_performance.filter(violated=0).order_by('-resolved')[:10]
@@ -239,19 +290,9 @@ def export_performance_excel(request):
         cell.font = header_font
         cell.alignment = Alignment(horizontal='center')
     
-    # البيانات
-    departments = Department.objects.annotate(
-        total=Count('tickets', filter=Q(tickets__created_at__gte=start_date)),
-        resolved=Count('tickets', filter=Q(
-            tickets__resolved_at__gte=start_date,
-            tickets__status__in=['resolved', 'closed']
-        )),
-        violated=Count('tickets', filter=Q(
-            tickets__created_at__gte=start_date,
-            tickets__status='violated'
-        )),
-        penalty_points=Sum('penalties__points', filter=Q(penalties__created_at__gte=start_date))
-    ).order_by('-violated')
+    # البيانات (من الجدول المجمّع)
+    start_day = rollup_start_day(period_days, now)
+    departments = department_performance(start_day).order_by('-violated')
     
     for dept in departments:
         ws_dept.append([
@@ -272,20 +313,10 @@ def export_performance_excel(request):
         cell.font = header_font
         cell.alignment = Alignment(horizontal='center')
     
-    employees = CustomUser.objects.filter(
-        role__in=['employee', 'head']
-    ).annotate(
-        total=Count('assigned_tickets', filter=Q(assigned_tickets__created_at__gte=start_date)),
-        resolved=Count('assigned_tickets', filter=Q(
-            assigned_tickets__resolved_at__gte=start_date,
-            assigned_tickets__status__in=['resolved', 'closed']
-        )),
-        violated=Count('assigned_tickets', filter=Q(
-            assigned_tickets__created_at__gte=start_date,
-            assigned_tickets__status='violated'
-        )),
-        penalty_points=Sum('penalties__points', filter=Q(penalties__created_at__gte=start_date))
-    ).filter(total__gt=0).order_by('-violated')
+    employees = employee_performance(start_day).filter(
+        role__in=['employee', 'head'],
+        total__gt=0
+    ).order_by('-violated')
     
     for emp in employees:
         ws_emp.append([
@@ -331,17 +362,17 @@ def penalty_points_report(request):
     period_days = int(request.GET.get('period', 30))
     start_date = now - timedelta(days=period_days)
     
-    # النقاط الجزائية حسب الموظف
-    employee_penalties = CustomUser.objects.annotate(
-        total_points=Sum('penalties__points', filter=Q(penalties__created_at__gte=start_date)),
-        penalty_count=Count('penalties', filter=Q(penalties__created_at__gte=start_date))
-    ).filter(total_points__gt=0).order_by('-total_points')
+    start_day = rollup_start_day(period_days, now)
+    
+    # النقاط الجزائية حسب الموظف (من الجدول المجمّع)
+    employee_penalties = employee_performance(start_day, PENALTY_FIELDS).filter(
+        total_points__gt=0
+    ).order_by('-total_points')
     
     # النقاط الجزائية حسب القسم
-    department_penalties = Department.objects.annotate(
-        total_points=Sum('penalties__points', filter=Q(penalties__created_at__gte=start_date)),
-        penalty_count=Count('penalties', filter=Q(penalties__created_at__gte=start_date))
-    ).filter(total_points__gt=0).order_by('-total_points')
+    department_penalties = department_performance(start_day, PENALTY_FIELDS).filter(
+        total_points__gt=0
+    ).order_by('-total_points')
     
     # تصنيف الموظفين
     excellent = employee_penalties.filter(total_points__lte=5)
@@ -2,14 +2,23 @@
 إشارات نظام الطلبات - لإرسال الإشعارات والبريد الإلكتروني
 Signals for ticket system - to send notifications and emails
 """
-from django.db.models.signals import post_save
-from django.dispatch import receiver
-from .models import Ticket, TicketAction
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save, m2m_changed, pre_delete, post_delete
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+from accounts.models import Department, PenaltyPoints
+from .models import Ticket, TicketAction, TicketAcknowledgment, TicketAudience, TicketDailyStat
+from .cache_utils import bump_dashboard_epoch
 from .utils import send_ticket_update_email
 import logging
 
 logger = logging.getLogger('tickets')
 
+# يُطلق بعد تعديل مجموعة طلبات بـ UPDATE أو bulk_update (لا يطلق Django post_save في هذه الحالة)
+# الوسائط: ticket_ids (معرفات الطلبات) و fields (أسماء الحقول المعدلة)
+tickets_bulk_updated = Signal()
+
 
 @receiver(post_save, sender=Ticket)
 def ticket_saved(sender, instance, created, **kwargs):
@@ -41,3 +50,206 @@ def ticket_action_created(sender, instance, created, **kwargs):
             instance.user
         )
         logger.info(f"Ticket action created: {instance.action_type} for ticket {instance.ticket.id}")
+
+
+# ============================================
+# مزامنة جدول جمهور الطلبات (TicketAudience)
+# ============================================
+
+@receiver(post_save, sender=Ticket)
+def sync_ticket_audience(sender, instance, created, update_fields=None, **kwargs):
+    """
+    تحديث صفوف الجمهور المشتقة من حقول الطلب المباشرة (المنشئ، المعين، القسم الأساسي)
+    """
+    field_reasons = {
+        'created_by_id': 'creator',
+        'assigned_to_id': 'assignee',
+        'department_id': 'home_department',
+    }
+    if created:
+        reasons = list(field_reasons.values())
+    else:
+        reasons = [
+            reason for field, reason in field_reasons.items()
+            if instance.has_changed(field)
+        ]
+    if reasons:
+        TicketAudience.rebuild_for_tickets([instance.pk], reasons)
+
+
+def _sync_m2m_audience(through, field_name, reason, instance, action, reverse, pk_set):
+    """
+    مزامنة صفوف الجمهور عند تعديل علاقة ManyToMany من أي طرف
+    """
+    if reverse and action == 'pre_clear':
+        # الطرف العكسي (مستخدم أو قسم): نحفظ الطلبات المرتبطة قبل حذف العلاقات
+        related_field = Ticket._meta.get_field(field_name).m2m_reverse_field_name()
+        instance._audience_ticket_ids = list(
+            through.objects.filter(**{related_field: instance.pk}).values_list('ticket_id', flat=True)
+        )
+        return
+
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        ticket_ids = [instance.pk]
+    elif action == 'post_clear':
+        ticket_ids = getattr(instance, '_audience_ticket_ids', [])
+    else:
+        ticket_ids = pk_set or []
+
+    TicketAudience.rebuild_for_tickets(ticket_ids, [reason])
+
+
+@receiver(m2m_changed, sender=Ticket.assigned_to_users.through)
+def sync_assigned_users_audience(sender, instance, action, reverse, pk_set, **kwargs):
+    _sync_m2m_audience(sender, 'assigned_to_users', 'co_assignee', instance, action, reverse, pk_set)
+
+
+@receiver(m2m_changed, sender=Ticket.departments.through)
+def sync_departments_audience(sender, instance, action, reverse, pk_set, **kwargs):
+    _sync_m2m_audience(sender, 'departments', 'department', instance, action, reverse, pk_set)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def sync_user_department_audience(sender, instance, created, update_fields=None, **kwargs):
+    """
+    إعادة بناء صفوف الأقسام عند إنشاء مستخدم أو تغيير قسمه
+    الحفظ الجزئي (مثل تتبع آخر نشاط) وتعديل الملف الشخصي دون نقل القسم يتم تجاهلهما
+    """
+    if not created and not _department_changed(instance, update_fields):
+        return
+    TicketAudience.rebuild_for_user(instance)
+
+
+def _department_changed(user, update_fields):
+    if update_fields is not None and 'department' not in update_fields:
+        return False
+    return user.has_changed('department_id')
+
+
+@receiver(pre_delete, sender=Department)
+def remember_department_tickets(sender, instance, **kwargs):
+    # حذف القسم يحذف علاقات departments مباشرة دون إطلاق m2m_changed
+    instance._audience_ticket_ids = list(
+        Ticket.departments.through.objects.filter(
+            department_id=instance.pk
+        ).values_list('ticket_id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Department)
+def sync_deleted_department_audience(sender, instance, **kwargs):
+    TicketAudience.rebuild_for_tickets(getattr(instance, '_audience_ticket_ids', []), ['department'])
+
+
+# ============================================
+# إبطال علم "طلبات بانتظار الإقرار" (ForceAcknowledgmentMiddleware)
+# تغييرات التعيين والأقسام تُبطله من داخل TicketAudience عند إعادة البناء
+# ============================================
+
+@receiver(post_save, sender=Ticket)
+def invalidate_pending_ack_on_status(sender, instance, created, **kwargs):
+    """
+    الدخول إلى حالة pending_ack أو الخروج منها يغيّر العلم لكل المسؤولين عن الطلب
+    """
+    if created or not instance.has_changed('status'):
+        return
+    user_ids = TicketAudience.users_for_tickets([instance.pk], TicketAudience.ASSIGNMENT_REASONS)
+    TicketAudience.invalidate_pending_acks(user_ids)
+
+
+@receiver(tickets_bulk_updated)
+def sync_bulk_updated_tickets(sender, ticket_ids, fields, **kwargs):
+    """
+    ما تفعله إشارات post_save لطلب واحد، لمجموعة طلبات عُدّلت دفعة واحدة:
+    إعادة بناء صفوف الجمهور للحقول المباشرة وإبطال علم الإقرار عند تغيّر الحالة
+    """
+    field_reasons = {
+        'created_by': 'creator',
+        'assigned_to': 'assignee',
+        'department': 'home_department',
+    }
+    reasons = [reason for field, reason in field_reasons.items() if field in fields]
+    if reasons:
+        TicketAudience.rebuild_for_tickets(ticket_ids, reasons)
+    if 'status' in fields:
+        user_ids = TicketAudience.users_for_tickets(ticket_ids, TicketAudience.ASSIGNMENT_REASONS)
+        TicketAudience.invalidate_pending_acks(user_ids)
+
+
+@receiver(post_save, sender=TicketAcknowledgment)
+@receiver(post_delete, sender=TicketAcknowledgment)
+def invalidate_pending_ack_on_acknowledgment(sender, instance, **kwargs):
+    TicketAudience.invalidate_pending_acks([instance.user_id])
+
+
+@receiver(pre_delete, sender=Ticket)
+def invalidate_pending_ack_on_ticket_delete(sender, instance, **kwargs):
+    # صفوف الجمهور تُحذف بالتتابع (CASCADE) دون إعادة بناء، لذا نجمع المستخدمين قبل الحذف
+    user_ids = TicketAudience.users_for_tickets([instance.pk], TicketAudience.ASSIGNMENT_REASONS)
+    TicketAudience.invalidate_pending_acks(user_ids)
+
+
+# ============================================
+# مؤقتات مهلة SLA (tickets.deadlines)
+# ============================================
+
+@receiver(post_save, sender=Ticket)
+def schedule_sla_timer(sender, instance, created, **kwargs):
+    """
+    جدولة مؤقت المهلة عند تعيينها أو تغييرها أو إعادة فتح الطلب
+    حل الطلب أو إغلاقه أو إرجاعه لا يحتاج إلغاءً: المؤقت القديم يتحقق من الحالة عند تنفيذه
+    """
+    from .deadlines import schedule_deadline
+    from .sla import OPEN_STATUSES
+
+    if instance.status not in OPEN_STATUSES or not instance.sla_deadline:
+        return
+    if created or instance.has_changed('sla_deadline') or instance.has_changed('status'):
+        ticket_id, deadline = instance.pk, instance.sla_deadline
+        transaction.on_commit(lambda: schedule_deadline(ticket_id, deadline))
+
+
+# ============================================
+# الإحصائيات اليومية (TicketDailyStat) - الحذف لا يظهر في التحديث التزايدي فتُعلّم أيامه
+# ============================================
+
+@receiver(post_delete, sender=Ticket)
+def mark_deleted_ticket_days(sender, instance, **kwargs):
+    TicketDailyStat.mark_dirty(
+        timezone.localdate(value)
+        for value in (instance.created_at, instance.acknowledged_at, instance.resolved_at) if value
+    )
+
+
+@receiver(post_delete, sender=PenaltyPoints)
+def mark_deleted_penalty_day(sender, instance, **kwargs):
+    TicketDailyStat.mark_dirty([timezone.localdate(instance.created_at)])
+
+
+# ============================================
+# حقبة بيانات لوحة التحكم - أي تعديل على الطلبات يبطل الإحصائيات المحفوظة
+# ============================================
+
+@receiver(post_save, sender=Ticket)
+@receiver(post_delete, sender=Ticket)
+@receiver(post_save, sender=TicketAction)
+@receiver(post_save, sender=TicketAcknowledgment)
+@receiver(post_delete, sender=TicketAcknowledgment)
+@receiver(m2m_changed, sender=Ticket.assigned_to_users.through)
+@receiver(m2m_changed, sender=Ticket.departments.through)
+@receiver(tickets_bulk_updated)
+def bump_dashboard_epoch_on_change(sender, action=None, **kwargs):
+    if action is not None and not action.startswith('post_'):
+        return
+    transaction.on_commit(bump_dashboard_epoch)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def bump_dashboard_epoch_on_department_change(sender, instance, created, update_fields=None, **kwargs):
+    # نقل المستخدم لقسم آخر يغيّر ما يراه في لوحته
+    if not created and not _department_changed(instance, update_fields):
+        return
+    transaction.on_commit(bump_dashboard_epoch)
@@ -0,0 +1,238 @@
+"""
+محرك مخالفات SLA على مستوى المجموعات (set-based)
+
+بدلاً من حلقة لكل طلب (حفظان + إجراء + جزاء + بريد لكل مستلم) تُعالج الطلبات المتأخرة
+على دفعات من SLA_BATCH_SIZE طلباً، ولكل دفعة معاملة واحدة فيها:
+1. UPDATE واحد: الحالة violated ورفع مستوى التصعيد (CASE) - بشرط أن الطلب ما زال مفتوحاً
+2. bulk_create لإجراءات التصعيد (TicketAction)
+3. bulk_create للنقاط الجزائية (PenaltyPoints.record - مرة واحدة لكل طلب ويوم)
+وبعد تثبيت كل الدفعات تُرسل إشعارات التصعيد والبريد مجمّعة في مرحلة واحدة.
+
+التكرار آمن: شرط الحالة في UPDATE يجعل كل طلب يُخالَف مرة واحدة فقط، والتشغيل الواحد يتقدم
+بمؤشر المعرف فلا يمر على الطلب مرتين. الصفوف المقفلة من تشغيل متزامن تُتخطى (SKIP LOCKED)
+حيث يدعمها محرك قاعدة البيانات.
+"""
+import logging
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from accounts.models import PenaltyPoints
+from notifications.fanout import RoleDirectory, create_notification_batch, escalation_messages
+from notifications.models import EmailOutbox
+from .locks import heartbeat
+from .models import Ticket, TicketAction
+from .signals import tickets_bulk_updated
+from .utils import queue_ticket_update_emails
+
+logger = logging.getLogger('celery')
+
+OPEN_STATUSES = ['new', 'pending_ack', 'in_progress']
+
+ESCALATION_MAP = {
+    'none': 'head',
+    'head': 'dean',
+    'dean': 'president',
+}
+
+PHASES = ('select', 'update', 'actions', 'penalties', 'dispatch')
+
+
+def calculate_penalty_points(delay_hours):
+    """
+    حساب النقاط الجزائية حسب مدة التأخير
+    """
+    if delay_hours < 4:
+        return 1
+    elif delay_hours < 8:
+        return 3
+    elif delay_hours < 24:
+        return 5
+    else:
+        return 10
+
+
+def escalation_email(ticket, recipients):
+    """
+    رسائل بريد التصعيد للمستوى الأعلى (رسالة مستقلة لكل مستلم، غير محفوظة)
+    """
+    return EmailOutbox.build(
+        subject=f'⚠️ تنبيه: تصعيد طلب - {ticket.title}',
+        body=f'''
+تم تصعيد الطلب التالي إلى مستواك:
+
+العنوان: {ticket.title}
+القسم: {ticket.department.name if ticket.department else 'غير محدد'}
+الأولوية: {ticket.get_priority_display()}
+تأخير: {ticket.hours_delayed:.1f} ساعة
+
+الرجاء اتخاذ الإجراء اللازم فوراً.
+                ''',
+        recipients=recipients,
+        separately=True,
+    )
+
+
+@contextmanager
+def _timed(timings, phase):
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        timings[phase] += time.monotonic() - started
+
+
+def _next_level():
+    return Case(
+        *[When(escalation_level=current, then=Value(level)) for current, level in ESCALATION_MAP.items()],
+        default=F('escalation_level'),
+    )
+
+
+def _violate_batch(tickets, now, timings):
+    """
+    مخالفة دفعة طلبات داخل المعاملة الحالية - يعيد الطلبات التي غيّرها هذا التشغيل فعلاً
+    """
+    ids = [ticket.pk for ticket in tickets]
+    with _timed(timings, 'update'):
+        updated = Ticket.objects.filter(pk__in=ids, status__in=OPEN_STATUSES).update(
+            status='violated',
+            escalation_level=_next_level(),
+            updated_at=now,
+        )
+        if updated != len(tickets):
+            # سبقنا تشغيل آخر (أو أُغلق الطلب) لبعض الصفوف: updated_at=now يميّز ما غيّره هذا التشغيل
+            mine = set(Ticket.objects.filter(
+                pk__in=ids, status='violated', updated_at=now
+            ).values_list('pk', flat=True))
+            tickets = [ticket for ticket in tickets if ticket.pk in mine]
+        if not tickets:
+            return []
+
+    for ticket in tickets:
+        ticket.previous_escalation_level = ticket.escalation_level
+        ticket.escalation_level = ESCALATION_MAP.get(ticket.escalation_level, ticket.escalation_level)
+        ticket.status = 'violated'
+        ticket.updated_at = now
+        ticket.delay_hours = (now - ticket.sla_deadline).total_seconds() / 3600
+
+    with _timed(timings, 'actions'):
+        TicketAction.objects.bulk_create([
+            TicketAction(
+                ticket_id=ticket.pk,
+                action_type='escalated',
+                notes=f'تم التصعيد تلقائياً بسبب تجاوز المهلة. تأخير: {ticket.delay_hours:.1f} ساعة',
+            )
+            for ticket in tickets
+        ])
+
+    with _timed(timings, 'penalties'):
+        # مفتاح المصدر (الطلب، القاعدة، اليوم) يمنع احتسابها مرة ثانية من المهمة اليومية أو المخالفة اليدوية
+        day = timezone.localdate(now)
+        penalties = PenaltyPoints.record(
+            PenaltyPoints.for_ticket(
+                ticket,
+                points=calculate_penalty_points(ticket.delay_hours),
+                reason=f'تجاوز مهلة الطلب: {ticket.title} - تأخير {ticket.delay_hours:.1f} ساعة',
+                day=day,
+            )
+            for ticket in tickets
+        )
+        penalty_points = {penalty.ticket_id: penalty.points for penalty in penalties}
+        for ticket in tickets:
+            ticket.penalty_points = penalty_points.get(ticket.pk, 0)
+
+    # UPDATE لا يطلق post_save: الجمهور وعلم الإقرار وحقبة لوحة التحكم تُحدَّث من هذه الإشارة
+    tickets_bulk_updated.send(
+        sender=Ticket, ticket_ids=[ticket.pk for ticket in tickets], fields=['status', 'escalation_level']
+    )
+    return tickets
+
+
+def _dispatch(ticket_ids, batch_size):
+    """
+    إشعارات وبريد التصعيد لكل الطلبات المخالفة في هذا التشغيل - مرحلة واحدة بعد التثبيت
+    يعيد (عدد الإشعارات، عدد رسائل البريد)
+    """
+    notifications = emails = 0
+    for start in range(0, len(ticket_ids), batch_size):
+        heartbeat()
+        tickets = list(
+            Ticket.objects.filter(pk__in=ticket_ids[start:start + batch_size])
+            .select_related('department', 'created_by', 'assigned_to')
+            .prefetch_related('assigned_to_users')
+        )
+        directory = RoleDirectory({ticket.department_id for ticket in tickets})
+
+        entries = []
+        messages = []
+        for ticket in tickets:
+            entries.extend(
+                (user_ids, title, message, ticket.pk, None)
+                for user_ids, title, message in escalation_messages(ticket, directory)
+            )
+            messages.extend(escalation_email(ticket, [
+                directory.emails[user_id] for user_id in directory.escalation_targets(ticket)
+            ]))
+
+        notifications += create_notification_batch(entries, 'ticket_escalated')
+        EmailOutbox.enqueue_many(messages)
+        emails += len(messages) + queue_ticket_update_emails(tickets, 'escalated')
+    return notifications, emails
+
+
+def process_sla_violations(now=None, batch_size=None, ticket_ids=None):
+    """
+    معالجة كل الطلبات التي تجاوزت مهلتها وما زالت مفتوحة (أو طلبات محددة فقط عبر ticket_ids)
+    يعيد إحصائيات التشغيل: عدد الصفوف لكل مرحلة وزمنها بالمللي ثانية
+    """
+    now = now or timezone.now()
+    batch_size = batch_size or getattr(settings, 'SLA_BATCH_SIZE', 500)
+    skip_locked = connection.features.has_select_for_update_skip_locked
+    timings = defaultdict(float)
+    stats = {'batches': 0, 'violated': 0, 'penalty_points': 0, 'notifications': 0, 'emails': 0}
+
+    violated_ids = []
+    last_pk = 0
+    while True:
+        # تجديد عقد المهمة الدورية بين الدفعات (لا شيء خارج single_flight)
+        heartbeat()
+        with transaction.atomic():
+            with _timed(timings, 'select'):
+                overdue = Ticket.objects.select_for_update(skip_locked=skip_locked).filter(
+                    status__in=OPEN_STATUSES, sla_deadline__lt=now, pk__gt=last_pk
+                )
+                if ticket_ids is not None:
+                    overdue = overdue.filter(pk__in=ticket_ids)
+                tickets = list(overdue.order_by('pk')[:batch_size])
+            if not tickets:
+                break
+            last_pk = tickets[-1].pk
+            tickets = _violate_batch(tickets, now, timings)
+
+        stats['batches'] += 1
+        stats['violated'] += len(tickets)
+        stats['penalty_points'] += sum(ticket.penalty_points for ticket in tickets)
+        violated_ids.extend(ticket.pk for ticket in tickets)
+        for ticket in tickets:
+            logger.warning(
+                f'Ticket #{ticket.pk} violated SLA - {ticket.delay_hours:.1f}h delay - '
+                f'escalated {ticket.previous_escalation_level} -> {ticket.escalation_level}'
+            )
+
+    if violated_ids:
+        with _timed(timings, 'dispatch'):
+            stats['notifications'], stats['emails'] = _dispatch(violated_ids, batch_size)
+
+    stats['timings_ms'] = {phase: int(timings[phase] * 1000) for phase in PHASES}
+    logger.info(
+        f"SLA check: {stats['violated']} tickets violated in {stats['batches']} batches, "
+        f"{stats['notifications']} notifications, {stats['emails']} emails - "
+        + ', '.join(f'{phase} {ms}ms' for phase, ms in stats['timings_ms'].items())
+    )
+    return stats
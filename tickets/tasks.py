@@ -1,11 +1,15 @@
 from celery import shared_task
 from django.utils import timezone
-from django.conf import settings
-from django.core.mail import send_mail
-from django.db.models import Q, Count, Avg, F
-from datetime import timedelta
-from .models import Ticket, TicketAction, TicketAcknowledgment
-from accounts.models import CustomUser, PenaltyPoints, Department
+from django.db.models import Avg, F, Exists, OuterRef
+from .models import MetricCounter, PerformanceMetricPoint, Ticket, TicketAcknowledgment, TicketDailyStat
+from .metrics import local_day_bounds
+from .daily_report import build_snapshot, deliver_snapshot
+from .deadlines import arm_upcoming_deadlines, fire_deadline, send_due_warnings, warning_email
+from .locks import single_flight
+from .reassignment import apply_reassignments, plan_reassignments
+from .sla import ESCALATION_MAP, calculate_penalty_points, escalation_email, process_sla_violations
+from accounts.models import CustomUser, PenaltyPoints
+from notifications.models import EmailOutbox
 import logging
 
 # Initialize logger
@@ -13,80 +17,38 @@ logger = logging.getLogger('celery')
 
 
 @shared_task
+@single_flight(coalesce=True)
 def check_sla_violations():
     """
-    مهمة تعمل كل 5 دقائق للتحقق من انتهاكات SLA
+    فحص الاسترداد الدوري لمهل SLA
+    المخالفات تُكتشف عادة لحظة انتهاء المهلة عبر مؤقتات fire_sla_deadline (tickets.deadlines)؛
+    هذا الفحص يلتقط ما فات المؤقتات ويسلّح مؤقتات المهل التي تقترب
+    المعالجة على دفعات (UPDATE واحد + bulk_create لكل دفعة) - انظر tickets.sla
     """
-    logger.info('Starting SLA violations check')
-    now = timezone.now()
-    
-    # البحث عن جميع التذاكر التي تجاوزت الموعد النهائي وليست محلولة
-    violated_tickets = Ticket.objects.filter(
-        Q(status__in=['new', 'pending_ack', 'in_progress']) &
-        Q(sla_deadline__lt=now)
-    ).exclude(status='violated')
-    
-    count = violated_tickets.count()
-    logger.info(f'Found {count} tickets violating SLA')
-    
-    for ticket in violated_tickets:
-        # تحديث الحالة إلى مخالف
-        ticket.status = 'violated'
-        ticket.save()
-        
-        # تسجيل الإجراء
-        TicketAction.objects.create(
-            ticket=ticket,
-            action_type='escalated',
-            notes=f'تم التصعيد تلقائياً بسبب تجاوز المهلة. تأخير: {ticket.hours_delayed:.1f} ساعة'
-        )
-        
-        # إضافة نقاط جزائية حسب مدة التأخير
-        delay_hours = ticket.hours_delayed
-        penalty_points = calculate_penalty_points(delay_hours)
-        
-        PenaltyPoints.objects.create(
-            department=ticket.department,
-            user=ticket.assigned_to,
-            points=penalty_points,
-            reason=f'تجاوز مهلة الطلب: {ticket.title} - تأخير {delay_hours:.1f} ساعة'
-        )
-        
-        logger.warning(f'Ticket #{ticket.id} violated SLA - {ticket.hours_delayed:.1f}h delay - {penalty_points} penalty points')
-        
-        # التصعيد التلقائي
-        escalate_ticket(ticket)
-    
-    logger.info(f'Completed SLA check - processed {count} violations')
-    return f'تم معالجة {count} تذكرة مخالفة'
+    stats = process_sla_violations()
+    armed = arm_upcoming_deadlines()
+    if stats['violated']:
+        # مخالفات لم يلتقطها مؤقت
+        MetricCounter.incr('sla_sweep_caught', stats['violated'])
+        logger.warning(f"SLA sweep caught {stats['violated']} violations missed by timers")
+    logger.info(f"Completed SLA sweep - {stats['violated']} violations, {armed} timers armed")
+    return f"تم معالجة {stats['violated']} تذكرة مخالفة"
 
 
-def calculate_penalty_points(delay_hours):
+@shared_task
+def fire_sla_deadline(ticket_id, deadline):
     """
-    حساب النقاط الجزائية حسب مدة التأخير
+    مؤقت مهلة طلب واحد (ETA = المهلة) - لا يعمل شيئاً إذا أُغلق الطلب أو تغيرت مهلته
     """
-    if delay_hours < 4:
-        return 1
-    elif delay_hours < 8:
-        return 3
-    elif delay_hours < 24:
-        return 5
-    else:
-        return 10
+    return fire_deadline(ticket_id, deadline)
 
 
 def escalate_ticket(ticket):
     """
     تصعيد التذكرة للمستوى الأعلى
     """
-    escalation_map = {
-        'none': 'head',
-        'head': 'dean',
-        'dean': 'president',
-    }
-    
     current_level = ticket.escalation_level
-    next_level = escalation_map.get(current_level)
+    next_level = ESCALATION_MAP.get(current_level)
     
     if next_level:
         ticket.escalation_level = next_level
@@ -120,320 +82,120 @@ def notify_escalation(ticket, level):
     else:
         recipients = CustomUser.objects.filter(role=target_role)
     
-    # إرسال بريد إلكتروني
-    for recipient in recipients:
-        if recipient.email:
-            send_mail(
-                subject=f'⚠️ تنبيه: تصعيد طلب - {ticket.title}',
-                message=f'''
-تم تصعيد الطلب التالي إلى مستواك:
-
-العنوان: {ticket.title}
-القسم: {ticket.department.name if ticket.department else 'غير محدد'}
-الأولوية: {ticket.get_priority_display()}
-تأخير: {ticket.hours_delayed:.1f} ساعة
-
-الرجاء اتخاذ الإجراء اللازم فوراً.
-                ''',
-                from_email=settings.DEFAULT_FROM_EMAIL if hasattr(settings, 'DEFAULT_FROM_EMAIL') else 'noreply@university.edu',
-                recipient_list=[recipient.email],
-                fail_silently=True,
-            )
+    # إرسال بريد إلكتروني (رسالة مستقلة لكل مستلم عبر صندوق البريد الصادر)
+    EmailOutbox.enqueue_many(escalation_email(ticket, recipients.values_list('email', flat=True)))
 
 
 @shared_task
+@single_flight(coalesce=True)
 def send_deadline_warnings():
     """
-    إرسال تحذيرات قبل انتهاء المهلة
+    إرسال تحذيرات قبل انتهاء المهلة - مرة واحدة لكل عتبة في SLA_WARNING_THRESHOLDS
     """
-    now = timezone.now()
-    
-    # تحذير قبل ساعتين
-    two_hours_ahead = now + timedelta(hours=2)
-    tickets_2h = Ticket.objects.filter(
-        status__in=['new', 'pending_ack', 'in_progress'],
-        sla_deadline__lte=two_hours_ahead,
-        sla_deadline__gt=now
-    )
-    
-    for ticket in tickets_2h:
-        time_left = ticket.sla_deadline - now
-        hours_left = time_left.total_seconds() / 3600
-        
-        if 1.5 <= hours_left <= 2.5:  # تحذير في نطاق ساعتين
-            send_warning_email(ticket, 'warning', hours_left)
-    
-    # تحذير نهائي قبل 30 دقيقة
-    thirty_min_ahead = now + timedelta(minutes=30)
-    tickets_30m = Ticket.objects.filter(
-        status__in=['new', 'pending_ack', 'in_progress'],
-        sla_deadline__lte=thirty_min_ahead,
-        sla_deadline__gt=now
-    )
-    
-    for ticket in tickets_30m:
-        time_left = ticket.sla_deadline - now
-        minutes_left = time_left.total_seconds() / 60
-        
-        if 20 <= minutes_left <= 40:  # تحذير في نطاق 30 دقيقة
-            send_warning_email(ticket, 'urgent', minutes_left / 60)
-    
-    return f'تم إرسال تحذيرات لـ {tickets_2h.count() + tickets_30m.count()} طلب'
+    count = send_due_warnings()
+    return f'تم إرسال تحذيرات لـ {count} طلب'
 
 
 def send_warning_email(ticket, urgency, hours_left):
     """
     إرسال بريد تحذيري
     """
-    if urgency == 'urgent':
-        subject = f'🚨 تحذير عاجل: الطلب #{ticket.id} على وشك تجاوز المهلة'
-        message = f'''
-تحذير عاجل!
-
-الطلب التالي على وشك تجاوز المهلة خلال {hours_left * 60:.0f} دقيقة:
-
-العنوان: {ticket.title}
-الأولوية: {ticket.get_priority_display()}
-الموعد النهائي: {ticket.sla_deadline.strftime('%Y-%m-%d %H:%M')}
-
-يرجى اتخاذ الإجراء فوراً!
-        '''
-    else:
-        subject = f'⏰ تذكير: الطلب #{ticket.id} يقترب من المهلة'
-        message = f'''
-تذكير بالمهلة
-
-الطلب التالي يقترب من الموعد النهائي خلال {hours_left:.1f} ساعة:
-
-العنوان: {ticket.title}
-الأولوية: {ticket.get_priority_display()}
-الموعد النهائي: {ticket.sla_deadline.strftime('%Y-%m-%d %H:%M')}
-
-يرجى العمل على حل الطلب في أقرب وقت.
-        '''
-    
-    # إرسال للموظف المعين
-    recipients = []
-    if ticket.assigned_to and ticket.assigned_to.email:
-        recipients.append(ticket.assigned_to.email)
-    
-    # إرسال لجميع المعينين
-    for user in ticket.assigned_to_users.all():
-        if user.email and user.email not in recipients:
-            recipients.append(user.email)
-    
-    if recipients:
-        send_mail(
-            subject=subject,
-            message=message,
-            from_email=settings.DEFAULT_FROM_EMAIL if hasattr(settings, 'DEFAULT_FROM_EMAIL') else 'noreply@university.edu',
-            recipient_list=recipients,
-            fail_silently=True,
-        )
+    EmailOutbox.enqueue_many(warning_email(ticket, urgency, hours_left))
 
 
 @shared_task
+@single_flight()
 def calculate_daily_penalties():
     """
     حساب النقاط الجزائية اليومية
+    الطلبات المخالفة اليوم التي لم تُسجل عليها نقاط اليوم - استعلام واحد ثم إدراج واحد
     """
     now = timezone.now()
-    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    today = timezone.localdate(now)
+    today_start, _ = local_day_bounds(today)
     
-    # الطلبات التي تأخرت اليوم
+    # الطلبات التي تأخرت اليوم ولا تحمل نقاط تجاوز المهلة لهذا اليوم
     violated_today = Ticket.objects.filter(
         status='violated',
         updated_at__gte=today_start
-    )
-    
-    total_penalties = 0
-    
-    for ticket in violated_today:
-        # التحقق من عدم وجود نقاط جزائية مكررة لهذا الطلب اليوم
-        existing_penalty = PenaltyPoints.objects.filter(
-            user=ticket.assigned_to,
-            department=ticket.department,
-            reason__icontains=ticket.title,
-            created_at__gte=today_start
-        ).exists()
-        
-        if existing_penalty:
-            continue
-        
-        delay_hours = ticket.hours_delayed
-        penalty_points = calculate_penalty_points(delay_hours)
-        
-        PenaltyPoints.objects.create(
-            department=ticket.department,
-            user=ticket.assigned_to,
-            points=penalty_points,
-            reason=f'تأخير يومي - {ticket.title}'
+    ).exclude(
+        Exists(PenaltyPoints.objects.filter(ticket=OuterRef('pk'), rule='sla_violation', day=today))
+    ).only('pk', 'title', 'sla_deadline', 'status', 'assigned_to_id', 'department_id')
+    
+    penalties = PenaltyPoints.record(
+        PenaltyPoints.for_ticket(
+            ticket,
+            points=calculate_penalty_points(ticket.hours_delayed),
+            reason=f'تأخير يومي - {ticket.title}',
+            day=today,
         )
-        
-        total_penalties += penalty_points
+        for ticket in violated_today
+    )
     
+    total_penalties = sum(penalty.points for penalty in penalties)
     return f'تم احتساب {total_penalties} نقطة جزائية'
 
 
 @shared_task
+@single_flight()
 def auto_reassign_tickets():
     """
     إعادة تعيين التذاكر التي تأخرت أكثر من المدة المحددة
+    للموظف الأقل عبئاً في القسم (انظر tickets.reassignment)
     """
-    threshold_hours = settings.AUTO_REASSIGN_AFTER_HOURS
-    threshold_time = timezone.now() - timedelta(hours=threshold_hours)
-    
-    # البحث عن التذاكر المتأخرة جداً
-    overdue_tickets = Ticket.objects.filter(
-        status__in=['new', 'pending_ack', 'in_progress'],
-        created_at__lt=threshold_time,
-        assigned_to__isnull=False
-    )
-    
-    reassigned_count = 0
-    
-    for ticket in overdue_tickets:
-        # البحث عن موظف بديل في نفس القسم
-        current_assignee = ticket.assigned_to
-        
-        alternative_users = CustomUser.objects.filter(
-            department=ticket.department,
-            role__in=['employee', 'head'],
-            is_active=True
-        ).exclude(id=current_assignee.id if current_assignee else None)
-        
-        if alternative_users.exists():
-            # اختيار الموظف الذي لديه أقل عدد من التذاكر النشطة
-            new_assignee = alternative_users.annotate(
-                active_tickets_count=Count(
-                    'assigned_tickets',
-                    filter=Q(assigned_tickets__status__in=['new', 'pending_ack', 'in_progress'])
-                )
-            ).order_by('active_tickets_count').first()
-            
-            old_assignee = ticket.assigned_to
-            ticket.assigned_to = new_assignee
-            ticket.save()
-            
-            # تسجيل الإجراء
-            TicketAction.objects.create(
-                ticket=ticket,
-                action_type='reassigned',
-                user=new_assignee,
-                notes=f'تم إعادة التعيين تلقائياً من {old_assignee} بسبب التأخير الزائد'
-            )
-            
-            reassigned_count += 1
-    
+    reassigned_count = apply_reassignments(plan_reassignments())
     return f'تم إعادة تعيين {reassigned_count} تذكرة'
 
 
 @shared_task
+@single_flight()
 def send_daily_report():
     """
-    إرسال تقرير يومي للإدارة العليا
+    إرسال تقرير يومي للإدارة العليا (يُحفظ كلقطة DailyReportSnapshot، انظر tickets.daily_report)
     """
-    now = timezone.now()
-    yesterday = now - timedelta(days=1)
-    
-    # إحصائيات عامة
-    total_tickets = Ticket.objects.count()
-    new_tickets_today = Ticket.objects.filter(created_at__gte=yesterday).count()
-    violated_tickets = Ticket.objects.filter(status='violated').count()
-    pending_tickets = Ticket.objects.filter(status__in=['new', 'pending_ack', 'in_progress']).count()
-    resolved_today = Ticket.objects.filter(resolved_at__gte=yesterday).count()
-    
-    # أسوأ الأقسام أداءً
-    departments_performance = Department.objects.annotate(
-        violated_count=Count('tickets', filter=Q(tickets__status='violated')),
-        pending_count=Count('tickets', filter=Q(tickets__status__in=['new', 'pending_ack', 'in_progress']))
-    ).order_by('-violated_count')[:5]
-    
-    # الموظفون الأقل استجابة
-    worst_employees = CustomUser.objects.annotate(
-        violated_count=Count('assigned_tickets', filter=Q(assigned_tickets__status='violated'))
-    ).filter(violated_count__gt=0).order_by('-violated_count')[:5]
-    
-    # أفضل الموظفين أداءً
-    best_employees = CustomUser.objects.annotate(
-        resolved_count=Count('assigned_tickets', filter=Q(assigned_tickets__status__in=['resolved', 'closed'])),
-        total_assigned=Count('assigned_tickets')
-    ).filter(total_assigned__gte=5).order_by('-resolved_count')[:5]
-    
-    # بناء التقرير
-    report = f'''
-📊 تقرير أداء نظام الطلبات اليومي
-التاريخ: {now.strftime('%Y-%m-%d')}
+    snapshot = build_snapshot()
+    recipients = deliver_snapshot(snapshot)
+    return f'تم إرسال التقرير اليومي إلى {recipients} مستلم'
 
-=== الإحصائيات العامة ===
-📌 إجمالي الطلبات: {total_tickets}
-🆕 طلبات جديدة اليوم: {new_tickets_today}
-✅ طلبات محلولة اليوم: {resolved_today}
-⚠️ طلبات مخالفة (تجاوزت المهلة): {violated_tickets}
-⏳ طلبات معلقة: {pending_tickets}
 
-=== الأقسام الأكثر تأخيراً ===
-'''
-    
-    for dept in departments_performance:
-        report += f'🔴 {dept.name}: {dept.violated_count} طلب مخالف, {dept.pending_count} طلب معلق\n'
-    
-    report += '\n=== الموظفون الأقل استجابة ===\n'
-    for emp in worst_employees:
-        report += f'⚠️ {emp.get_full_name()} ({emp.department}): {emp.violated_count} طلب مخالف\n'
-    
-    report += '\n=== الموظفون المتميزون ===\n'
-    for emp in best_employees:
-        report += f'⭐ {emp.get_full_name()} ({emp.department}): {emp.resolved_count} طلب محلول\n'
-    
-    # إرسال التقرير للإدارة العليا
-    admins = CustomUser.objects.filter(
-        role__in=['president', 'dean', 'admin', 'admin_assistant', 'academic_assistant']
+@shared_task
+@single_flight()
+def generate_performance_metrics():
+    """
+    تحديث السلسلة الزمنية لمقاييس الأداء (PerformanceMetricPoint) تزايدياً من آخر فترة
+    """
+    buckets, points = PerformanceMetricPoint.fill()
+    summary = {
+        metric: f'{value:.1f}' if value is not None else '-'
+        for metric, value in PerformanceMetricPoint.summary().items()
+    }
+
+    logger.info(
+        f"Performance Metrics - {buckets} buckets, {points} points - "
+        f"Response: {summary['response_hours']}h, Resolution: {summary['resolution_hours']}h, "
+        f"Compliance: {summary['compliance_rate']}%"
     )
-    
-    for admin in admins:
-        if admin.email:
-            send_mail(
-                subject=f'📊 تقرير أداء نظام الطلبات - {now.strftime("%Y-%m-%d")}',
-                message=report,
-                from_email=settings.DEFAULT_FROM_EMAIL if hasattr(settings, 'DEFAULT_FROM_EMAIL') else 'noreply@university.edu',
-                recipient_list=[admin.email],
-                fail_silently=True,
-            )
-    
-    return 'تم إرسال التقرير اليومي'
+
+    return f"تم حساب مقاييس الأداء - نسبة الالتزام: {summary['compliance_rate']}%"
 
 
 @shared_task
-def generate_performance_metrics():
+@single_flight()
+def update_daily_stats():
     """
-    إنشاء مقاييس الأداء اليومية
+    تحديث تزايدي لجدول الإحصائيات اليومية (TicketDailyStat) منذ آخر علامة مائية
     """
-    now = timezone.now()
-    
-    # حساب متوسط وقت الاستجابة
-    avg_response_time = Ticket.objects.filter(
-        acknowledged_at__isnull=False
-    ).annotate(
-        response_time=F('acknowledged_at') - F('created_at')
-    ).aggregate(avg=Avg('response_time'))
-    
-    # حساب متوسط وقت الحل
-    avg_resolution_time = Ticket.objects.filter(
-        resolved_at__isnull=False
-    ).annotate(
-        resolution_time=F('resolved_at') - F('created_at')
-    ).aggregate(avg=Avg('resolution_time'))
-    
-    # نسبة الالتزام بالمهلة
-    total_resolved = Ticket.objects.filter(status__in=['resolved', 'closed']).count()
-    on_time_resolved = Ticket.objects.filter(
-        status__in=['resolved', 'closed'],
-        resolved_at__lte=F('sla_deadline')
-    ).count()
-    
-    compliance_rate = (on_time_resolved / total_resolved * 100) if total_resolved > 0 else 0
-    
-    logger.info(f'Performance Metrics - Response: {avg_response_time}, Resolution: {avg_resolution_time}, Compliance: {compliance_rate:.1f}%')
-    
-    return f'تم حساب مقاييس الأداء - نسبة الالتزام: {compliance_rate:.1f}%'
+    days, rows = TicketDailyStat.refresh()
+    logger.info(f'Daily stats refreshed - {days} days, {rows} rows')
+    return f'تم تحديث {days} يوم ({rows} صف)'
+
+
+@shared_task
+def render_ticket_pdf_task(ticket_id):
+    """
+    توليد ملف PDF للنسخة الحالية من الطلب في الذاكرة المؤقتة على القرص (انظر tickets.pdf_render)
+    """
+    from .pdf_render import render_ticket_pdf
+
+    path = render_ticket_pdf(ticket_id)
+    return f'تم توليد PDF للطلب #{ticket_id}' if path else f'الطلب #{ticket_id} غير موجود'
@@ -1,3 +1,1114 @@
-from django.test import TestCase
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
 
-# Create your tests here.
+import json
+import os
+import tempfile
+
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Q
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from kombu import Queue
+
+from accounts.models import CustomUser, Department, PenaltyPoints
+from notifications.models import EmailOutbox, Notification, NotificationState
+from notifications.outbox import drain_outbox
+from uni_core.celery import app as celery_app
+from .cache_utils import (
+    DASHBOARD_EPOCH_KEY, bump_dashboard_epoch, get_counters, get_dashboard_epoch,
+    has_pending_acknowledgments,
+)
+from .metrics import (
+    department_performance, employee_performance, priority_breakdown, resolution_time_stats,
+    rollup_start_day, rollup_totals, ticket_trend,
+)
+from .locks import _local, heartbeat, single_flight
+from .middleware import ForceAcknowledgmentMiddleware
+from .models import (
+    DailyReportSnapshot, MetricCounter, PerformanceMetricPoint, RollupWatermark, TaskLease, Ticket, TicketAcknowledgment, TicketAction, TicketAudience, TicketDailyStat,
+)
+from .reassignment import apply_reassignments, plan_reassignments, workload_map
+from .daily_report import build_snapshot, deliver_snapshot
+from .pdf_render import cache_path, register_font, render_ticket_pdf, ticket_version
+from .deadlines import arm_upcoming_deadlines, fire_deadline, send_due_warnings
+from .sla import process_sla_violations
+
+class TicketAudienceTests(TestCase):
+    """مزامنة جدول جمهور الطلبات (TicketAudience) مع كل طرق تغيّر الرؤية"""
+
+    def setUp(self):
+        self.dept_a = Department.objects.create(name='قسم أ')
+        self.dept_b = Department.objects.create(name='قسم ب')
+        self.creator = CustomUser.objects.create_user('creator', role='employee')
+        self.head_a = CustomUser.objects.create_user('head_a', role='head', department=self.dept_a)
+        self.emp_a = CustomUser.objects.create_user('emp_a', role='employee', department=self.dept_a)
+        self.emp_b = CustomUser.objects.create_user('emp_b', role='employee', department=self.dept_b)
+        self.ticket = Ticket.objects.create(
+            title='طلب', description='-', created_by=self.creator,
+            assigned_to=self.emp_a, department=self.dept_a,
+        )
+
+    def _rows(self):
+        return set(
+            TicketAudience.objects.values_list('user__username', 'ticket_id', 'reason')
+        )
+
+    def _base_rows(self, assignee='emp_a'):
+        t = self.ticket.pk
+        return {
+            ('creator', t, 'creator'),
+            (assignee, t, 'assignee'),
+            ('head_a', t, 'home_department'),
+            ('emp_a', t, 'home_department'),
+        }
+
+    def test_create_and_reassign(self):
+        self.assertEqual(self._rows(), self._base_rows())
+
+        self.ticket.assigned_to = self.emp_b
+        self.ticket.save()
+        self.assertEqual(self._rows(), self._base_rows(assignee='emp_b'))
+
+    def test_assigned_users_add_remove_clear(self):
+        t = self.ticket.pk
+        self.ticket.assigned_to_users.add(self.emp_b, self.head_a)
+        self.assertEqual(self._rows(), self._base_rows() | {
+            ('emp_b', t, 'co_assignee'), ('head_a', t, 'co_assignee'),
+        })
+
+        self.ticket.assigned_to_users.remove(self.head_a)
+        self.assertEqual(self._rows(), self._base_rows() | {('emp_b', t, 'co_assignee')})
+
+        self.ticket.assigned_to_users.clear()
+        self.assertEqual(self._rows(), self._base_rows())
+
+        # من الطرف العكسي (المستخدم)
+        self.emp_b.multi_assigned_tickets.add(self.ticket)
+        self.assertEqual(self._rows(), self._base_rows() | {('emp_b', t, 'co_assignee')})
+        self.emp_b.multi_assigned_tickets.clear()
+        self.assertEqual(self._rows(), self._base_rows())
+
+    def test_departments_add_remove(self):
+        t = self.ticket.pk
+        self.ticket.departments.add(self.dept_b)
+        self.assertEqual(self._rows(), self._base_rows() | {('emp_b', t, 'department')})
+
+        self.ticket.departments.remove(self.dept_b)
+        self.assertEqual(self._rows(), self._base_rows())
+
+    def test_user_moving_department(self):
+        t = self.ticket.pk
+        self.ticket.departments.add(self.dept_b)
+
+        self.emp_b.department = self.dept_a
+        self.emp_b.save()
+        self.assertEqual(self._rows(), self._base_rows() | {('emp_b', t, 'home_department')})
+
+        self.emp_b.department = None
+        self.emp_b.save()
+        self.assertEqual(self._rows(), self._base_rows())
+
+    def test_profile_edit_does_not_rebuild(self):
+        user = CustomUser.objects.get(pk=self.emp_a.pk)
+        user.first_name = 'اسم جديد'
+        with patch.object(TicketAudience, 'rebuild_for_user') as rebuild:
+            user.save()
+        rebuild.assert_not_called()
+
+        user.department = self.dept_b
+        with patch.object(TicketAudience, 'rebuild_for_user') as rebuild:
+            user.save()
+            # الحفظ التالي دون تغيير القسم لا يعيد البناء مرة أخرى
+            user.save()
+        rebuild.assert_called_once_with(user)
+
+    def test_department_deleted(self):
+        other = Ticket.objects.create(
+            title='طلب آخر', description='-', created_by=self.creator, department=self.dept_a,
+        )
+        other.departments.add(self.dept_b)
+        self.assertIn(('emp_b', other.pk, 'department'), self._rows())
+
+        self.dept_b.delete()
+        self.assertEqual(self._rows(), self._base_rows() | {
+            ('creator', other.pk, 'creator'),
+            ('head_a', other.pk, 'home_department'),
+            ('emp_a', other.pk, 'home_department'),
+        })
+
+    def test_rebuild_command(self):
+        t = self.ticket.pk
+        self.ticket.departments.add(self.dept_b)
+        self.ticket.assigned_to_users.add(self.head_a)
+        expected = self._base_rows() | {('emp_b', t, 'department'), ('head_a', t, 'co_assignee')}
+
+        TicketAudience.objects.filter(reason='home_department').delete()
+        TicketAudience.objects.create(user=self.emp_b, ticket=self.ticket, reason='assignee')
+        call_command('rebuild_ticket_audience', stdout=StringIO())
+        self.assertEqual(self._rows(), expected)
+
+
+class VisibleToTests(TestCase):
+    """Ticket.objects.visible_to مقارنةً بفلاتر OR + JOIN + DISTINCT القديمة في العروض"""
+
+    def setUp(self):
+        self.dept_a = Department.objects.create(name='قسم أ')
+        self.dept_b = Department.objects.create(name='قسم ب')
+        self.president = CustomUser.objects.create_user('president', role='president')
+        self.employee = CustomUser.objects.create_user('employee', role='employee', department=self.dept_a)
+        self.head = CustomUser.objects.create_user('head', role='head', department=self.dept_a)
+        self.dean = CustomUser.objects.create_user('dean', role='dean', department=self.dept_b)
+        self.loner = CustomUser.objects.create_user('loner', role='employee')
+        self.lone_head = CustomUser.objects.create_user('lone_head', role='head')
+
+        def ticket(department=None, created_by=None, **kwargs):
+            return Ticket.objects.create(
+                title='طلب', description='-', department=department,
+                created_by=created_by or self.president, **kwargs
+            )
+
+        ticket(self.dept_a)
+        ticket(self.dept_b).departments.add(self.dept_a)
+        ticket(self.dept_b, assigned_to=self.employee)
+        ticket(self.dept_b).assigned_to_users.add(self.loner, self.head, self.lone_head)
+        ticket(self.dept_b, created_by=self.loner)
+        ticket(created_by=self.employee).assigned_to_users.add(self.dean)
+        ticket(assigned_to=self.lone_head)
+        ticket()
+
+    @staticmethod
+    def _legacy(user):
+        """الفلاتر كما كانت في ticket_list قبل جدول الجمهور"""
+        if user.is_upper_management:
+            return Ticket.objects.all()
+        if user.role == 'employee':
+            legacy = Q(assigned_to=user) | Q(assigned_to_users=user) | Q(created_by=user)
+            if user.department:
+                legacy |= Q(departments=user.department)
+        else:
+            legacy = Q(assigned_to=user) | Q(assigned_to_users=user)
+            # بدون هذا الشرط كان Q(department=None) يطابق كل الطلبات بلا قسم لرئيس بلا قسم
+            if user.department:
+                legacy |= Q(department=user.department) | Q(departments=user.department)
+        return Ticket.objects.filter(legacy).distinct()
+
+    def _assert_matches_legacy(self, user):
+        visible = set(Ticket.objects.visible_to(user).values_list('pk', flat=True))
+        self.assertEqual(visible, set(self._legacy(user).values_list('pk', flat=True)))
+        self.assertTrue(visible)
+        return visible
+
+    def test_employee(self):
+        self._assert_matches_legacy(self.employee)
+
+    def test_head(self):
+        self._assert_matches_legacy(self.head)
+
+    def test_dean(self):
+        self._assert_matches_legacy(self.dean)
+
+    def test_upper_management(self):
+        self.assertEqual(len(self._assert_matches_legacy(self.president)), Ticket.objects.count())
+
+    def test_users_without_department(self):
+        self._assert_matches_legacy(self.loner)
+        self._assert_matches_legacy(self.lone_head)
+
+    def test_unlisted_role_sees_nothing(self):
+        guest = CustomUser.objects.create_user('guest', role='guest', department=self.dept_a)
+        self.assertFalse(Ticket.objects.visible_to(guest).exists())
+
+
+class PendingAcknowledgmentFlagTests(TestCase):
+    """علم الطلبات بانتظار الإقرار المستخدم في ForceAcknowledgmentMiddleware"""
+
+    def setUp(self):
+        cache.clear()
+        self.department = Department.objects.create(name='قسم الاختبار')
+        self.creator = CustomUser.objects.create_user('creator', password='x', role='head')
+        self.employee = CustomUser.objects.create_user(
+            'employee', password='x', role='employee', department=self.department
+        )
+        self.middleware = ForceAcknowledgmentMiddleware(lambda request: HttpResponse('ok'))
+
+    def _create_ticket(self, **kwargs):
+        return Ticket.objects.create(
+            title='طلب', description='-', created_by=self.creator,
+            department=self.department, status='pending_ack', **kwargs
+        )
+
+    def _request(self, user, path='/'):
+        request = RequestFactory().get(path)
+        request.user = user
+        return self.middleware(request)
+
+    def test_cached_flag_costs_no_queries(self):
+        self._create_ticket(assigned_to=self.employee)
+
+        self.assertEqual(self._request(self.employee).status_code, 302)
+        with self.assertNumQueries(0):
+            self.assertEqual(self._request(self.employee).status_code, 302)
+
+        counters = get_counters('pending_ack_hit', 'pending_ack_miss')
+        self.assertEqual(counters, {'pending_ack_hit': 1, 'pending_ack_miss': 1})
+
+    def test_acknowledgment_clears_flag(self):
+        ticket = self._create_ticket(assigned_to=self.employee)
+        self.assertTrue(has_pending_acknowledgments(self.employee))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            TicketAcknowledgment.objects.create(ticket=ticket, user=self.employee)
+        self.assertFalse(has_pending_acknowledgments(self.employee))
+
+    def test_assignment_and_status_changes_invalidate(self):
+        ticket = self._create_ticket()
+        other = CustomUser.objects.create_user('other', password='x', role='employee')
+        self.assertFalse(has_pending_acknowledgments(other))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ticket.assigned_to_users.add(other)
+        self.assertTrue(has_pending_acknowledgments(other))
+
+        ticket.status = 'in_progress'
+        with self.captureOnCommitCallbacks(execute=True):
+            ticket.save()
+        self.assertFalse(has_pending_acknowledgments(other))
+
+    def test_department_membership_invalidates(self):
+        ticket = self._create_ticket()
+        ticket.departments.add(self.department)
+        newcomer = CustomUser.objects.create_user('newcomer', password='x', role='employee')
+        self.assertFalse(has_pending_acknowledgments(newcomer))
+
+        newcomer.department = self.department
+        with self.captureOnCommitCallbacks(execute=True):
+            newcomer.save()
+        self.assertTrue(has_pending_acknowledgments(newcomer))
+
+
+class UpperManagementDashboardTests(TestCase):
+    """الرسم البياني وتوزيع الأولويات في لوحة الإدارة العليا"""
+
+    def setUp(self):
+        cache.clear()
+        self.department = Department.objects.create(name='قسم الاختبار')
+        self.president = CustomUser.objects.create_user('president', password='x', role='president')
+        now = timezone.now()
+        for days_ago, priority, status in [(0, 'normal', 'new'), (1, 'urgent', 'violated'),
+                                           (2, 'critical', 'resolved'), (20, 'normal', 'new')]:
+            ticket = Ticket.objects.create(
+                title='طلب', description='-', created_by=self.president,
+                department=self.department, priority=priority, status=status,
+            )
+            Ticket.objects.filter(pk=ticket.pk).update(
+                created_at=now - timedelta(days=days_ago),
+                resolved_at=now if status == 'resolved' else None,
+            )
+
+    def test_trend_and_priorities(self):
+        trend = ticket_trend(7)
+        self.assertEqual(len(trend), 7)
+        self.assertEqual(trend[-1]['date'], timezone.localdate().strftime('%Y-%m-%d'))
+        self.assertEqual(sum(day['created'] for day in trend), 3)
+        self.assertEqual(trend[-2]['violated'], 1)
+        self.assertEqual(trend[-1]['resolved'], 1)
+        self.assertEqual(priority_breakdown(), {'normal': 2, 'urgent': 1, 'critical': 1})
+
+    def _dashboard_queries(self, days):
+        cache.clear()
+        self.client.force_login(self.president)
+        with override_settings(DASHBOARD_TREND_DAYS=days):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_budget_independent_of_trend_length(self):
+        budget = self._dashboard_queries(7)
+        # يشمل استعلامات تسجيل الدخول وتسجيل النشاط وتفريغه لأول طلب في الجلسة (LoginTrackingMiddleware)
+        self.assertLessEqual(budget, 18)
+        self.assertEqual(self._dashboard_queries(1), budget)
+        self.assertEqual(self._dashboard_queries(30), budget)
+
+    def test_stats_shared_and_refreshed_after_writes(self):
+        admin = CustomUser.objects.create_user('admin2', password='x', role='admin')
+        self.client.force_login(self.president)
+        self.assertEqual(self.client.get(reverse('dashboard')).context['violated_tickets'], 1)
+
+        # مستخدم آخر من الإدارة العليا يستخدم نفس المدخل المحفوظ
+        self.client.force_login(admin)
+        self.client.get(reverse('dashboard'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('dashboard'))
+        self.assertFalse(any('COUNT' in query['sql'] for query in queries))
+        self.assertIsInstance(response.context['critical_tickets'], list)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ticket = Ticket.objects.filter(status='new').first()
+            ticket.status = 'violated'
+            ticket.save()
+        self.assertEqual(self.client.get(reverse('dashboard')).context['violated_tickets'], 2)
+
+    def test_evicted_epoch_never_returns_to_an_old_one(self):
+        epoch = get_dashboard_epoch()
+        bump_dashboard_epoch()
+        bumped = get_dashboard_epoch()
+        self.assertGreater(bumped, epoch)
+
+        # حُذف مفتاح الحقبة وحده: الحقبة الجديدة لا تطابق أياً من الحقب السابقة
+        cache.delete(DASHBOARD_EPOCH_KEY)
+        self.assertGreater(get_dashboard_epoch(), bumped)
+        cache.delete(DASHBOARD_EPOCH_KEY)
+        bump_dashboard_epoch()
+        self.assertGreater(get_dashboard_epoch(), bumped)
+
+
+class ResolutionTimeStatsTests(TestCase):
+    """متوسط ووسيط و p90 لوقت الحل محسوبة في قاعدة البيانات"""
+
+    def test_stats_in_constant_queries(self):
+        department = Department.objects.create(name='قسم الاختبار')
+        creator = CustomUser.objects.create_user('creator', password='x', role='head')
+        now = timezone.now()
+        for hours in [1, 2, 3, 4, 10]:
+            ticket = Ticket.objects.create(
+                title='طلب', description='-', created_by=creator,
+                department=department, status='resolved',
+            )
+            Ticket.objects.filter(pk=ticket.pk).update(
+                created_at=now - timedelta(hours=hours), resolved_at=now
+            )
+
+        with self.assertNumQueries(3):
+            stats = resolution_time_stats()
+        self.assertEqual(stats, {'count': 5, 'avg': 4.0, 'median': 3.0, 'p90': 7.6})
+
+    def test_no_resolved_tickets(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(resolution_time_stats()['avg'], 0)
+
+
+class TicketDailyStatTests(TestCase):
+    """الجدول المجمّع للإحصائيات اليومية المستخدم في تقارير الأداء"""
+
+    def setUp(self):
+        self.department = Department.objects.create(name='قسم الاختبار')
+        self.creator = CustomUser.objects.create_user('creator', password='x', role='head')
+        self.employee = CustomUser.objects.create_user(
+            'employee', password='x', role='employee', department=self.department
+        )
+        self.now = timezone.now()
+        for days_ago, status, late in [(1, 'resolved', False), (2, 'resolved', True),
+                                       (3, 'violated', False), (40, 'new', False)]:
+            created_at = self.now - timedelta(days=days_ago)
+            ticket = Ticket.objects.create(
+                title='طلب', description='-', created_by=self.creator,
+                department=self.department, assigned_to=self.employee, status=status,
+            )
+            resolved = status == 'resolved'
+            Ticket.objects.filter(pk=ticket.pk).update(
+                created_at=created_at,
+                acknowledged_at=created_at + timedelta(hours=1) if resolved else None,
+                resolved_at=created_at + timedelta(hours=5) if resolved else None,
+                sla_deadline=created_at + timedelta(hours=2 if late else 24),
+            )
+        PenaltyPoints.objects.create(
+            user=self.employee, department=self.department, points=3, reason='-'
+        )
+
+    def test_rollup_matches_live_tickets(self):
+        call_command('backfill_daily_stats', stdout=StringIO())
+
+        start_day = rollup_start_day(30, self.now)
+        totals = rollup_totals(start_day)
+        self.assertEqual(totals['total'], 3)
+        self.assertEqual(totals['resolved'], 2)
+        self.assertEqual(totals['resolved_on_time'], 1)
+        self.assertEqual(totals['violated'], 1)
+        self.assertEqual(totals['resolution_seconds'], 2 * 5 * 3600)
+        self.assertEqual(rollup_totals(None)['total'], 4)
+
+        employee = employee_performance(start_day).get(pk=self.employee.pk)
+        self.assertEqual(
+            (employee.total, employee.resolved, employee.violated, employee.penalty_points),
+            (3, 2, 1, 3),
+        )
+        department = department_performance(start_day).get(pk=self.department.pk)
+        self.assertEqual((department.total, department.penalty_points), (3, 3))
+
+    def test_refresh_recomputes_only_touched_days(self):
+        call_command('backfill_daily_stats', stdout=StringIO())
+        self.assertTrue(RollupWatermark.objects.filter(name=TicketDailyStat.WATERMARK_NAME).exists())
+
+        # لا تغييرات: تُعاد الأيام الأخيرة فقط
+        self.assertEqual(TicketDailyStat.refresh()[0], 3)
+
+        ticket = Ticket.objects.get(status='violated')
+        ticket.status = 'resolved'
+        ticket.resolved_at = timezone.now()
+        ticket.save()
+        days, _ = TicketDailyStat.refresh()
+        self.assertEqual(days, 4)
+        self.assertEqual(rollup_totals(rollup_start_day(30))['violated'], 0)
+        self.assertEqual(rollup_totals(rollup_start_day(30))['resolved'], 3)
+
+    @override_settings(DAILY_STATS_REFRESH_DAYS=1)
+    def test_refresh_recomputes_days_of_deleted_rows(self):
+        PenaltyPoints.objects.update(created_at=self.now - timedelta(days=10))
+        call_command('backfill_daily_stats', stdout=StringIO())
+
+        Ticket.objects.filter(status='new').delete()
+        PenaltyPoints.objects.all().delete()
+        days, _ = TicketDailyStat.refresh()
+        self.assertEqual(days, 3)
+        self.assertEqual(rollup_totals(None)['total'], 3)
+        self.assertFalse(TicketDailyStat.objects.filter(penalty_count__gt=0).exists())
+
+        # العلامات استُهلكت
+        self.assertEqual(TicketDailyStat.refresh()[0], 1)
+
+    def test_refresh_rebuilds_trailing_window(self):
+        call_command('backfill_daily_stats', stdout=StringIO())
+
+        # UPDATE لا يغيّر updated_at فلا تلتقطه العلامة المائية
+        Ticket.objects.filter(status='resolved', resolved_at__gte=self.now - timedelta(days=1)).update(
+            resolved_at=None, status='in_progress'
+        )
+        TicketDailyStat.refresh()
+        self.assertEqual(rollup_totals(rollup_start_day(30))['resolved'], 1)
+
+
+class SLAViolationEngineTests(TestCase):
+    """محرك مخالفات SLA على دفعات"""
+
+    def setUp(self):
+        cache.clear()
+        self.department = Department.objects.create(name='قسم الاختبار')
+        self.creator = CustomUser.objects.create_user('creator', email='c@uni.edu', role='employee')
+        self.assignee = CustomUser.objects.create_user(
+            'assignee', email='a@uni.edu', role='employee', department=self.department
+        )
+        self.head = CustomUser.objects.create_user(
+            'head', email='h@uni.edu', role='head', department=self.department
+        )
+        self.dean = CustomUser.objects.create_user('dean', email='d@uni.edu', role='dean')
+        self.tickets = [
+            Ticket.objects.create(
+                title=f'طلب {i}', description='-', created_by=self.creator,
+                assigned_to=self.assignee, department=self.department,
+            )
+            for i in range(5)
+        ]
+        now = timezone.now()
+        Ticket.objects.filter(pk__in=[t.pk for t in self.tickets[:4]]).update(
+            sla_deadline=now - timedelta(hours=5)
+        )
+        Ticket.objects.filter(pk=self.tickets[3].pk).update(escalation_level='head')
+        Notification.objects.all().delete()
+        EmailOutbox.objects.all().delete()
+
+    def test_batches_violate_once_and_dispatch_grouped(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with CaptureQueriesContext(connection) as queries:
+                stats = process_sla_violations(batch_size=2)
+
+        self.assertEqual((stats['violated'], stats['batches']), (4, 2))
+        self.assertEqual(set(stats['timings_ms']), {'select', 'update', 'actions', 'penalties', 'dispatch'})
+        # UPDATE واحد وإدراج واحد للإجراءات والجزاءات والإشعارات لكل دفعة
+        sql = [q['sql'] for q in queries]
+        self.assertEqual(sum(q.startswith('UPDATE "tickets_ticket"') for q in sql), 2)
+        self.assertEqual(sum(q.startswith('INSERT INTO "tickets_ticketaction"') for q in sql), 2)
+        self.assertEqual(sum(q.startswith('INSERT') and 'INTO "accounts_penaltypoints"' in q for q in sql), 2)
+        self.assertEqual(sum(q.startswith('INSERT INTO "notifications_notification"') for q in sql), 2)
+
+        levels = dict(Ticket.objects.values_list('pk', 'escalation_level'))
+        self.assertEqual(
+            [levels[t.pk] for t in self.tickets], ['head', 'head', 'head', 'dean', 'none']
+        )
+        self.assertEqual(Ticket.objects.filter(status='violated').count(), 4)
+        self.assertEqual(TicketAction.objects.filter(action_type='escalated').count(), 4)
+        self.assertEqual(
+            set(PenaltyPoints.objects.values_list('user_id', 'points')), {(self.assignee.pk, 3)}
+        )
+        self.assertEqual(Notification.objects.filter(user=self.head).count(), 3)
+        self.assertEqual(Notification.objects.filter(user=self.dean).count(), 1)
+        self.assertEqual(NotificationState.get_count(self.head.pk), 3)
+        # بريد التصعيد للمستوى الأعلى + بريد التحديث للمنشئ والمعين
+        self.assertEqual(EmailOutbox.objects.filter(recipients=['h@uni.edu']).count(), 3)
+        self.assertEqual(EmailOutbox.objects.filter(recipients=['d@uni.edu']).count(), 1)
+        self.assertEqual(EmailOutbox.objects.filter(subject__startswith='تم تصعيد الطلب').count(), 4)
+
+        # تشغيل ثانٍ لا يكرر شيئاً
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(process_sla_violations()['violated'], 0)
+        self.assertEqual(TicketAction.objects.count(), 4)
+        self.assertEqual(PenaltyPoints.objects.count(), 4)
+
+    def test_ticket_closed_meanwhile_is_skipped(self):
+        ticket = self.tickets[0]
+        original = Ticket.objects.filter
+
+        def racing_filter(*args, **kwargs):
+            # إغلاق الطلب بين القراءة و UPDATE كما يفعل مستخدم متزامن
+            if kwargs.get('status__in') and 'pk__in' in kwargs:
+                Ticket.objects.filter(pk=ticket.pk).update(status='resolved')
+            return original(*args, **kwargs)
+
+        with patch.object(Ticket.objects, 'filter', side_effect=racing_filter):
+            stats = process_sla_violations()
+        self.assertEqual(stats['violated'], 3)
+        self.assertFalse(TicketAction.objects.filter(ticket=ticket, action_type='escalated').exists())
+
+
+class SLADeadlineTimerTests(TestCase):
+    """مؤقتات مهلة SLA بدلاً من الفحص الدوري"""
+
+    def setUp(self):
+        cache.clear()
+        self.creator = CustomUser.objects.create_user('creator', role='employee')
+        self.ticket = Ticket.objects.create(title='طلب', description='-', created_by=self.creator)
+
+    @patch('tickets.tasks.fire_sla_deadline.apply_async')
+    def test_timer_scheduled_once_when_deadline_is_near(self, apply_async):
+        deadline = timezone.now() + timedelta(minutes=10)
+        self.ticket.sla_deadline = deadline
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ticket.save()
+        apply_async.assert_called_once_with((self.ticket.pk, deadline.isoformat()), eta=deadline)
+
+        # فحص الاسترداد لا يكرر مؤقتاً موجوداً، والمهل البعيدة تنتظر اقترابها
+        Ticket.objects.create(title='بعيد', description='-', created_by=self.creator)
+        self.assertEqual(arm_upcoming_deadlines(), 0)
+        self.assertEqual(apply_async.call_count, 1)
+        self.assertEqual(arm_upcoming_deadlines(now=timezone.now() + timedelta(hours=71, minutes=50)), 1)
+
+    def test_fired_timer_violates_or_is_superseded(self):
+        deadline = timezone.now() - timedelta(seconds=2)
+        Ticket.objects.filter(pk=self.ticket.pk).update(sla_deadline=deadline)
+
+        # تغيرت المهلة بعد جدولة المؤقت
+        self.assertEqual(fire_deadline(self.ticket.pk, (deadline - timedelta(hours=1)).isoformat()), 0)
+        self.assertEqual(get_counters('sla_timer_superseded')['sla_timer_superseded'], 1)
+
+        self.assertEqual(fire_deadline(self.ticket.pk, deadline.isoformat()), 1)
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.status, 'violated')
+        counters = MetricCounter.read('sla_timer_fired', 'sla_timer_latency_ms')
+        self.assertEqual(counters['sla_timer_fired'], 1)
+        self.assertLess(counters['sla_timer_latency_ms'], 60_000)
+
+        # العدّادات تُزاد في عامل Celery وتُقرأ في عملية الويب: لا تعتمد على ذاكرتها المؤقتة
+        cache.clear()
+        admin = CustomUser.objects.create_user('monitor', password='x', role='admin')
+        self.client.force_login(admin)
+        detection = self.client.get(reverse('monitoring_api')).json()['sla_detection']
+        self.assertEqual(detection['timer_violations'], 1)
+
+        # الطلب لم يعد مفتوحاً: المؤقت المكرر لا يعمل شيئاً
+        self.assertEqual(fire_deadline(self.ticket.pk, deadline.isoformat()), 0)
+        self.assertEqual(TicketAction.objects.filter(action_type='escalated').count(), 1)
+
+    def test_single_beat_schedule(self):
+        from django.conf import settings
+        from uni_core.celery import app
+
+        self.assertEqual(app.conf.beat_schedule, settings.CELERY_BEAT_SCHEDULE)
+
+
+@override_settings(SLA_WARNING_THRESHOLDS={'default': [120, 30], 'critical': [240, 60, 15]})
+
+
+class DeadlineWarningTests(TestCase):
+    """تحذيرات اقتراب المهلة: مرة واحدة لكل عتبة"""
+
+    def setUp(self):
+        self.assignee = CustomUser.objects.create_user('assignee', email='a@uni.edu', role='employee')
+        self.now = timezone.now()
+
+        def ticket(priority, minutes_left):
+            ticket = Ticket.objects.create(
+                title=priority, description='-', priority=priority,
+                created_by=self.assignee, assigned_to=self.assignee,
+            )
+            Ticket.objects.filter(pk=ticket.pk).update(sla_deadline=self.now + timedelta(minutes=minutes_left))
+            return ticket
+
+        self.normal = ticket('normal', 100)
+        self.critical = ticket('critical', 10)
+        self.later = ticket('urgent', 300)
+        EmailOutbox.objects.all().delete()
+
+    def warnings(self):
+        return list(EmailOutbox.objects.order_by('subject').values_list('subject', flat=True))
+
+    def test_each_threshold_fires_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(send_due_warnings(self.now), 2)
+        selects = [q for q in queries if q['sql'].startswith('SELECT') and 'FROM "tickets_ticket"' in q['sql']]
+        self.assertEqual(len(selects), 2)  # نطاق الاختيار + تحميل الطلبات المحذَّرة للبريد
+
+        # الطلب الحرج عبر العتبات الثلاث بين تشغيلين: تحذير عاجل واحد
+        self.assertEqual(
+            dict(Ticket.objects.filter(pk__in=[self.normal.pk, self.critical.pk]).values_list('pk', 'warning_stage')),
+            {self.normal.pk: 1, self.critical.pk: 3},
+        )
+        self.assertEqual(len(self.warnings()), 2)
+        self.assertTrue(self.warnings()[0].startswith('⏰'))
+        self.assertTrue(self.warnings()[1].startswith('🚨'))
+
+        # تشغيل متكرر أو متأخر قليلاً لا يعيد الإرسال
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(send_due_warnings(self.now + timedelta(minutes=5)), 0)
+
+        # العتبة التالية للطلب العادي
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(send_due_warnings(self.now + timedelta(minutes=75)), 1)
+        self.assertEqual(len(self.warnings()), 3)
+
+    def test_new_deadline_resets_warnings(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            send_due_warnings(self.now)
+        ticket = Ticket.objects.get(pk=self.normal.pk)
+        ticket.sla_deadline = self.now + timedelta(minutes=90)
+        ticket.save()
+        self.assertEqual(ticket.warning_stage, 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(send_due_warnings(self.now), 1)
+
+
+class PenaltySourceKeyTests(TestCase):
+    """النقاط الجزائية المرتبطة بطلب تُحتسب مرة واحدة لكل (طلب، قاعدة، يوم)"""
+
+    def setUp(self):
+        self.admin = CustomUser.objects.create_user('admin', role='admin')
+        self.assignee = CustomUser.objects.create_user('assignee', role='employee')
+        self.tickets = [
+            Ticket.objects.create(
+                title='نفس العنوان', description='-', created_by=self.admin, assigned_to=self.assignee
+            )
+            for _ in range(3)
+        ]
+        Ticket.objects.filter(pk__in=[t.pk for t in self.tickets[:2]]).update(
+            sla_deadline=timezone.now() - timedelta(hours=1)
+        )
+
+    def test_engine_daily_task_and_manual_share_one_key(self):
+        from .tasks import calculate_daily_penalties
+
+        process_sla_violations()
+        self.assertEqual(PenaltyPoints.objects.count(), 2)
+
+        # طلب خولف بتعديل الحالة مباشرة ولم تُسجل عليه نقاط بعد - عنوانه مكرر لكنه مصدر مختلف
+        Ticket.objects.filter(pk=self.tickets[2].pk).update(status='violated', updated_at=timezone.now())
+        with self.assertNumQueries(3):  # اختيار + فحص المفاتيح + إدراج (دون استعلامات عقد single_flight)
+            self.assertEqual(calculate_daily_penalties.run.__wrapped__(), 'تم احتساب 1 نقطة جزائية')
+        self.assertEqual(calculate_daily_penalties(), 'تم احتساب 0 نقطة جزائية')
+
+        self.client.force_login(self.admin)
+        self.client.post(reverse('mark_as_violation', args=[self.tickets[0].pk]), {'violation_reason': '-'})
+        self.assertEqual(PenaltyPoints.objects.count(), 3)
+        self.assertEqual(
+            set(PenaltyPoints.objects.values_list('ticket_id', 'rule')),
+            {(t.pk, 'sla_violation') for t in self.tickets},
+        )
+
+
+@override_settings(AUTO_REASSIGN_AFTER_HOURS=48)
+
+
+class ReassignmentEngineTests(TestCase):
+    """إعادة التعيين التلقائي حسب عبء العمل"""
+
+    def setUp(self):
+        self.department = Department.objects.create(name='قسم الاختبار')
+        self.busy, self.light, self.idle = [
+            CustomUser.objects.create_user(name, role='employee', department=self.department)
+            for name in ('busy', 'light', 'idle')
+        ]
+        self.overdue = [
+            Ticket.objects.create(
+                title=f'متأخر {i}', description='-', created_by=self.busy,
+                assigned_to=self.busy, department=self.department,
+            )
+            for i in range(4)
+        ]
+        Ticket.objects.filter(pk__in=[t.pk for t in self.overdue]).update(
+            created_at=timezone.now() - timedelta(days=3)
+        )
+        # عبء عبر المعينين المتعددين
+        shared = Ticket.objects.create(title='مشترك', description='-', created_by=self.busy)
+        shared.assigned_to_users.add(self.light)
+
+    def test_plan_balances_load_in_constant_queries(self):
+        with self.assertNumQueries(5):
+            plan = plan_reassignments()
+        self.assertEqual(plan.load_before, {self.busy.pk: 4, self.light.pk: 1})
+        self.assertEqual(len(plan.moves), 4)
+        # العبء يتحدث مع كل طلب يُسند في التشغيل نفسه
+        self.assertEqual(
+            [(new.username, new_load) for _, _, new, new_load in plan.moves], [('idle', 1), ('light', 2), ('idle', 2), ('light', 3)]
+        )
+        self.assertEqual(plan.spread(plan.load_after)[self.department.pk], (0, 3, 1.25))
+
+        out = StringIO()
+        call_command('reassign_overdue_tickets', '--dry-run', stdout=out)
+        self.assertIn('معاينة فقط', out.getvalue())
+        self.assertEqual(Ticket.objects.filter(assigned_to=self.busy).count(), 4)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(apply_reassignments(plan), 4)
+        self.assertEqual(Ticket.objects.filter(assigned_to=self.idle).count(), 2)
+        self.assertEqual(TicketAction.objects.filter(action_type='reassigned').count(), 4)
+        self.assertTrue(TicketAudience.objects.filter(
+            ticket=self.overdue[0], user=self.idle, reason='assignee'
+        ).exists())
+        # الطلبات المنقولة حديثاً لا تُنقل مرة أخرى في التشغيل التالي
+        self.assertEqual(plan_reassignments().moves, [])
+
+    def test_co_assignee_load_matches_workload_map(self):
+        # الطلب المشترك هو الوحيد المتأخر: المعين busy وضمن المعينين busy و light
+        Ticket.objects.filter(pk__in=[t.pk for t in self.overdue]).update(created_at=timezone.now())
+        shared = Ticket.objects.get(title='مشترك')
+        shared.assigned_to_users.add(self.busy)
+        Ticket.objects.filter(pk=shared.pk).update(
+            assigned_to=self.busy, department=self.department,
+            created_at=timezone.now() - timedelta(days=3),
+        )
+        for i in range(2):
+            Ticket.objects.create(
+                title=f'عبء {i}', description='-', created_by=self.busy,
+                assigned_to=self.idle, department=self.department,
+            )
+
+        plan = plan_reassignments()
+        self.assertEqual(plan.load_before, {self.busy.pk: 5, self.light.pk: 1, self.idle.pk: 2})
+        self.assertEqual(
+            [(ticket.pk, new.username, new_load) for ticket, _, new, new_load in plan.moves],
+            [(shared.pk, 'light', 1)],
+        )
+        self.assertEqual(plan.load_after, plan.load_before)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            apply_reassignments(plan)
+        self.assertEqual(workload_map(list(plan.users)), plan.load_after)
+
+
+class TaskLeaseTests(TestCase):
+    """
+    العقد في قاعدة البيانات: تشغيل واحد في كل لحظة، وتسجيل سبب التخطي، والدمج، والتجديد والانتهاء
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.runs = []
+
+        @single_flight(name='test.job', coalesce=True)
+        def job(nested=False):
+            self.runs.append(TaskLease.objects.get(name='test.job').owner)
+            if nested and len(self.runs) == 1:
+                # تشغيل متداخل أثناء حمل العقد
+                self.skipped = job()
+            return 'done'
+
+        self.job = job
+
+    def test_overlapping_run_is_skipped_and_coalesced(self):
+        self.assertEqual(self.job(nested=True), 'done')
+        self.assertTrue(self.skipped.startswith('تم التخطي: يعمل لدى'))
+        # التشغيل المتداخل لم يُنفذ بل أُعيد تشغيل الحامل مرة واحدة بعد انتهائه
+        self.assertEqual(len(self.runs), 2)
+        lease = TaskLease.objects.get(name='test.job')
+        self.assertEqual((lease.owner, lease.rerun_requested, lease.skip_count), ('', False, 1))
+        self.assertIn('سيُعاد التشغيل', lease.last_skip_reason)
+        self.assertIsNotNone(lease.last_finished_at)
+        self.assertEqual(get_counters('task_lease_skipped')['task_lease_skipped'], 1)
+
+    def test_expired_lease_is_taken_over(self):
+        now = timezone.now()
+        TaskLease.objects.create(name='test.job', owner='dead-worker', expires_at=now + timedelta(minutes=1))
+        self.assertTrue(self.job().startswith('تم التخطي'))
+        self.assertEqual(self.runs, [])
+
+        TaskLease.objects.filter(name='test.job').update(expires_at=now - timedelta(seconds=1))
+        self.assertEqual(self.job(), 'done')
+        self.assertNotEqual(self.runs[0], 'dead-worker')
+
+    @override_settings(TASK_LEASE_TTL=3)
+    def test_heartbeat_renews_and_detects_lost_lease(self):
+        @single_flight(name='test.long')
+        def long_job():
+            lease = TaskLease.objects.get(name='test.long')
+            _local.lease['renewed'] -= 2
+            heartbeat()
+            self.assertGreater(TaskLease.objects.get(name='test.long').expires_at, lease.expires_at)
+            # انتهى العقد واستلمه عامل آخر
+            TaskLease.objects.filter(name='test.long').update(owner='other-worker')
+            _local.lease['renewed'] -= 2
+            heartbeat()
+            return 'done'
+
+        self.assertEqual(long_job(), 'تم الإيقاف: انتقل العقد إلى عامل آخر')
+        self.assertEqual(TaskLease.objects.get(name='test.long').owner, 'other-worker')
+        # خارج single_flight لا يفعل heartbeat شيئاً
+        heartbeat()
+
+
+class DailyReportSnapshotTests(TestCase):
+    """
+    التقرير اليومي يُحسب مرة واحدة ويُحفظ، ويُرسل ويُعرض من اللقطة نفسها
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.department = Department.objects.create(name='قسم التقرير')
+        self.president = CustomUser.objects.create_user('president', email='p@uni.edu', role='president')
+        CustomUser.objects.create_user('dean', email='d@uni.edu', role='dean')
+        self.employee = CustomUser.objects.create_user(
+            'slow', first_name='بطيء', role='employee', department=self.department
+        )
+        for i in range(2):
+            Ticket.objects.create(
+                title=f'طلب {i}', description='-', created_by=self.president,
+                assigned_to=self.employee, department=self.department,
+            )
+
+    def test_snapshot_trend_delivery_and_view(self):
+        now = timezone.now()
+        first = build_snapshot(now - timedelta(days=1))
+        self.assertEqual(first.data['totals']['total'], 2)
+        self.assertEqual([key for key, _, delta in first.trend() if delta is not None], [])
+
+        Ticket.objects.filter(pk=Ticket.objects.first().pk).update(status='violated')
+        TicketDailyStat.rebuild_dates([timezone.localdate(now)])
+        snapshot = build_snapshot(now)
+        # طلبات اليوم الجاري لا تُحسب ضمن "جديدة أمس"
+        self.assertEqual(snapshot.data['totals']['new_yesterday'], 0)
+        # إعادة الحساب لنفس اليوم تستبدل اللقطة ولا تضيف أخرى
+        self.assertEqual(build_snapshot(now).pk, snapshot.pk)
+        self.assertEqual(DailyReportSnapshot.objects.count(), 2)
+
+        trend = {key: (value, delta) for key, value, delta in snapshot.trend(snapshot.previous())}
+        self.assertEqual(trend['violated'], (1, 1))
+        self.assertEqual(trend['pending'], (1, -1))
+        self.assertEqual(snapshot.data['worst_employees'], [
+            {'name': 'بطيء', 'department': 'قسم التقرير', 'violated': 1}
+        ])
+        self.assertIn('(+1 عن التقرير السابق)', snapshot.text)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(deliver_snapshot(snapshot), 2)
+        self.assertEqual(drain_outbox(), (2, 0, 0))
+        self.assertEqual({message.to[0] for message in mail.outbox}, {'p@uni.edu', 'd@uni.edu'})
+        self.assertEqual(mail.outbox[0].alternatives[0][0], snapshot.html)
+
+        self.client.force_login(self.president)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('daily_report'))
+        self.assertContains(response, 'بطيء')
+        self.assertContains(response, 'وأُرسل إلى 2 مستلم')
+        # العرض من اللقطة المحفوظة فقط: لا تجميع على الطلبات
+        self.assertFalse([q for q in queries if 'COUNT(' in q['sql']])
+
+        response = self.client.get(reverse('daily_report'), {'day': first.day.isoformat()})
+        self.assertEqual(response.context['snapshot'], first)
+
+    def test_yesterday_counts_cover_one_full_day(self):
+        now = timezone.now()
+        for days_ago in (1, 2):
+            ticket = Ticket.objects.create(
+                title='سابق', description='-', created_by=self.president, department=self.department,
+            )
+            Ticket.objects.filter(pk=ticket.pk).update(created_at=now - timedelta(days=days_ago))
+        call_command('backfill_daily_stats', stdout=StringIO())
+
+        totals = build_snapshot(now).data['totals']
+        self.assertEqual((totals['total'], totals['new_yesterday']), (4, 1))
+
+
+class PerformanceMetricPointTests(TestCase):
+    """
+    السلسلة الزمنية لمقاييس الأداء: ملء تزايدي، متوسط مرجح، وتقليص عند القراءة
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.department = Department.objects.create(name='قسم المقاييس')
+        self.president = CustomUser.objects.create_user('president', role='president')
+        self.now = timezone.now()
+        base = self.base = PerformanceMetricPoint.bucket_floor(self.now) - timedelta(days=2)
+        # (إنشاء، إقرار، حل، مهلة) بالساعات من بداية الفترة: الأول ضمن المهلة والثاني متأخر في الفترة التالية
+        for created, acknowledged, resolved, deadline in ((0, 1, 3, 4), (6, 8, 11, 7)):
+            ticket = Ticket.objects.create(
+                title='-', description='-', created_by=self.president, department=self.department,
+            )
+            Ticket.objects.filter(pk=ticket.pk).update(
+                status='resolved',
+                created_at=base + timedelta(hours=created),
+                acknowledged_at=base + timedelta(hours=acknowledged),
+                resolved_at=base + timedelta(hours=resolved),
+                sla_deadline=base + timedelta(hours=deadline),
+            )
+
+    def test_fill_is_incremental_and_weighted(self):
+        self.assertEqual(PerformanceMetricPoint.fill(self.now), (9, 12))  # فترتان × (استجابة + حل + التزام) × (الكل + القسم)
+        self.assertEqual(PerformanceMetricPoint.summary(), {
+            'response_hours': 1.5, 'resolution_hours': 4.0, 'compliance_rate': 50.0,
+        })
+        self.assertEqual(
+            PerformanceMetricPoint.summary(PerformanceMetricPoint.department_scope(self.department.pk))['compliance_rate'],
+            50.0,
+        )
+        self.assertEqual(
+            [value for _, value, _ in PerformanceMetricPoint.series('compliance_rate')], [100.0, 0.0]
+        )
+        self.assertEqual(
+            PerformanceMetricPoint.series('resolution_hours', max_points=1), [(self.base, 4.0, 2)]
+        )
+
+        # التشغيل التالي يبدأ من فترة التشغيل السابق فقط
+        buckets, _ = PerformanceMetricPoint.fill(self.now + timedelta(minutes=1))
+        self.assertLessEqual(buckets, 2)
+        self.assertEqual(PerformanceMetricPoint.objects.filter(metric='compliance_rate', scope='all').count(), 2)
+
+        self.client.force_login(self.president)
+        response = self.client.get(
+            reverse('performance_metrics_api'), {'metric': 'compliance_rate', 'days': 7, 'points': 1}
+        )
+        self.assertEqual(response.json()['series']['compliance_rate'], [
+            {'t': self.base.isoformat(), 'value': 50.0, 'samples': 2}
+        ])
+        self.assertEqual(
+            self.client.get(reverse('performance_metrics_api'), {'metric': 'unknown'}).status_code, 400
+        )
+        response = self.client.get(reverse('monitoring_dashboard'))
+        self.assertEqual(response.context['compliance_rate'], 50.0)
+        self.assertEqual(response.context['avg_response_hours'], 1.5)
+
+    @override_settings(PERFORMANCE_METRIC_MAX_BUCKETS_PER_RUN=4)
+    def test_runs_are_capped_and_backfill_command_fills_history(self):
+        self.client.force_login(self.president)
+        response = self.client.get(reverse('monitoring_dashboard'))
+        # قبل أول ملء لا تُعرض أصفار
+        self.assertIsNone(response.context['compliance_rate'])
+        self.assertContains(response, 'لا توجد بيانات بعد')
+
+        self.assertEqual(PerformanceMetricPoint.fill(self.now), (4, 12))
+        watermark = RollupWatermark.objects.get(name=PerformanceMetricPoint.WATERMARK_NAME)
+        self.assertEqual(watermark.value, self.base + timedelta(hours=24))
+        self.assertEqual([PerformanceMetricPoint.fill(self.now)[0] for _ in range(2)], [4, 1])
+        self.assertEqual(PerformanceMetricPoint.objects.count(), 12)
+
+        PerformanceMetricPoint.objects.all().delete()
+        RollupWatermark.objects.all().delete()
+        out = StringIO()
+        call_command('backfill_performance_metrics', stdout=out)
+        self.assertIn('تم حساب 9 فترة (12 نقطة)', out.getvalue())
+        self.assertEqual(PerformanceMetricPoint.summary()['compliance_rate'], 50.0)
+
+
+class CeleryQueueRoutingTests(TestCase):
+    """
+    توجيه المهام إلى طوابيرها المخصصة وتقرير عمق الطوابير
+    """
+
+    def test_tasks_are_routed_with_queue_options(self):
+        from .tasks import fire_sla_deadline
+
+        router = celery_app.amqp.router
+        route = router.route({}, 'tickets.tasks.check_sla_violations')
+        self.assertEqual((route['queue'].name, route['priority']), ('sla', 0))
+        self.assertEqual(router.route({}, 'notifications.tasks.send_outbox_emails')['queue'].name, 'email')
+        self.assertEqual(router.route({}, 'tickets.tasks.send_daily_report')['queue'].name, 'exports')
+        self.assertEqual(router.route({}, 'accounts.tasks.flush_user_activity')['queue'].name, 'default')
+
+        self.assertEqual(
+            (fire_sla_deadline.acks_late, fire_sla_deadline.soft_time_limit, fire_sla_deadline.time_limit),
+            (True, 240, 300),
+        )
+
+    def test_queue_depth_command(self):
+        celery_app.conf.broker_read_url = 'memory://'
+        self.addCleanup(setattr, celery_app.conf, 'broker_read_url', None)
+        with celery_app.connection_for_read() as connection:
+            connection.Producer().publish(
+                {'task': '-'}, routing_key='exports', declare=[Queue('exports')],
+            )
+            self.addCleanup(connection.default_channel.queue_purge, 'exports')
+
+        out = StringIO()
+        call_command('celery_queues', '--json', stdout=out)
+        depths = {name: stats['depth'] for name, stats in json.loads(out.getvalue()).items()}
+        self.assertEqual(depths, {'sla': 0, 'notifications': 0, 'email': 0, 'exports': 1, 'default': 0})
+
+
+class PdfRenderCacheTests(TestCase):
+    """
+    ملفات PDF تُولَّد مرة لكل نسخة من الطلب في الخلفية وتُرسل من القرص بعدها
+    """
+
+    def setUp(self):
+        cache.clear()
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.cache_dir = cache_dir.name
+        override = override_settings(PDF_CACHE_DIR=self.cache_dir)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.president = CustomUser.objects.create_user('president', role='president')
+        self.ticket = Ticket.objects.create(title='طلب طباعة', description='وصف الطلب', created_by=self.president)
+        self.url = reverse('export_ticket_pdf', args=[self.ticket.pk])
+        self.client.force_login(self.president)
+
+    @patch('tickets.tasks.render_ticket_pdf_task.delay')
+    def test_cold_render_in_background_then_served_from_disk(self, delay):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 202)
+        self.client.get(self.url)
+        # التوليد يُجدول مرة واحدة لكل نسخة
+        delay.assert_called_once_with(self.ticket.pk)
+
+        render_ticket_pdf(self.ticket.pk)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+
+        # إجراء جديد يغير النسخة: الملف القديم لا يُستخدم ويُحذف بعد التوليد التالي
+        TicketAction.objects.create(ticket=self.ticket, action_type='commented', user=self.president, notes='-')
+        self.assertEqual(self.client.get(self.url).status_code, 202)
+        with patch('tickets.pdf_render.pdfmetrics.registerFont') as register:
+            render_ticket_pdf(self.ticket.pk)
+        register.assert_not_called()
+        self.assertTrue(register_font('ArabicFont'))
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+        # التوليد يتم في عامل Celery: العدّادات لا تعتمد على ذاكرة عملية الويب المؤقتة
+        cache.clear()
+        self.client.force_login(self.president)
+        stats = self.client.get(reverse('monitoring_api')).json()['pdf_cache']
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_rate'], stats['renders']), (1, 3, 25.0, 2))
+
+    def test_overdue_ticket_version_changes_every_hour(self):
+        now = timezone.now()
+        version = ticket_version(self.ticket.pk, now)
+        self.assertIsNone(version[2])
+
+        Ticket.objects.filter(pk=self.ticket.pk).update(sla_deadline=now - timedelta(hours=3))
+        version = ticket_version(self.ticket.pk, now)
+        later = ticket_version(self.ticket.pk, now + timedelta(hours=1))
+        self.assertEqual(version[:2], later[:2])
+        self.assertNotEqual(cache_path(self.ticket.pk, version), cache_path(self.ticket.pk, later))
+        self.assertRegex(render_ticket_pdf(self.ticket.pk), r'_\d{10}\.pdf$')
+
+        # الطلب المحلول لا يحمل محتوى يتغير مع الوقت
+        Ticket.objects.filter(pk=self.ticket.pk).update(status='resolved')
+        self.assertIsNone(ticket_version(self.ticket.pk, now)[2])
@@ -21,8 +21,10 @@ urlpatterns = [
     # نظام المراقبة المتقدم
     path('monitoring/', reports.monitoring_dashboard, name='monitoring_dashboard'),
     path('monitoring/api/', reports.monitoring_api, name='monitoring_api'),
+    path('monitoring/metrics/', reports.performance_metrics_api, name='performance_metrics_api'),
     
     # التقارير المتقدمة
+    path('reports/daily/', reports.daily_report, name='daily_report'),
     path('reports/performance/', reports.performance_report, name='performance_report'),
     path('reports/performance/export/', reports.export_performance_excel, name='export_performance_excel'),
     path('reports/penalties/', reports.penalty_points_report, name='penalty_points_report'),
@@ -2,19 +2,72 @@
 وظائف مساعدة لنظام الطلبات
 Utility functions for the ticketing system
 """
-from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.conf import settings
 from django.utils.html import strip_tags
+from notifications.models import EmailOutbox, NotificationPreference
+from .cache_utils import incr_daily_counter
 import logging
 
 logger = logging.getLogger('tickets')
 
 
+def _ticket_email_users(ticket):
+    """منشئ الطلب والمعين المباشر والمعينين المتعددين ممن لديهم بريد"""
+    users = [ticket.created_by, ticket.assigned_to, *ticket.assigned_to_users.all()]
+    return {user.pk: user for user in users if user and user.email}
+
+
+def build_ticket_update_email(ticket, action_type, user=None, users=None, digest_users=()):
+    """
+    تجهيز رسائل صندوق الصادر لتحديث طلب دون حفظها
+    Build (unsaved) outbox messages for a ticket update
+    """
+    users = _ticket_email_users(ticket) if users is None else users
+    recipients = list(dict.fromkeys(
+        user.email for user_id, user in users.items() if user_id not in digest_users
+    ))
+    if not recipients:
+        return []
+    
+    # إنشاء سياق القالب
+    context = {
+        'ticket': ticket,
+        'action_type': action_type,
+        'user': user,
+        'site_url': 'http://localhost:8000',  # يجب تغييره في الإنتاج
+    }
+    
+    # رندر قالب HTML
+    html_message = render_to_string('emails/ticket_update.html', context)
+    plain_message = strip_tags(html_message)
+    
+    # تحديد الموضوع بناءً على نوع الإجراء
+    subject_map = {
+        'created': f'طلب جديد: {ticket.title}',
+        'assigned': f'تم تعيين طلب لك: {ticket.title}',
+        'acknowledged': f'تم تأكيد الطلب: {ticket.title}',
+        'escalated': f'تم تصعيد الطلب: {ticket.title}',
+        'resolved': f'تم حل الطلب: {ticket.title}',
+        'closed': f'تم إغلاق الطلب: {ticket.title}',
+        'commented': f'تعليق جديد على الطلب: {ticket.title}',
+    }
+    
+    subject = subject_map.get(action_type, f'تحديث على الطلب: {ticket.title}')
+    
+    return EmailOutbox.build(
+        subject=subject,
+        body=plain_message,
+        recipients=recipients,
+        html_body=html_message,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+    )
+
+
 def send_ticket_update_email(ticket, action_type, user=None):
     """
-    إرسال بريد إلكتروني عند تحديث الطلب
-    Send email notification when ticket is updated
+    إرسال بريد إلكتروني عند تحديث الطلب (عبر صندوق البريد الصادر)
+    Queue an email notification when ticket is updated
     
     Args:
         ticket: كائن الطلب (Ticket object)
@@ -22,68 +75,49 @@ def send_ticket_update_email(ticket, action_type, user=None):
         user: المستخدم الذي قام بالإجراء (User who performed the action)
     """
     try:
-        # تحديد المستلمين
-        recipients = []
+        users = _ticket_email_users(ticket)
         
-        # إضافة منشئ الطلب
-        if ticket.created_by.email:
-            recipients.append(ticket.created_by.email)
+        # من اختار وضع الملخص يستلم هذا الحدث ضمن ملخص الإشعارات بدلاً من بريد مستقل
+        digest_users = NotificationPreference.digest_user_ids(users)
+        if digest_users:
+            incr_daily_counter('digest_emails_suppressed', len(digest_users))
         
-        # إضافة المعينين للطلب
-        if ticket.assigned_to and ticket.assigned_to.email:
-            if ticket.assigned_to.email not in recipients:
-                recipients.append(ticket.assigned_to.email)
-        
-        # إضافة المعينين المتعددين
-        for assigned_user in ticket.assigned_to_users.all():
-            if assigned_user.email and assigned_user.email not in recipients:
-                recipients.append(assigned_user.email)
-        
-        if not recipients:
+        messages = build_ticket_update_email(ticket, action_type, user, users, digest_users)
+        if not messages:
             logger.warning(f"No recipients found for ticket {ticket.id}")
             return
         
-        # إنشاء سياق القالب
-        context = {
-            'ticket': ticket,
-            'action_type': action_type,
-            'user': user,
-            'site_url': 'http://localhost:8000',  # يجب تغييره في الإنتاج
-        }
-        
-        # رندر قالب HTML
-        html_message = render_to_string('emails/ticket_update.html', context)
-        plain_message = strip_tags(html_message)
-        
-        # تحديد الموضوع بناءً على نوع الإجراء
-        subject_map = {
-            'created': f'طلب جديد: {ticket.title}',
-            'assigned': f'تم تعيين طلب لك: {ticket.title}',
-            'acknowledged': f'تم تأكيد الطلب: {ticket.title}',
-            'escalated': f'تم تصعيد الطلب: {ticket.title}',
-            'resolved': f'تم حل الطلب: {ticket.title}',
-            'closed': f'تم إغلاق الطلب: {ticket.title}',
-            'commented': f'تعليق جديد على الطلب: {ticket.title}',
-        }
-        
-        subject = subject_map.get(action_type, f'تحديث على الطلب: {ticket.title}')
+        # إضافة البريد لصندوق الصادر - يرسله عامل Celery بعد تثبيت المعاملة
+        EmailOutbox.enqueue_many(messages)
         
-        # إرسال البريد
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=recipients,
-            html_message=html_message,
-            fail_silently=False,
-        )
-        
-        logger.info(f"Email sent for ticket {ticket.id} - action: {action_type}")
+        logger.info(f"Email queued for ticket {ticket.id} - action: {action_type}")
         
     except Exception as e:
         logger.error(f"Error sending email for ticket {ticket.id}: {str(e)}")
 
 
+def queue_ticket_update_emails(tickets, action_type, user=None, actors=None):
+    """
+    بريد التحديث لمجموعة طلبات دفعة واحدة: استعلام واحد لتفضيلات الملخص وإدراج واحد في صندوق الصادر
+    يُفترض تحميل الطلبات مع created_by وassigned_to وassigned_to_users مسبقاً
+    actors: منفذ مختلف لكل طلب {معرف الطلب: المستخدم} بدلاً من user
+    """
+    users_by_ticket = {ticket.pk: _ticket_email_users(ticket) for ticket in tickets}
+    digest_users = NotificationPreference.digest_user_ids(
+        {user_id for users in users_by_ticket.values() for user_id in users}
+    )
+    messages = []
+    for ticket in tickets:
+        users = users_by_ticket[ticket.pk]
+        suppressed = digest_users & users.keys()
+        if suppressed:
+            incr_daily_counter('digest_emails_suppressed', len(suppressed))
+        actor = actors.get(ticket.pk) if actors else user
+        messages.extend(build_ticket_update_email(ticket, action_type, actor, users, digest_users))
+    EmailOutbox.enqueue_many(messages)
+    return len(messages)
+
+
 def send_ticket_assigned_email(ticket, assigned_to):
     """
     إرسال بريد عند تعيين الطلب لمستخدم
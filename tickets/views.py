@@ -1,18 +1,20 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.conf import settings
 from django.utils import timezone
 from django.db.models import Q, Count
-from django.http import JsonResponse, HttpResponse
+from django.http import FileResponse, JsonResponse, HttpResponse
 from django.core.paginator import Paginator
 from django.core.cache import cache
 from django.views.decorators.cache import cache_page
 from django_ratelimit.decorators import ratelimit
 from datetime import timedelta
-from .models import Ticket, TicketAction, TicketAcknowledgment
-from notifications.models import GlobalMail
+from .models import Ticket, TicketAction, TicketAcknowledgment, TicketAudience
 from .forms import CreateTicketForm, CloseTicketForm, AcknowledgeTicketForm, CommentForm, ReturnTicketForm
 from .decorators import can_view_reports, can_export_data  # نظام الصلاحيات الجديد
+from .cache_utils import get_dashboard_epoch, invalidate_pending_acknowledgments
+from .metrics import local_day_bounds, priority_breakdown, resolution_time_stats, ticket_trend
 from accounts.models import Department, CustomUser
 import json
 import logging
@@ -21,145 +23,143 @@ import logging
 logger = logging.getLogger('tickets')
 
 
+# قوائم الطلبات في لوحة التحكم: (مفتاح المعرفات في الذاكرة، اسم المتغير في القالب، العلاقات المحمّلة)
+DASHBOARD_TICKET_LISTS = [
+    ('critical_ticket_ids', 'critical_tickets', ('department', 'assigned_to', 'created_by')),
+    ('recent_ticket_ids', 'recent_tickets', ('department', 'assigned_to', 'created_by')),
+    ('assigned_to_me_ids', 'assigned_to_me', ('department', 'created_by')),
+]
+
+
+def _dashboard_stats(user):
+    """
+    حساب إحصائيات لوحة التحكم حسب دور المستخدم
+    النتيجة قيم بسيطة فقط (أعداد، نصوص، قوائم معرفات) لتكون صغيرة في الذاكرة المؤقتة
+    """
+    stats = {}
+    
+    # التحقق من أن المستخدم من الإدارة العليا
+    is_upper_management = user.is_upper_management
+    
+    if is_upper_management:
+        # لوحة الإدارة العليا - عرض كل شيء
+        now = timezone.now()
+        today_start, today_end = local_day_bounds(timezone.localdate(now))
+        
+        # إحصائيات عامة - optimized queries
+        stats.update({
+            'total_tickets': Ticket.objects.count(),
+            'pending_tickets': Ticket.objects.filter(status__in=['new', 'pending_ack', 'in_progress']).count(),
+            'violated_tickets': Ticket.objects.filter(status='violated').count(),
+            'resolved_today': Ticket.objects.filter(
+                resolved_at__gte=today_start, resolved_at__lt=today_end
+            ).count(),
+            'worst_departments': list(Department.objects.annotate(
+                violated_count=Count('tickets', filter=Q(tickets__status='violated'))
+            ).filter(violated_count__gt=0).order_by('-violated_count').values('name', 'violated_count')[:5]),  # فقط الأقسام ذات الانتهاكات
+            'critical_ticket_ids': list(Ticket.objects.filter(
+                priority='critical',
+                status__in=['new', 'pending_ack', 'in_progress']
+            ).order_by('sla_deadline').values_list('id', flat=True)[:10]),
+            'is_upper_management': True,
+        })
+        
+        # بيانات الرسم البياني - آخر DASHBOARD_TREND_DAYS يوماً (استعلام واحد مجمّع)
+        chart_data = ticket_trend(getattr(settings, 'DASHBOARD_TREND_DAYS', 7), now=now)
+        stats['chart_data'] = json.dumps(chart_data)
+        
+        # توزيع الأولويات (استعلام GROUP BY واحد)
+        priority_data = priority_breakdown()
+        stats['priority_data'] = json.dumps(priority_data)
+        
+    elif user.role == 'dean' or user.role == 'head':
+        # لوحة العميد أو رئيس القسم
+        # الفلتر يشمل:
+        # 1. التذاكر المسندة للقسم المفرد (department)
+        # 2. التذاكر المسندة للأقسام المتعددة (departments)
+        # 3. التذاكر المسندة شخصياً أو التي أنشأها
+        visible = Ticket.objects.visible_to(
+            user, include=TicketAudience.LISTING_REASONS[user.role] + ('creator',)
+        )
+        
+        stats.update({
+            'my_dept_tickets': visible.count(),
+            'my_dept_pending': visible.filter(status__in=['new', 'pending_ack', 'in_progress']).count(),
+            'my_dept_violated': visible.filter(status='violated').count(),
+            'recent_ticket_ids': list(visible.order_by('-created_at').values_list('id', flat=True)[:10]),
+        })
+        
+        # متوسط ووسيط و p90 لوقت الحل - محسوبة داخل قاعدة البيانات
+        resolution = resolution_time_stats(visible)
+        stats.update({
+            'avg_resolution_time': resolution['avg'],
+            'median_resolution_time': resolution['median'],
+            'p90_resolution_time': resolution['p90'],
+        })
+    
+    else:
+        # لوحة الموظف - تحديث لتشمل التعيين المتعدد
+        # الفلتر يشمل:
+        # 1. التعيين المباشر (assigned_to)
+        # 2. التعيين المتعدد (assigned_to_users)
+        # 3. التعيين للقسم (departments)
+        # 4. التذاكر التي أنشأها المستخدم (created_by)
+        
+        visible = Ticket.objects.visible_to(user, include=TicketAudience.LISTING_REASONS['employee'])
+
+        stats.update({
+            'my_tickets': visible.count(),
+            'my_pending': visible.filter(
+                status__in=['new', 'pending_ack', 'in_progress']
+            ).count(),
+            'my_overdue': visible.filter(
+                status__in=['new', 'pending_ack', 'in_progress'],
+                sla_deadline__lt=timezone.now()
+            ).count(),
+            'assigned_to_me_ids': list(visible.order_by('-created_at').values_list('id', flat=True)[:10]),
+        })
+        
+        # معدل الإنجاز
+        total = stats['my_tickets']
+        resolved = visible.filter(status__in=['resolved', 'closed']).count()
+        stats['completion_rate'] = round((resolved / total * 100) if total > 0 else 0, 1)
+    
+    return stats
 
 
 @login_required
 def dashboard(request):
     """
     لوحة التحكم الرئيسية - تعرض إحصائيات مختلفة حسب دور المستخدم
-    Optimized with caching and select_related
+    الإحصائيات محفوظة في الذاكرة المؤقتة بمفتاح يتضمن "حقبة البيانات" التي تتغير مع كل تعديل
+    على الطلبات، والإدارة العليا تتشارك مدخلاً واحداً
     """
     user = request.user
-    cache_key = f'dashboard_stats_{user.id}_{user.role}'
+    epoch = get_dashboard_epoch()
+    if user.is_upper_management:
+        cache_key = f'dashboard_stats_v{epoch}_upper'
+    else:
+        cache_key = f'dashboard_stats_v{epoch}_{user.id}_{user.role}'
     
     # Try to get from cache first
-    context = cache.get(cache_key)
+    stats = cache.get(cache_key)
     
-    if not context:
+    if stats is None:
         logger.info(f'Dashboard cache miss for user {user.id}')
-        context = {'user': user}
-        # إضافة البريد العام
-        context['global_mails'] = GlobalMail.objects.all()[:5]
-        
-        # التحقق من أن المستخدم من الإدارة العليا
-        is_upper_management = user.is_upper_management
-        
-        if is_upper_management:
-            # لوحة الإدارة العليا - عرض كل شيء
-            now = timezone.now()
-            
-            # إحصائيات عامة - optimized queries
-            context.update({
-                'total_tickets': Ticket.objects.count(),
-                'pending_tickets': Ticket.objects.filter(status__in=['new', 'pending_ack', 'in_progress']).count(),
-                'violated_tickets': Ticket.objects.filter(status='violated').count(),
-                'resolved_today': Ticket.objects.filter(resolved_at__date=now.date()).count(),
-                'worst_departments': Department.objects.annotate(
-                    violated_count=Count('tickets', filter=Q(tickets__status='violated'))
-                ).filter(violated_count__gt=0).order_by('-violated_count')[:5],  # فقط الأقسام ذات الانتهاكات
-                'critical_tickets': Ticket.objects.select_related(
-                    'department', 'assigned_to', 'created_by'
-                ).filter(
-                    priority='critical',
-                    status__in=['new', 'pending_ack', 'in_progress']
-                ).order_by('sla_deadline')[:10],
-                'is_upper_management': True,
-            })
-            
-            # بيانات الرسم البياني - آخر 7 أيام
-            chart_data = []
-            for i in range(6, -1, -1):
-                day = now - timedelta(days=i)
-                chart_data.append({
-                    'date': day.strftime('%Y-%m-%d'),
-                    'created': Ticket.objects.filter(created_at__date=day.date()).count(),
-                    'resolved': Ticket.objects.filter(resolved_at__date=day.date()).count(),
-                    'violated': Ticket.objects.filter(
-                        status='violated',
-                        created_at__date=day.date()
-                    ).count(),
-                })
-            
-            context['chart_data'] = json.dumps(chart_data)
-            
-            # توزيع الأولويات
-            priority_data = {
-                'critical': Ticket.objects.filter(priority='critical').count(),
-                'urgent': Ticket.objects.filter(priority='urgent').count(),
-                'normal': Ticket.objects.filter(priority='normal').count(),
-            }
-            context['priority_data'] = json.dumps(priority_data)
-            
-        elif user.role == 'dean' or user.role == 'head':
-            # لوحة العميد أو رئيس القسم
-            # الفلتر يشمل:
-            # 1. التذاكر المسندة للقسم المفرد (department)
-            # 2. التذاكر المسندة للأقسام المتعددة (departments)
-            # 3. التذاكر المسندة شخصياً
-            dept_filter = Q(department=user.department) | Q(departments=user.department) if user.department else Q()
-            personal_filter = Q(assigned_to=user) | Q(assigned_to_users=user) | Q(created_by=user)
-            combined_filter = dept_filter | personal_filter
-            
-            context.update({
-                'my_dept_tickets': Ticket.objects.filter(combined_filter).distinct().count(),
-                'my_dept_pending': Ticket.objects.filter(combined_filter, status__in=['new', 'pending_ack', 'in_progress']).distinct().count(),
-                'my_dept_violated': Ticket.objects.filter(combined_filter, status='violated').distinct().count(),
-                'recent_tickets': Ticket.objects.select_related(
-                    'department', 'assigned_to', 'created_by'
-                ).filter(combined_filter).distinct().order_by('-created_at')[:10],
-            })
-            
-            # متوسط وقت الحل
-            resolved_tickets = Ticket.objects.filter(combined_filter, status__in=['resolved', 'closed']).distinct()
-            if resolved_tickets.exists():
-                avg_time = sum([
-                    (t.resolved_at - t.created_at).total_seconds() / 3600 
-                    for t in resolved_tickets if t.resolved_at
-                ]) / resolved_tickets.count()
-                context['avg_resolution_time'] = round(avg_time, 1)
-            else:
-                context['avg_resolution_time'] = 0
-        
-        else:
-            # لوحة الموظف - تحديث لتشمل التعيين المتعدد
-            # الفلتر يشمل:
-            # 1. التعيين المباشر (assigned_to)
-            # 2. التعيين المتعدد (assigned_to_users)
-            # 3. التعيين للقسم (departments)
-            # 4. التذاكر التي أنشأها المستخدم (created_by)
-            
-            user_tickets_filter = Q(assigned_to=user) | Q(assigned_to_users=user) | Q(created_by=user)
-            if user.department:
-                user_tickets_filter |= Q(departments=user.department)
-
-            context.update({
-                'my_tickets': Ticket.objects.filter(user_tickets_filter).distinct().count(),
-                'my_pending': Ticket.objects.filter(
-                    user_tickets_filter,
-                    status__in=['new', 'pending_ack', 'in_progress']
-                ).distinct().count(),
-                'my_overdue': Ticket.objects.filter(
-                    user_tickets_filter,
-                    status__in=['new', 'pending_ack', 'in_progress'],
-                    sla_deadline__lt=timezone.now()
-                ).distinct().count(),
-                'assigned_to_me': Ticket.objects.select_related(
-                    'department', 'created_by'
-                ).filter(user_tickets_filter).distinct().order_by('-created_at')[:10],
-            })
-            
-            # معدل الإنجاز
-            total = Ticket.objects.filter(user_tickets_filter).distinct().count()
-            resolved = Ticket.objects.filter(
-                user_tickets_filter, 
-                status__in=['resolved', 'closed']
-            ).distinct().count()
-            context['completion_rate'] = round((resolved / total * 100) if total > 0 else 0, 1)
-        
-        # Cache for 5 minutes
-        cache.set(cache_key, context, 300)
+        stats = _dashboard_stats(user)
+        cache.set(cache_key, stats, getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 300))
         logger.info(f'Dashboard cached for user {user.id}')
     
+    # البريد العام يأتي من context processor (notifications.context_processors.global_mails)
+    context = dict(stats)
+    
+    # تحميل الطلبات المعروضة من معرفاتها (استعلام واحد لكل قائمة)
+    for ids_key, context_key, related in DASHBOARD_TICKET_LISTS:
+        ids = context.pop(ids_key, None)
+        if ids is not None:
+            tickets = Ticket.objects.select_related(*related).in_bulk(ids)
+            context[context_key] = [tickets[pk] for pk in ids if pk in tickets]
+    
     return render(request, 'tickets/dashboard.html', context)
 
 
@@ -174,16 +174,13 @@ def acknowledge_tickets(request):
     # 2. التعيين المتعدد (assigned_to_users)
     # 3. التعيين للقسم (departments)
     
-    ack_filter = Q(assigned_to=request.user) | Q(assigned_to_users=request.user)
-    if request.user.department:
-        ack_filter |= Q(departments=request.user.department)
+    assigned = Ticket.objects.visible_to(request.user, include=TicketAudience.ASSIGNMENT_REASONS)
         
-    unacknowledged = Ticket.objects.filter(
-        ack_filter,
+    unacknowledged = assigned.filter(
         status='pending_ack'
     ).exclude(
         acknowledgments__user=request.user
-    ).distinct()
+    )
     
     if request.method == 'POST':
         ticket_ids = request.POST.getlist('ticket_ids')
@@ -202,13 +199,7 @@ def acknowledge_tickets(request):
         
         # تأكيد جميع التذاكر المحددة
         # نسمح بالإقرار إذا كان المستخدم معيناً (مفرداً أو متعدداً) أو ضمن الأقسام المعنية
-        ack_perm_filter = Q(assigned_to=request.user) | Q(assigned_to_users=request.user)
-        if request.user.department:
-            ack_perm_filter |= Q(departments=request.user.department)
-
-        acknowledged_tickets = Ticket.objects.filter(
-            id__in=ticket_ids
-        ).filter(ack_perm_filter).distinct()
+        acknowledged_tickets = assigned.filter(id__in=ticket_ids)
         
         count = 0
         for ticket in acknowledged_tickets:
@@ -276,6 +267,10 @@ def acknowledge_tickets(request):
         messages.success(request, f'تم تسجيل إقرارك لـ {count} طلب')
         return redirect('dashboard')
     
+    if not unacknowledged.exists():
+        # لا شيء بانتظار الإقرار: نحذف أي علم قديم حتى لا يُعاد توجيه المستخدم لهذه الصفحة
+        invalidate_pending_acknowledgments([request.user.pk])
+    
     return render(request, 'tickets/acknowledge.html', {
         'unacknowledged_tickets': unacknowledged
     })
@@ -541,39 +536,11 @@ def ticket_list(request):
     """
     قائمة الطلبات مع فلترة وبحث وترقيم صفحات
     """
-    tickets = Ticket.objects.all()
-    
     # الفلترة حسب الدور
-    if request.user.is_upper_management:
-        # الإدارة العليا ترى جميع الطلبات
-        pass  # لا حاجة لفلترة
-    elif request.user.role == 'employee':
-        # الموظف يرى:
-        # 1. التذاكر المسندة إليه مباشرة
-        # 2. التذاكر المسندة إليه ضمن مجموعة
-        # 3. التذاكر المسندة لقسمه (كمجموعة)
-        # 4. التذاكر التي أنشأها
-        
-        employee_filter = Q(assigned_to=request.user) | \
-                         Q(assigned_to_users=request.user) | \
-                         Q(created_by=request.user)
-        
-        if request.user.department:
-            employee_filter |= Q(departments=request.user.department)
-            
-        tickets = tickets.filter(employee_filter).distinct()
-
-    elif request.user.role in ['head', 'dean']:
-        # رئيس القسم/العميد يرى:
-        # 1. جميع تذاكر قسمه (المباشرة والمتعددة)
-        # 2. التذاكر المسندة إليه شخصياً (حتى لو من قسم آخر)
-        
-        head_filter = Q(department=request.user.department) | \
-                     Q(departments=request.user.department) | \
-                     Q(assigned_to=request.user) | \
-                     Q(assigned_to_users=request.user)
-                     
-        tickets = tickets.filter(head_filter).distinct()
+    # الإدارة العليا ترى جميع الطلبات
+    # الموظف يرى: المسندة إليه (مباشرة أو ضمن مجموعة)، المسندة لقسمه، والتي أنشأها
+    # رئيس القسم/العميد يرى: جميع تذاكر قسمه (المباشرة والمتعددة) والمسندة إليه شخصياً
+    tickets = Ticket.objects.visible_to(request.user)
     
     # البحث
     search_query = request.GET.get('search', '')
@@ -645,7 +612,6 @@ def reports_dashboard(request):
             'pending': dept.pending_tickets
         })
     
-    from notifications.models import GlobalMail
     context = {
         'departments_stats': departments_stats,
         'employees_stats': employees_stats,
@@ -655,7 +621,6 @@ def reports_dashboard(request):
         'resolved': resolved,
         'violation_rate': (violated / total_tickets * 100) if total_tickets > 0 else 0,
         'dept_chart_data': json.dumps(dept_chart_data),
-        'global_mails': GlobalMail.objects.all()[:5],
     }
     
     return render(request, 'tickets/reports_dashboard.html', context)
@@ -686,28 +651,8 @@ def export_report(request):
         smart_str('متأخر؟')
     ])
     
-    tickets = Ticket.objects.all()
-    
     # تطبيق الفلاتر - نفس منطق ticket_list
-    if request.user.is_upper_management:
-        # الإدارة العليا ترى جميع الطلبات
-        pass
-    elif request.user.role == 'employee':
-        employee_filter = Q(assigned_to=request.user) | \
-                         Q(assigned_to_users=request.user) | \
-                         Q(created_by=request.user)
-        
-        if request.user.department:
-            employee_filter |= Q(departments=request.user.department)
-            
-        tickets = tickets.filter(employee_filter).distinct()
-    elif request.user.role in ['head', 'dean']:
-        head_filter = Q(department=request.user.department) | \
-                     Q(departments=request.user.department) | \
-                     Q(assigned_to=request.user) | \
-                     Q(assigned_to_users=request.user)
-                     
-        tickets = tickets.filter(head_filter).distinct()
+    tickets = Ticket.objects.visible_to(request.user).select_related('department', 'assigned_to')
     
     for ticket in tickets:
         dept_name = ticket.department.name if ticket.department else 'غير محدد'
@@ -732,23 +677,17 @@ def get_notifications(request):
     """
     user = request.user
     
-    # بناء الفلتر الشامل - يشمل التعيين المباشر والمتعدد والأقسام
-    user_filter = Q(assigned_to=user) | Q(assigned_to_users=user)
-    if user.department:
-        user_filter |= Q(departments=user.department)
+    # الطلبات المعينة للمستخدم - يشمل التعيين المباشر والمتعدد والأقسام
+    assigned = Ticket.objects.visible_to(user, include=TicketAudience.ASSIGNMENT_REASONS)
     
     # الطلبات الجديدة المعينة للمستخدم
-    new_tickets = Ticket.objects.filter(
-        user_filter,
-        status='pending_ack'
-    ).distinct().count()
+    new_tickets = assigned.filter(status='pending_ack').count()
     
     # الطلبات المتأخرة
-    overdue_tickets = Ticket.objects.filter(
-        user_filter,
+    overdue_tickets = assigned.filter(
         status__in=['new', 'pending_ack', 'in_progress'],
         sla_deadline__lt=timezone.now()
-    ).distinct().count()
+    ).count()
     
     return JsonResponse({
         'new_tickets': new_tickets,
@@ -759,30 +698,10 @@ def get_notifications(request):
 
 @login_required
 def export_ticket_pdf(request, pk):
-    """تصدير الطلب إلى PDF مع دعم كامل للغة العربية"""
-    from django.conf import settings
-    from reportlab.lib import colors
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.units import inch
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-    from reportlab.pdfbase import pdfmetrics
-    from reportlab.pdfbase.ttfonts import TTFont
-    from reportlab.lib.enums import TA_RIGHT, TA_CENTER
-    from io import BytesIO
-    import arabic_reshaper
-    from bidi.algorithm import get_display
-    import os
-    
-    def format_arabic(text):
-        """تنسيق النص العربي للعرض الصحيح"""
-        if not text:
-            return ""
-        reshaped = arabic_reshaper.reshape(str(text))
-        return get_display(reshaped)
-    
+    """تصدير الطلب إلى PDF مع دعم كامل للغة العربية (من الذاكرة المؤقتة على القرص - tickets.pdf_render)"""
+    from .pdf_render import cached_ticket_pdf
+
     ticket = get_object_or_404(Ticket, pk=pk)
-    actions = ticket.actions.all().order_by('-created_at')[:10]
     
     # التحقق من الصلاحيات - استخدام نفس منطق ticket_detail
     can_view = False
@@ -804,218 +723,25 @@ def export_ticket_pdf(request, pk):
         messages.error(request, 'ليس لديك صلاحية لتصدير هذا الطلب')
         return redirect('dashboard')
     
-    # تسجيل الخط العربي
-    font_name = 'Helvetica'  # افتراضي
     try:
-        font_path = os.path.join(settings.BASE_DIR, 'static', 'fonts', 'NotoNaskhArabic-Regular.ttf')
-        if os.path.exists(font_path):
-            pdfmetrics.registerFont(TTFont('ArabicFont', font_path))
-            font_name = 'ArabicFont'
-    except Exception as e:
-        logger.warning(f'Could not load Arabic font: {e}')
-    
-    # إنشاء PDF
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=50, leftMargin=50, topMargin=50, bottomMargin=30)
-    
-    elements = []
-    styles = getSampleStyleSheet()
-    
-    # أنماط مخصصة
-    title_style = ParagraphStyle(
-        'ArabicTitle',
-        parent=styles['Heading1'],
-        fontName=font_name,
-        fontSize=20,
-        textColor=colors.HexColor('#4c7eea'),
-        alignment=TA_CENTER,
-        spaceAfter=20,
-    )
-    
-    heading_style = ParagraphStyle(
-        'ArabicHeading',
-        parent=styles['Heading2'],
-        fontName=font_name,
-        fontSize=14,
-        alignment=TA_RIGHT,
-        spaceAfter=10,
-        textColor=colors.HexColor('#333333'),
-        wordWrap='RTL',  # دعم RTL
-        rightIndent=0,
-    )
-    
-    normal_style = ParagraphStyle(
-        'ArabicNormal',
-        parent=styles['Normal'],
-        fontName=font_name,
-        fontSize=11,
-        alignment=TA_RIGHT,
-        leading=16,
-        wordWrap='RTL',  # دعم RTL
-        rightIndent=0,
-        leftIndent=0,
-    )
-
-    english_style = ParagraphStyle(
-        'EnglishNormal',
-        parent=styles['Normal'],
-        fontName='Helvetica',
-        fontSize=11,
-        alignment=TA_RIGHT,
-        leading=16,
-    )
-    
-    # العنوان الرئيسي
-    elements.append(Paragraph(format_arabic("تقرير الطلب"), title_style))
-    elements.append(Paragraph(f"Ticket #{ticket.id}", english_style))
-    elements.append(Spacer(1, 15))
-    
-    # تحذير إذا متأخر
-    if ticket.is_overdue:
-        warning_style = ParagraphStyle(
-            'Warning',
-            parent=normal_style,
-            textColor=colors.red,
-            fontSize=12,
-            alignment=TA_CENTER,
-        )
-        elements.append(Paragraph(format_arabic(f"⚠ تحذير: الطلب متأخر {ticket.hours_delayed:.1f} ساعة"), warning_style))
-        elements.append(Spacer(1, 10))
-    
-    # معلومات الطلب
-    elements.append(Paragraph(format_arabic("معلومات الطلب"), heading_style))
-    
-    # عكس ترتيب الأعمدة للقراءة من اليمين لليسار
-    info_data = [
-        [Paragraph(format_arabic(ticket.title), normal_style), Paragraph(format_arabic('العنوان:'), normal_style)],
-        [Paragraph(format_arabic(ticket.get_status_display()), normal_style), Paragraph(format_arabic('الحالة:'), normal_style)],
-        [Paragraph(format_arabic(ticket.get_priority_display()), normal_style), Paragraph(format_arabic('الأولوية:'), normal_style)],
-        [Paragraph(format_arabic(ticket.created_by.get_full_name()), normal_style), Paragraph(format_arabic('المنشئ:'), normal_style)],
-        [Paragraph(format_arabic(ticket.created_at.strftime('%Y-%m-%d %H:%M')), normal_style), Paragraph(format_arabic('تاريخ الإنشاء:'), normal_style)],
-        [Paragraph(format_arabic(ticket.sla_deadline.strftime('%Y-%m-%d %H:%M')), normal_style), Paragraph(format_arabic('الموعد النهائي:'), normal_style)],
-    ]
-    
-    if ticket.assigned_to:
-        info_data.append([
-            Paragraph(format_arabic(ticket.assigned_to.get_full_name()), normal_style),
-            Paragraph(format_arabic('المعين له:'), normal_style)
-        ])
-    
-    if ticket.department:
-        info_data.append([
-            Paragraph(format_arabic(ticket.department.name), normal_style),
-            Paragraph(format_arabic('القسم:'), normal_style)
-        ])
-    
-    info_table = Table(info_data, colWidths=[4.5*inch, 1.5*inch], hAlign='RIGHT')
-    info_table.setStyle(TableStyle([
-        ('BACKGROUND', (1, 0), (1, -1), colors.HexColor('#f0f0f0')),
-        ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('FONTNAME', (0, 0), (-1, -1), font_name),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('TOPPADDING', (0, 0), (-1, -1), 8),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 12),
-        ('LEFTPADDING', (0, 0), (-1, -1), 4),
-    ]))
-    elements.append(info_table)
-    elements.append(Spacer(1, 15))
-    
-    # الوصف
-    elements.append(Paragraph(format_arabic("الوصف"), heading_style))
-    desc_text = ticket.description[:300] + "..." if len(ticket.description) > 300 else ticket.description
-    elements.append(Paragraph(format_arabic(desc_text), normal_style))
-    elements.append(Spacer(1, 15))
-    
-    # التواريخ  
-    elements.append(Paragraph(format_arabic("التواريخ"), heading_style))
-    dates_data = [
-        [Paragraph(format_arabic(ticket.created_at.strftime('%Y-%m-%d %H:%M')), normal_style), Paragraph(format_arabic('تاريخ الإنشاء:'), normal_style)],
-        [Paragraph(format_arabic(ticket.sla_deadline.strftime('%Y-%m-%d %H:%M')), normal_style), Paragraph(format_arabic('الموعد النهائي:'), normal_style)],
-    ]
-
-    if ticket.resolved_at:
-        dates_data.append([
-            Paragraph(format_arabic(ticket.resolved_at.strftime('%Y-%m-%d %H:%M')), normal_style),
-            Paragraph(format_arabic('تاريخ الحل:'), normal_style)
-        ])
-
-    dates_table = Table(dates_data, colWidths=[4.5*inch, 1.5*inch], hAlign='RIGHT')
-    dates_table.setStyle(TableStyle([
-        ('BACKGROUND', (1, 0), (1, -1), colors.HexColor('#f0f0f0')),
-        ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('FONTNAME', (0, 0), (-1, -1), font_name),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ('TOPPADDING', (0, 0), (-1, -1), 8),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 12),
-        ('LEFTPADDING', (0, 0), (-1, -1), 4),
-    ]))
-    elements.append(dates_table)
-    elements.append(Spacer(1, 15))
-    
-    # سجل الإجراءات
-    if actions.exists():
-        elements.append(Paragraph(format_arabic("آخر الإجراءات"), heading_style))
-        
-        # عكس ترتيب الأعمدة: التاريخ - المستخدم - النوع (من اليمين لليسار)
-        actions_data = [[
-            Paragraph(format_arabic('التاريخ'), normal_style),
-            Paragraph(format_arabic('المستخدم'), normal_style),
-            Paragraph(format_arabic('النوع'), normal_style),
-        ]]
-        for action in actions:
-            actions_data.append([
-                Paragraph(format_arabic(action.created_at.strftime('%Y-%m-%d %H:%M')), normal_style),
-                Paragraph(format_arabic(action.user.get_full_name() if action.user else 'النظام'), normal_style),
-                Paragraph(format_arabic(action.get_action_type_display()), normal_style),
-            ])
-        actions_table = Table(actions_data, colWidths=[2*inch, 2*inch, 2*inch], hAlign='RIGHT')
-        actions_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4c7eea')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, -1), font_name),
-            ('FONTSIZE', (0, 0), (-1, 0), 11),
-            ('FONTSIZE', (0, 1), (-1, -1), 9),
-            ('TOPPADDING', (0, 0), (-1, -1), 6),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 8),
-            ('LEFTPADDING', (0, 0), (-1, -1), 2),
-        ]))
-        elements.append(actions_table)
-    
-    # التذييل
-    elements.append(Spacer(1, 20))
-    footer_style = ParagraphStyle(
-        'Footer',
-        parent=normal_style,
-        fontSize=9,
-        textColor=colors.grey,
-        alignment=TA_CENTER,
-    )
-    elements.append(Paragraph(format_arabic("نظام إدارة الطلبات - قسم الحاسبة الإلكترونية"), footer_style))
-    elements.append(Paragraph(f"تاريخ الطباعة: {timezone.now().strftime('%Y-%m-%d %H:%M')}", footer_style))
-    
-    # بناء PDF
-    try:
-        doc.build(elements)
-        buffer.seek(0)
-        
-        response = HttpResponse(buffer, content_type='application/pdf; charset=utf-8')
-        response['Content-Disposition'] = f'attachment; filename="ticket_{ticket.id}.pdf"'
-        
-        logger.info(f'PDF exported successfully for ticket {ticket.id}')
-        return response
-        
+        path, _ = cached_ticket_pdf(ticket.pk)
+        if path is not None:
+            response = FileResponse(
+                open(path, 'rb'), as_attachment=True, filename=f'ticket_{ticket.id}.pdf',
+                content_type='application/pdf',
+            )
+            logger.info(f'PDF exported successfully for ticket {ticket.id}')
+            return response
+    except FileNotFoundError:
+        # استُبدل الملف بنسخة أحدث بين الفحص والفتح
+        pass
     except Exception as e:
         logger.error(f'Error generating PDF: {e}')
         messages.error(request, f'خطأ في تصدير PDF: {str(e)}')
         return redirect('ticket_detail', pk=pk)
+    
+    # الملف قيد التوليد في الخلفية: صفحة انتظار تعيد الطلب تلقائياً
+    return render(request, 'tickets/pdf_pending.html', {'ticket': ticket}, status=202)
 
 
 @login_required
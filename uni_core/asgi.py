@@ -3,6 +3,9 @@ ASGI config for uni_core project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+HTTP requests are served by Django; WebSocket connections (real-time
+notifications) are routed through Channels with session authentication.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -13,4 +16,18 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'uni_core.settings')
 
-application = get_asgi_application()
+# يجب تهيئة Django قبل استيراد أي شيء يعتمد على النماذج
+django_asgi_app = get_asgi_application()
+
+from channels.auth import AuthMiddlewareStack  # noqa: E402
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+from channels.security.websocket import AllowedHostsOriginValidator  # noqa: E402
+
+from notifications.routing import websocket_urlpatterns  # noqa: E402
+
+application = ProtocolTypeRouter({
+    'http': django_asgi_app,
+    'websocket': AllowedHostsOriginValidator(
+        AuthMiddlewareStack(URLRouter(websocket_urlpatterns))
+    ),
+})
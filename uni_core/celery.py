@@ -1,6 +1,9 @@
 import os
+import time
+
 from celery import Celery
-from celery.schedules import crontab
+from celery.signals import before_task_publish, celeryd_init
+from kombu import Queue
 
 # تعيين إعدادات Django الافتراضية لبرنامج celery
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'uni_core.settings')
@@ -13,21 +16,67 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # تحميل المهام (tasks) من جميع التطبيقات المسجلة
 app.autodiscover_tasks()
 
-# جدولة المهام الدورية
-app.conf.beat_schedule = {
-    'check-sla-violations-every-10-minutes': {
-        'task': 'tickets.tasks.check_sla_violations',
-        'schedule': crontab(minute='*/10'),  # كل 10 دقائق
-    },
-    'auto-reassign-overdue-tickets': {
-        'task': 'tickets.tasks.auto_reassign_tickets',
-        'schedule': crontab(hour='*/6'),  # كل 6 ساعات
-    },
-    'send-daily-report': {
-        'task': 'tickets.tasks.send_daily_report',
-        'schedule': crontab(hour=10, minute=0),  # كل يوم الساعة 10 صباحاً
-    },
-}
+# جدولة المهام الدورية: مصدر واحد هو CELERY_BEAT_SCHEDULE في settings.py
+# (يُقرأ عبر config_from_object أعلاه كـ beat_schedule)
+
+DEFAULT_QUEUE = 'default'
+TASK_OPTIONS = ('acks_late', 'soft_time_limit', 'time_limit')
+
+
+def queue_config():
+    from django.conf import settings
+
+    return getattr(settings, 'TASK_QUEUES', {DEFAULT_QUEUE: {'tasks': []}})
+
+
+def configure_queues(app, queues):
+    """
+    اشتقاق الطوابير والتوجيه وخيارات المهام من TASK_QUEUES
+    مهام الطابور الافتراضي (وكل مهمة غير مذكورة) تأخذ إعداداته كإعدادات عامة
+    """
+    routes = {}
+    annotations = {}
+    for name, config in queues.items():
+        for task in config.get('tasks', []):
+            routes[task] = {'queue': name, 'routing_key': name, 'priority': config.get('priority')}
+            annotations[task] = {option: config[option] for option in TASK_OPTIONS if option in config}
+
+    default = queues.get(DEFAULT_QUEUE, {})
+    app.conf.update(
+        task_queues=[Queue(name, routing_key=name) for name in queues],
+        task_default_queue=DEFAULT_QUEUE,
+        task_default_routing_key=DEFAULT_QUEUE,
+        task_default_priority=default.get('priority'),
+        task_routes=routes,
+        task_annotations=annotations,
+        task_acks_late=default.get('acks_late', False),
+        task_soft_time_limit=default.get('soft_time_limit'),
+        task_time_limit=default.get('time_limit'),
+    )
+
+
+configure_queues(app, queue_config())
+
+
+@celeryd_init.connect
+def apply_queue_prefetch(sender=None, conf=None, options=None, **kwargs):
+    """
+    prefetch إعداد على مستوى العامل: العامل المخصص لطوابير محددة (-Q) يأخذ أصغر قيمة بينها
+    """
+    queues = queue_config()
+    selected = (options or {}).get('queues') or []
+    if isinstance(selected, str):
+        selected = selected.split(',')
+    values = [queues[name]['prefetch_multiplier'] for name in selected if 'prefetch_multiplier' in queues.get(name, {})]
+    if values:
+        conf.worker_prefetch_multiplier = min(values)
+
+
+@before_task_publish.connect
+def stamp_published_at(headers=None, **kwargs):
+    """وقت النشر في رأس الرسالة (لحساب عمر أقدم رسالة في كل طابور - celery_queues)"""
+    if headers is not None:
+        headers.setdefault('published_at', time.time())
 
 
 @app.task(bind=True)
@@ -45,6 +45,7 @@ INSTALLED_APPS = [
     
     # Third party
     'django_celery_beat',
+    'channels',  # WebSocket للإشعارات الفورية
 ]
 
 MIDDLEWARE = [
@@ -80,6 +81,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'uni_core.wsgi.application'
+ASGI_APPLICATION = 'uni_core.asgi.application'
 
 
 # Database
@@ -134,6 +136,10 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# ملفات PDF المولدة للطلبات (خارج MEDIA_ROOT لأنها لا تُخدم مباشرة)
+PDF_CACHE_DIR = BASE_DIR / 'pdf_cache'
+PDF_RENDER_PENDING_TIMEOUT = 120  # Seconds before a queued-but-unfinished render may be queued again
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -149,6 +155,84 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+# أولوية الرسائل في Redis: 0 الأعلى؛ والعامل الذي يستهلك عدة طوابير يقرؤها بترتيب -Q (priority)
+# visibility_timeout يجب أن يتجاوز SLA_TIMER_HORIZON (مهام المهل ذات ETA) وأطول time_limit مع acks_late
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'visibility_timeout': 3600,
+    'queue_order_strategy': 'priority',
+    'priority_steps': list(range(10)),
+    'sep': ':',
+}
+
+# طوابير Celery المخصصة - الترتيب هو ترتيب الأولوية (الأول أعلى أولوية)
+# لكل طابور: مهامه، أولوية رسائله، prefetch للعامل المخصص له، acks_late، وحدود الزمن (ثانية)
+# uni_core/celery.py يشتق منها task_queues و task_routes و task_annotations
+# التشغيل المقترح: عامل لكل طابور، مثلاً: celery -A uni_core worker -Q sla -c 2
+TASK_QUEUES = {
+    # المهام التي يجب أن تعمل في موعدها: مهل SLA والتصعيد وإعادة التعيين
+    'sla': {
+        'tasks': [
+            'tickets.tasks.check_sla_violations',
+            'tickets.tasks.fire_sla_deadline',
+            'tickets.tasks.send_deadline_warnings',
+            'tickets.tasks.auto_reassign_tickets',
+            'tickets.tasks.calculate_daily_penalties',
+        ],
+        'priority': 0,
+        'prefetch_multiplier': 1,
+        'acks_late': True,
+        'soft_time_limit': 240,
+        'time_limit': 300,
+    },
+    # إنشاء الإشعارات الجماعية والملخصات
+    'notifications': {
+        'tasks': [
+            'notifications.tasks.fan_out_notifications',
+            'notifications.tasks.send_notification_digests',
+            'notifications.tasks.reconcile_unread_counts',
+        ],
+        'priority': 3,
+        'prefetch_multiplier': 4,
+        'acks_late': True,
+        'soft_time_limit': 120,
+        'time_limit': 180,
+    },
+    # إرسال صندوق البريد الصادر (SMTP بطيء، لا يجب أن يؤخر ما سبق)
+    'email': {
+        'tasks': [
+            'notifications.tasks.send_outbox_emails',
+        ],
+        'priority': 5,
+        'prefetch_multiplier': 1,
+        'acks_late': True,
+        'soft_time_limit': 240,
+        'time_limit': 300,
+    },
+    # التقارير والتصدير الثقيل وتوليد PDF والصيانة
+    'exports': {
+        'tasks': [
+            'tickets.tasks.send_daily_report',
+            'tickets.tasks.generate_performance_metrics',
+            'tickets.tasks.update_daily_stats',
+            'notifications.tasks.prune_notifications',
+            'tickets.tasks.render_ticket_pdf_task',
+        ],
+        'priority': 7,
+        'prefetch_multiplier': 1,
+        'acks_late': True,
+        'soft_time_limit': 900,
+        'time_limit': 1200,
+    },
+    # كل مهمة غير مسندة لطابور أعلاه (إعدادات عامة للمهام)
+    'default': {
+        'tasks': [],
+        'priority': 5,
+        'prefetch_multiplier': 4,
+        'acks_late': False,
+        'soft_time_limit': 300,
+        'time_limit': 360,
+    },
+}
 
 # Email Configuration (for notifications)
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'  # Change to SMTP in production
@@ -159,6 +243,11 @@ EMAIL_HOST_USER = ''  # Set in production
 EMAIL_HOST_PASSWORD = ''  # Set in production
 DEFAULT_FROM_EMAIL = 'noreply@university.edu'  # Default sender email
 
+# Email outbox (emails are queued in EmailOutbox and sent by a Celery worker)
+EMAIL_OUTBOX_BATCH_SIZE = 100     # Messages sent per SMTP connection
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5     # Attempts before a message is dead-lettered
+EMAIL_OUTBOX_RETRY_BACKOFF = 60   # First retry delay in seconds (doubled on each attempt)
+
 # SLA Deadlines (in hours) - المهل الزمنية بالساعات
 # حرج = يوم واحد، عاجل = يومين، عادي = 3 أيام
 SLA_DEADLINES = {
@@ -170,12 +259,52 @@ SLA_DEADLINES = {
 # Escalation Settings
 ESCALATION_LEVELS = ['employee', 'head', 'dean', 'president']
 AUTO_REASSIGN_AFTER_HOURS = 48  # Auto-reassign ticket after 48 hours
+SLA_BATCH_SIZE = 500  # Overdue tickets violated per UPDATE/bulk_create transaction
+SLA_TIMER_HORIZON = 1800  # Deadlines within N seconds get an ETA timer (keep below the broker visibility_timeout)
+# Deadline warnings: minutes before sla_deadline, each sent once per ticket; the last one is urgent
+SLA_WARNING_THRESHOLDS = {
+    'normal': [120, 30],
+    'urgent': [120, 30],
+    'critical': [240, 60, 15],
+}
+TASK_LEASE_TTL = 300  # Seconds a periodic task holds its single-flight lease between heartbeats
+PENDING_ACK_CACHE_TIMEOUT = 600  # Cache per-user "has pending acknowledgments" flag (seconds)
+DASHBOARD_TREND_DAYS = 7  # Days covered by the upper-management dashboard trend chart
+DAILY_STATS_REFRESH_DAYS = 3  # TicketDailyStat.refresh always rebuilds the last N days (catches UPDATEs without updated_at)
+PERFORMANCE_METRIC_BUCKET_HOURS = 6  # Bucket size of the PerformanceMetricPoint time series (divides 24)
+PERFORMANCE_METRIC_MAX_POINTS = 120  # Monitoring charts/API downsample to at most this many points
+PERFORMANCE_METRIC_MAX_BUCKETS_PER_RUN = 240  # Buckets filled per generate_performance_metrics run (history: backfill_performance_metrics)
+DASHBOARD_CACHE_TIMEOUT = 300  # Upper bound for cached dashboard stats (signals invalidate earlier)
+
+# Notification fan-out (bulk_create instead of one INSERT per recipient)
+NOTIFICATION_FANOUT_BATCH_SIZE = 500        # Rows per bulk_create batch
+NOTIFICATION_FANOUT_ASYNC_THRESHOLD = 100   # Move fan-outs of this many recipients to a Celery task
+NOTIFICATION_COALESCE_WINDOW = 900          # Merge repeated (user, ticket, type) events within N seconds (0 = off)
+NOTIFICATION_DIGEST_HOUR = 7                # Local hour at which daily email digests are sent
+
+# Notification retention: read notifications older than N days (per type) move to ArchivedNotification
+NOTIFICATION_RETENTION_DAYS = {
+    'default': 90,
+    'deadline_approaching': 14,
+    'ticket_commented': 30,
+    'ticket_acknowledged': 30,
+}
+NOTIFICATION_ARCHIVE_RETENTION_DAYS = 730   # Archived rows are pruned (month by month) after N days
+NOTIFICATION_ARCHIVE_BATCH_SIZE = 500       # Rows moved per short transaction
+NOTIFICATION_ARCHIVE_BATCH_PAUSE = 0.1      # Seconds to sleep between batches
+
+# Activity tracking (write-behind buffer for last_activity_at)
+ACTIVITY_RECORD_INTERVAL = 30     # Record a user's activity in the DB buffer at most once per N seconds
+ACTIVITY_FLUSH_INTERVAL = 60      # Flush buffered activity every N seconds
+ACTIVITY_FLUSH_THRESHOLD = 200    # Flush immediately once this many users are pending
 
 # Celery Beat Schedule - نظام صارم للمتابعة
+# المصدر الوحيد لجدول المهام الدورية (uni_core/celery.py يقرأه من هنا)
 from celery.schedules import crontab
 
 CELERY_BEAT_SCHEDULE = {
-    # فحص انتهاكات SLA كل 5 دقائق
+    # فحص الاسترداد لمهل SLA كل 5 دقائق: يلتقط ما فات مؤقتات المهل ويسلّح المؤقتات القريبة
+    # (المخالفات تُكتشف عادة لحظة انتهاء المهلة عبر tickets.tasks.fire_sla_deadline)
     'check-sla-violations': {
         'task': 'tickets.tasks.check_sla_violations',
         'schedule': crontab(minute='*/5'),
@@ -205,6 +334,36 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'tickets.tasks.generate_performance_metrics',
         'schedule': crontab(minute=0, hour='*/6'),
     },
+    # كتابة آخر نشاط المستخدمين المتراكم في المخزن المؤقت
+    'flush-user-activity': {
+        'task': 'accounts.tasks.flush_user_activity',
+        'schedule': ACTIVITY_FLUSH_INTERVAL,
+    },
+    # إرسال البريد المستحق من صندوق البريد الصادر
+    'send-outbox-emails': {
+        'task': 'notifications.tasks.send_outbox_emails',
+        'schedule': 30.0,
+    },
+    # ملخصات الإشعارات بالبريد (كل ساعة / يومياً حسب تفضيل المستخدم)
+    'send-notification-digests': {
+        'task': 'notifications.tasks.send_notification_digests',
+        'schedule': crontab(minute=0),
+    },
+    # مطابقة عدّادات الإشعارات غير المقروءة مع الجدول
+    'reconcile-unread-counts': {
+        'task': 'notifications.tasks.reconcile_unread_counts',
+        'schedule': crontab(minute=30),
+    },
+    # أرشفة الإشعارات المقروءة القديمة يومياً في الساعة 3 فجراً
+    'prune-notifications': {
+        'task': 'notifications.tasks.prune_notifications',
+        'schedule': crontab(hour=3, minute=0),
+    },
+    # تحديث جدول الإحصائيات اليومية المجمّعة كل 10 دقائق
+    'update-daily-stats': {
+        'task': 'tickets.tasks.update_daily_stats',
+        'schedule': crontab(minute='*/10'),
+    },
 }
 
 # Auth Settings
@@ -237,6 +396,23 @@ CACHES = {
 #     }
 # }
 
+# Channels (WebSocket) - طبقة القنوات
+# ملاحظة: InMemoryChannelLayer تعمل داخل عملية واحدة فقط (للتطوير والاختبارات)
+# في الإنتاج استخدم Redis حتى تصل الرسائل من عمال Celery والعمليات الأخرى
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+    }
+}
+
+# لتفعيل Redis لاحقاً:
+# CHANNEL_LAYERS = {
+#     'default': {
+#         'BACKEND': 'channels_redis.core.RedisChannelLayer',
+#         'CONFIG': {'hosts': [('127.0.0.1', 6379)]},
+#     }
+# }
+
 # Session Configuration (use Redis for sessions too)
 SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
 SESSION_CACHE_ALIAS = 'default'